@@ -0,0 +1,204 @@
+# backend/app/admission.py
+"""
+Admission control for the heavy endpoints.
+
+Every expensive request takes a slot of its class before it starts any
+subprocess or remote call:
+
+    download     /download, each /batch item and the URL fetch of /generate-music (yt-dlp + merge)
+    transcode    local ffmpeg work: music variations, local /enhance-video
+    remote_gpu   calls to the Colab GPU (/enhance-video, /generate-music-prompt)
+
+    async with admission.admit("transcode"):
+        await profiling.run_in_threadpool(...)
+
+A class runs at most `slots` requests; the next `queue` wait in FIFO order
+for at most `max_wait` seconds. Anything beyond that -- a full queue, a wait
+that would clearly outlast the deadline, or a deadline that expires -- gets
+an immediate 503 with a Retry-After computed from the queue length and the
+class's recent hold times (EWMA). Light endpoints (/info, /jobs, proxies) are
+not admission controlled.
+"""
+import asyncio
+import collections
+import math
+import os
+import time
+from typing import Deque, Dict, Tuple
+
+from fastapi import APIRouter, Depends, HTTPException
+
+from . import metrics, profiling
+
+# ---------- CONFIG ----------
+_CORES = os.cpu_count() or 1
+# slots: concurrent requests, queue: waiting requests, max_wait: seconds,
+# service: initial guess of the hold time (s) until real samples come in
+ADMISSION_LIMITS: Dict[str, Dict[str, float]] = {
+    "download": {"slots": 8, "queue": 16, "max_wait": 30.0, "service": 20.0},
+    "transcode": {"slots": _CORES, "queue": 2 * _CORES, "max_wait": 60.0, "service": 30.0},
+    "remote_gpu": {"slots": 2, "queue": 4, "max_wait": 120.0, "service": 60.0},
+}
+SERVICE_EWMA_ALPHA = 0.2
+RETRY_AFTER_MIN = 1
+RETRY_AFTER_MAX = 300
+
+WAIT_SECONDS = metrics.Histogram(
+    "media_admission_wait_seconds", "Time admitted requests waited for a slot.", ("class",))
+REJECTIONS = metrics.Counter(
+    "media_admission_rejections_total", "Requests shed with 503, by class and reason.", ("class", "reason"))
+
+
+class Gate:
+    def __init__(self, name: str, slots: int, queue: int, max_wait: float, service: float):
+        self.name = name
+        self.slots = int(slots)
+        self.queue = int(queue)
+        self.max_wait = float(max_wait)
+        self.avg_service = float(service)
+        self.samples = 0
+        self.active = 0
+        self.waiters: Deque[asyncio.Future] = collections.deque()
+
+    def queued(self) -> int:
+        return sum(1 for w in self.waiters if not w.done())
+
+    def expected_wait(self, position: int) -> float:
+        """Seconds until the `position`-th waiter (1-based) would get a slot."""
+        return self.avg_service * position / self.slots
+
+    def retry_after(self) -> int:
+        wait = self.expected_wait(self.queued() + 1)
+        return int(min(RETRY_AFTER_MAX, max(RETRY_AFTER_MIN, math.ceil(wait))))
+
+    def _reject(self, reason: str):
+        REJECTIONS.inc(**{"class": self.name, "reason": reason})
+        raise HTTPException(status_code=503, detail=f"Server busy ({self.name}); try again later",
+                            headers={"Retry-After": str(self.retry_after())})
+
+    def check(self):
+        """Raise the 503 that acquire() would raise right now (without queueing)."""
+        if self.active < self.slots and not self.queued():
+            return
+        position = self.queued() + 1
+        if position > self.queue:
+            self._reject("queue_full")
+        if self.samples and self.expected_wait(position) > self.max_wait:
+            self._reject("overloaded")
+
+    def try_acquire(self) -> bool:
+        """Take a slot only if one is idle and nobody is queued; never queues or rejects."""
+        if self.active < self.slots and not self.queued():
+            self.active += 1
+            return True
+        return False
+
+    async def acquire(self):
+        if self.active < self.slots and not self.queued():
+            self.active += 1
+            return
+        self.check()
+
+        fut = asyncio.get_running_loop().create_future()
+        self.waiters.append(fut)
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), self.max_wait)
+        except asyncio.TimeoutError:
+            if fut.done() and not fut.cancelled():
+                return  # granted right at the deadline
+            fut.cancel()
+            self._reject("deadline")
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self.release()  # granted just as the client went away
+            else:
+                fut.cancel()
+            raise
+
+    def release(self, held: float = None):
+        self.active -= 1
+        if held is not None:
+            self.avg_service += SERVICE_EWMA_ALPHA * (held - self.avg_service)
+            self.samples += 1
+        while self.waiters and self.active < self.slots:
+            w = self.waiters.popleft()
+            if w.done():  # cancelled or timed out while queued
+                continue
+            self.active += 1
+            w.set_result(None)
+
+    def snapshot(self) -> Dict[str, float]:
+        return {
+            "active": self.active,
+            "queued": self.queued(),
+            "avg_service": round(self.avg_service, 2),
+            "retry_after": self.retry_after(),
+            "limits": {"slots": self.slots, "queue": self.queue, "max_wait": self.max_wait},
+        }
+
+
+GATES: Dict[str, Gate] = {name: Gate(name, **limits) for name, limits in ADMISSION_LIMITS.items()}
+
+
+class admit:
+    """
+    `async with admit(cls):` -- take a slot of the class or fail fast with 503 + Retry-After.
+    Work that outlives the request can `await acquire()` and call `release()` itself
+    (on the event loop thread). Background work that must yield to requests uses
+    `try_acquire()`, which only takes an idle slot.
+    """
+
+    def __init__(self, cls: str):
+        self.gate = GATES[cls]
+        self.t0 = 0.0
+
+    async def acquire(self) -> "admit":
+        t0 = time.perf_counter()
+        with profiling.span(f"admission:{self.gate.name}"):
+            await self.gate.acquire()
+        self.t0 = time.perf_counter()
+        WAIT_SECONDS.observe(self.t0 - t0, **{"class": self.gate.name})
+        return self
+
+    async def try_acquire(self) -> bool:
+        """An idle slot or False, without queueing (a coroutine so worker threads can run it on the loop)."""
+        if not self.gate.try_acquire():
+            return False
+        self.t0 = time.perf_counter()
+        return True
+
+    def release(self):
+        self.gate.release(time.perf_counter() - self.t0)
+
+    async def __aenter__(self):
+        return await self.acquire()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.release()
+        return False
+
+
+def check(cls: str):
+    """Fail fast before work that leads up to an admit(cls), e.g. downloading the input of a transcode."""
+    GATES[cls].check()
+
+
+def _collect_gates() -> Dict[Tuple[str, ...], float]:
+    out = {}
+    for name, gate in list(GATES.items()):
+        out[(name, "active")] = gate.active
+        out[(name, "queued")] = gate.queued()
+    return out
+
+
+metrics.Gauge("media_admission_slots", "Admission slots in use and requests waiting, per class.",
+              ("class", "state"), _collect_gates)
+
+
+# ---------- ADMIN ROUTES ----------
+router = APIRouter(prefix="/admin", dependencies=[Depends(profiling.require_admin)])
+
+
+@router.get("/admission")
+def admission_status():
+    return {name: gate.snapshot() for name, gate in GATES.items()}
@@ -0,0 +1,283 @@
+# backend/app/cookies.py
+"""
+Shared, load-cached cookie jar for yt-dlp.
+
+Passing `cookiesfrombrowser` to yt-dlp makes every YoutubeDL instance copy and
+decrypt the browser's cookie database, and a locked database used to cost a
+failed extraction plus a retry without cookies. Instead, COOKIES loads
+cookies.txt and the browser cookies once, merges them into one jar and hands
+each YoutubeDL a copy of it (`youtube_dl(opts)`); the yt-dlp CLI gets a copy
+of a Netscape snapshot of the same jar (`write_cookiefile`).
+
+Refresh: at most every REFRESH_CHECK_INTERVAL seconds the provider stats
+cookies.txt and the browser DB it found on the last load. A changed
+cookies.txt is reloaded right away; a changed browser DB (Chrome writes to it
+constantly) at most every BROWSER_MIN_RELOAD seconds. When the browser DB
+cannot be read, that is remembered for BROWSER_UNAVAILABLE_TTL seconds and
+requests go ahead with cookies.txt only.
+"""
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple
+
+from fastapi import APIRouter, Depends
+
+from . import metrics, profiling
+
+if TYPE_CHECKING:  # yt_dlp is imported on first use (see startup.py)
+    from yt_dlp import YoutubeDL
+    from yt_dlp.cookies import YoutubeDLCookieJar
+
+LOG = logging.getLogger("media_studio")
+
+# ---------- CONFIG ----------
+COOKIE_FILE = "cookies.txt"
+COOKIE_BROWSER: Optional[str] = "chrome"  # None disables browser cookies
+REFRESH_CHECK_INTERVAL = 5.0  # seconds between stat() checks
+BROWSER_MIN_RELOAD = 300.0  # a changed browser DB is re-read at most this often
+BROWSER_MAX_AGE = 3600.0  # re-read anyway when the DB location is unknown (non-Chromium browsers)
+BROWSER_UNAVAILABLE_TTL = 600.0  # how long a failed browser load is remembered
+COOKIE_SNAPSHOT_DIR = Path(tempfile.gettempdir()) / "fetch_helper_cache" / "cookies"
+
+_COOKIE_OPTS = ("cookiefile", "cookiesfrombrowser")
+
+COOKIE_LOAD_SECONDS = metrics.Histogram(
+    "media_cookie_load_duration_seconds", "Time to load cookies into the shared jar.", ("source", "outcome"))
+
+
+def _file_signature(path: Optional[str]) -> Optional[Tuple[int, int]]:
+    if not path:
+        return None
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def _find_browser_db(browser: str) -> Optional[str]:
+    """Path of the cookie DB yt-dlp would read (Chromium browsers only)."""
+    try:
+        from yt_dlp.cookies import (
+            CHROMIUM_BASED_BROWSERS, YDLLogger, _find_files, _get_chromium_based_browser_settings, _newest,
+        )
+        if browser not in CHROMIUM_BASED_BROWSERS:
+            return None
+        root = _get_chromium_based_browser_settings(browser)["browser_dir"]
+        return _newest(_find_files(root, "Cookies", YDLLogger()))
+    except Exception:
+        return None
+
+
+def _merge(*jars: Optional["YoutubeDLCookieJar"]) -> "YoutubeDLCookieJar":
+    from yt_dlp.cookies import YoutubeDLCookieJar
+    out = YoutubeDLCookieJar()
+    for jar in jars:
+        if jar is None:
+            continue
+        for cookie in jar:
+            out.set_cookie(cookie)
+    return out
+
+
+class CookieProvider:
+    def __init__(self, cookie_file: Optional[str] = COOKIE_FILE, browser: Optional[str] = COOKIE_BROWSER):
+        self.cookie_file = cookie_file
+        self.browser = browser
+        self._lock = threading.Lock()
+        self._jar: Optional["YoutubeDLCookieJar"] = None
+        self._generation = 0
+        self._checked_at = 0.0
+        self._snapshot: Optional[Tuple[int, str]] = None  # (generation, path)
+
+        self._file_jar: Optional["YoutubeDLCookieJar"] = None
+        self._file_sig: Optional[Tuple[int, int]] = None
+
+        self._browser_jar: Optional["YoutubeDLCookieJar"] = None
+        self._browser_db: Optional[str] = None
+        self._browser_sig: Optional[Tuple[int, int]] = None
+        self._browser_loaded_at = 0.0
+        self._browser_error: Optional[str] = None
+        self._browser_retry_at = 0.0
+
+        self._stats: Dict[str, Any] = {"loads": {"file": 0, "browser": 0}, "last_load_seconds": {}}
+
+    # ---- loading ----
+    def _load_file_locked(self, sig) -> bool:
+        if sig == self._file_sig and (self._file_jar is not None or sig is None):
+            return False
+        t0 = time.perf_counter()
+        outcome = "ok"
+        jar = None
+        if sig is not None:
+            try:
+                from yt_dlp.cookies import YoutubeDLCookieJar
+                jar = YoutubeDLCookieJar(self.cookie_file)
+                jar.load()
+            except Exception as e:
+                LOG.warning("Could not load %s: %s", self.cookie_file, e)
+                jar, outcome = None, "error"
+        self._file_jar, self._file_sig = jar, sig
+        self._record_load("file", time.perf_counter() - t0, outcome)
+        return True
+
+    def _browser_due_locked(self, now: float) -> bool:
+        if not self.browser:
+            return False
+        if self._browser_error is not None:
+            return now >= self._browser_retry_at
+        if self._browser_jar is None:
+            return True
+        age = now - self._browser_loaded_at
+        if self._browser_db is None:
+            return age >= BROWSER_MAX_AGE
+        return age >= BROWSER_MIN_RELOAD and _file_signature(self._browser_db) != self._browser_sig
+
+    def _load_browser_locked(self, now: float):
+        from yt_dlp.cookies import YDLLogger, extract_cookies_from_browser
+        t0 = time.perf_counter()
+        try:
+            jar = extract_cookies_from_browser(self.browser, logger=YDLLogger())
+        except Exception as e:
+            # a locked/missing DB: keep serving the previous browser cookies (if any) without retrying
+            self._browser_error = str(e) or type(e).__name__
+            self._browser_retry_at = now + BROWSER_UNAVAILABLE_TTL
+            LOG.warning("Browser cookies unavailable (%s); not retrying for %ss", self._browser_error,
+                        int(BROWSER_UNAVAILABLE_TTL))
+            self._record_load("browser", time.perf_counter() - t0, "error")
+            return
+        self._browser_jar = jar
+        self._browser_error = None
+        self._browser_loaded_at = now
+        self._browser_db = _find_browser_db(self.browser)
+        self._browser_sig = _file_signature(self._browser_db)
+        self._record_load("browser", time.perf_counter() - t0, "ok")
+
+    def _record_load(self, source: str, seconds: float, outcome: str):
+        COOKIE_LOAD_SECONDS.observe(seconds, source=source, outcome=outcome)
+        self._stats["loads"][source] += 1
+        self._stats["last_load_seconds"][source] = round(seconds, 4)
+
+    def jar(self, force: bool = False) -> "YoutubeDLCookieJar":
+        """The current merged jar (shared; do not modify). Reloads whatever changed."""
+        now = time.monotonic()
+        with self._lock:
+            if not force and self._jar is not None and now - self._checked_at < REFRESH_CHECK_INTERVAL:
+                return self._jar
+            self._checked_at = now
+            changed = self._load_file_locked(_file_signature(self.cookie_file))
+            if force and self.browser:
+                self._browser_error = None
+                self._browser_jar = None
+            if self._browser_due_locked(now):
+                self._load_browser_locked(now)
+                changed = True
+            if changed or self._jar is None:
+                # cookies.txt wins over the browser, as with yt-dlp's own merge order
+                self._jar = _merge(self._browser_jar, self._file_jar)
+                self._generation += 1
+            return self._jar
+
+    # ---- consumers ----
+    def youtube_dl(self, opts: dict) -> "YoutubeDL":
+        """YoutubeDL whose cookie jar is a private copy of the shared jar."""
+        from yt_dlp import YoutubeDL
+        opts = {k: v for k, v in opts.items() if k not in _COOKIE_OPTS}
+        with profiling.span("cookie_load"):
+            jar = _merge(self.jar())
+        ydl = YoutubeDL(opts)
+        ydl.cookiejar = jar  # replaces yt-dlp's lazily loaded (cached_property) jar
+        return ydl
+
+    def refill(self, target: "YoutubeDLCookieJar"):
+        """
+        Reset `target` to the shared cookies, in place. For long-lived YoutubeDL
+        instances (extract_pool), whose request handlers keep a reference to
+        the jar they were built with.
+        """
+        with profiling.span("cookie_load"):
+            src = self.jar()
+            target.clear()
+            for cookie in src:
+                target.set_cookie(cookie)
+
+    def write_cookiefile(self, dest: str) -> bool:
+        """
+        Copy a Netscape snapshot of the jar to `dest` for a yt-dlp subprocess
+        (`--cookies dest`; the CLI writes the file back on exit, so every call
+        gets its own copy). Returns False when there are no cookies.
+        """
+        jar = self.jar()
+        with self._lock:
+            if len(jar) == 0:
+                return False
+            generation = self._generation
+            if self._snapshot is None or self._snapshot[0] != generation or not os.path.exists(self._snapshot[1]):
+                COOKIE_SNAPSHOT_DIR.mkdir(parents=True, exist_ok=True)
+                path = COOKIE_SNAPSHOT_DIR / f"jar_{os.getpid()}_{generation}.txt"
+                tmp = path.with_suffix(".tmp")
+                jar.save(str(tmp), ignore_discard=True, ignore_expires=True)
+                os.replace(tmp, path)
+                if self._snapshot is not None:
+                    try:
+                        os.unlink(self._snapshot[1])
+                    except OSError:
+                        pass
+                self._snapshot = (generation, str(path))
+            snapshot = self._snapshot[1]
+        shutil.copyfile(snapshot, dest)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "cookie_file": self.cookie_file,
+                "cookie_file_present": self._file_sig is not None,
+                "file_cookies": len(self._file_jar) if self._file_jar is not None else 0,
+                "browser": self.browser,
+                "browser_db": self._browser_db,
+                "browser_cookies": len(self._browser_jar) if self._browser_jar is not None else 0,
+                "browser_available": self._browser_error is None and self._browser_jar is not None,
+                "browser_error": self._browser_error,
+                "browser_retry_in": (round(max(0.0, self._browser_retry_at - now), 1)
+                                     if self._browser_error is not None else None),
+                "browser_age": round(now - self._browser_loaded_at, 1) if self._browser_jar is not None else None,
+                "jar_cookies": len(self._jar) if self._jar is not None else 0,
+                "generation": self._generation,
+                "loads": dict(self._stats["loads"]),
+                "last_load_seconds": dict(self._stats["last_load_seconds"]),
+            }
+
+    def _collect(self) -> Dict[Tuple[str, ...], float]:
+        s = self.stats()
+        return {("file",): s["file_cookies"], ("browser",): s["browser_cookies"]}
+
+
+COOKIES = CookieProvider()
+metrics.Gauge("media_cookie_jar_cookies", "Cookies held in the shared jar, by source.", ("source",), COOKIES._collect)
+
+
+def youtube_dl(opts: dict) -> "YoutubeDL":
+    return COOKIES.youtube_dl(opts)
+
+
+# ---------- ADMIN ROUTES ----------
+router = APIRouter(prefix="/admin", dependencies=[Depends(profiling.require_admin)])
+
+
+@router.get("/cookies")
+def cookies_status():
+    return COOKIES.stats()
+
+
+@router.post("/cookies/reload")
+def reload_cookies():
+    """Re-read cookies.txt and retry the browser DB now (e.g. after closing Chrome)."""
+    COOKIES.jar(force=True)
+    return COOKIES.stats()
@@ -0,0 +1,293 @@
+# backend/app/extract_pool.py
+"""
+Long-lived extraction worker processes.
+
+Extraction is mostly Python (extractor regexes, JSON/JS parsing, format
+sorting), so parallel /info calls in one process serialize on the GIL, and
+every call also paid for a fresh YoutubeDL. Instead, `extract_info()` sends
+the job over a pipe to one of EXTRACT_WORKERS processes. Each worker keeps a
+YoutubeDL per distinct option set (extractor instances and their caches stay
+warm between jobs), refills its cookie jar from its own CookieProvider before
+each job, and returns the sanitized info dict.
+
+A worker retires after EXTRACT_WORKER_MAX_JOBS jobs or once its RSS has grown
+EXTRACT_WORKER_MAX_GROWTH_MB past its post-warm-up size; the pool starts a
+replacement straight away. A worker that dies or overruns EXTRACT_TIMEOUT is
+replaced too. A dead worker's job is retried in-process; a timeout is not.
+EXTRACT_WORKERS=0 disables the pool (in-process extraction, as before).
+"""
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import APIRouter, Depends
+
+from . import metrics, profiling
+
+LOG = logging.getLogger("media_studio")
+
+# ---------- CONFIG ----------
+EXTRACT_WORKERS = int(os.environ.get("FETCH_HELPER_EXTRACT_WORKERS", str(min(8, os.cpu_count() or 1))))
+EXTRACT_WORKER_MAX_JOBS = int(os.environ.get("FETCH_HELPER_EXTRACT_WORKER_JOBS", "500"))
+EXTRACT_WORKER_MAX_GROWTH_MB = 300
+EXTRACT_TIMEOUT = 180.0
+WORKER_START_TIMEOUT = 60.0
+WARM_OPTS = {"quiet": True, "no_warnings": True, "noplaylist": True, "force_ipv4": True}  # /info's options
+
+JOB_SECONDS = metrics.Histogram(
+    "media_extract_worker_job_seconds", "Extraction time inside a worker process (excludes queueing).", ("outcome",))
+RECYCLES = metrics.Counter(
+    "media_extract_worker_recycles_total", "Extraction workers replaced, by reason.", ("reason",))
+
+
+class ExtractionFailed(Exception):
+    """
+    The extractor raised in the worker; `kind` is the yt-dlp exception class name and `classes` the class names
+    of everything it wraps (url_precheck.error_classes), so class-based checks still work across the pipe.
+    """
+
+    def __init__(self, kind: str, message: str, classes: Tuple[str, ...] = ()):
+        super().__init__(message)
+        self.kind = kind
+        self.classes = tuple(classes)
+
+
+class ExtractWorkerError(RuntimeError):
+    """The worker process died or could not start."""
+
+
+# ---------- WORKER PROCESS ----------
+def _rss_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _error_payload(e: BaseException) -> Tuple[str, str, Tuple[str, ...]]:
+    """ExtractionFailed's arguments for `e`; the traceback itself does not cross the pipe."""
+    from .url_precheck import error_classes
+    return type(e).__name__, str(e), tuple(error_classes(e))
+
+
+def _worker_main(conn, max_jobs: int, max_growth: int):
+    from yt_dlp import YoutubeDL
+
+    from . import cookies
+
+    instances: Dict[str, Any] = {}
+
+    def ydl_for(opts: Dict[str, Any]):
+        key = repr(sorted(opts.items()))
+        ydl = instances.get(key)
+        if ydl is None:
+            ydl = instances[key] = YoutubeDL({k: v for k, v in opts.items() if k not in cookies._COOKIE_OPTS})
+        return ydl
+
+    try:
+        ydl_for(WARM_OPTS)  # loads the extractor classes
+        cookies.COOKIES.jar()
+        baseline = _rss_bytes()
+        conn.send(("ready", os.getpid(), None))
+    except Exception as e:
+        conn.send(("error", ("WorkerStartup", str(e)), "startup"))
+        return
+
+    jobs = 0
+    while True:
+        try:
+            opts, url, first_entry = conn.recv()
+        except (EOFError, OSError):
+            break
+        t0 = time.perf_counter()
+        try:
+            ydl = ydl_for(opts)
+            cookies.COOKIES.refill(ydl.cookiejar)
+            info = ydl.extract_info(url, download=False)
+            if first_entry and isinstance(info, dict) and info.get("entries"):
+                info = info["entries"][0]
+            reply = ("ok", YoutubeDL.sanitize_info(info))
+        except BaseException as e:  # noqa: B902 -- report everything, the loop must survive
+            reply = ("error", _error_payload(e))
+        jobs += 1
+        retire = None
+        rss = _rss_bytes()
+        if jobs >= max_jobs:
+            retire = "jobs"
+        elif rss and baseline and rss - baseline > max_growth:
+            retire = "memory"
+        conn.send((reply[0], reply[1], retire, time.perf_counter() - t0))
+        if retire:
+            break
+    for ydl in instances.values():
+        try:
+            ydl.close()
+        except Exception:
+            pass
+
+
+# ---------- POOL ----------
+class _Worker:
+    def __init__(self, ctx):
+        self.conn, child = ctx.Pipe()
+        self.proc = ctx.Process(target=_worker_main, name="extract-worker", daemon=True,
+                                args=(child, EXTRACT_WORKER_MAX_JOBS, EXTRACT_WORKER_MAX_GROWTH_MB * 1024 * 1024))
+        self.proc.start()
+        child.close()
+        self.ready = False
+        self.jobs = 0
+        self.started = time.monotonic()
+
+    def _wait_ready(self):
+        if not self.conn.poll(WORKER_START_TIMEOUT):
+            raise ExtractWorkerError("extraction worker did not start")
+        status, payload, _retire = self.conn.recv()
+        if status != "ready":
+            raise ExtractWorkerError(f"extraction worker failed to start: {payload[1]}")
+        self.ready = True
+
+    def call(self, opts: Dict[str, Any], url: str, first_entry: bool, timeout: float):
+        if not self.ready:
+            self._wait_ready()
+        self.conn.send((opts, url, first_entry))
+        if not self.conn.poll(timeout):
+            raise TimeoutError(f"extraction timed out after {timeout:.0f}s")
+        self.jobs += 1
+        return self.conn.recv()
+
+    def stop(self):
+        try:
+            self.conn.close()
+        except OSError:
+            pass
+        if self.proc.is_alive():
+            self.proc.terminate()
+        self.proc.join(timeout=5)
+        if self.proc.is_alive():
+            self.proc.kill()
+
+
+class ExtractPool:
+    def __init__(self, size: int):
+        self.size = size
+        self._ctx = multiprocessing.get_context("spawn")  # no fork of a threaded server
+        self._lock = threading.Lock()
+        self._workers: List[_Worker] = []
+        self._idle: "queue.Queue[_Worker]" = queue.Queue()
+        self._busy = 0
+
+    def start(self):
+        with self._lock:
+            if self._workers:
+                return
+            for _ in range(self.size):
+                self._spawn_locked()
+
+    def _spawn_locked(self):
+        w = _Worker(self._ctx)
+        self._workers.append(w)
+        self._idle.put(w)
+
+    def _retire(self, w: _Worker, reason: str):
+        RECYCLES.inc(reason=reason)
+        LOG.info("Recycling extraction worker %s after %d jobs (%s)", w.proc.pid, w.jobs, reason)
+        w.stop()
+        with self._lock:
+            if w in self._workers:  # else the pool was closed meanwhile
+                self._workers.remove(w)
+                self._spawn_locked()
+
+    def extract_info(self, opts: Dict[str, Any], url: str, first_entry: bool = False,
+                     timeout: float = EXTRACT_TIMEOUT) -> Dict[str, Any]:
+        """Blocking; raises ExtractionFailed, TimeoutError or ExtractWorkerError."""
+        self.start()
+        with profiling.span("extract_worker_wait"):
+            w = self._idle.get()
+        with self._lock:
+            self._busy += 1
+        try:
+            try:
+                status, payload, retire, seconds = w.call(opts, url, first_entry, timeout)
+            except TimeoutError:
+                self._retire(w, "timeout")
+                JOB_SECONDS.observe(timeout, outcome="timeout")
+                raise
+            except (EOFError, OSError, ExtractWorkerError) as e:
+                self._retire(w, "crash")
+                raise ExtractWorkerError(f"extraction worker failed: {e}") from e
+        finally:
+            with self._lock:
+                self._busy -= 1
+
+        JOB_SECONDS.observe(seconds, outcome=status)
+        if retire:
+            self._retire(w, retire)
+        else:
+            with self._lock:
+                if w in self._workers:
+                    self._idle.put(w)
+        if status != "ok":
+            raise ExtractionFailed(*payload)
+        return payload
+
+    def close(self):
+        """Stop all workers; the next extract_info() starts a fresh set."""
+        with self._lock:
+            workers, self._workers = self._workers, []
+            self._idle = queue.Queue()
+        for w in workers:
+            w.stop()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size": self.size,
+                "busy": self._busy,
+                "workers": [{"pid": w.proc.pid, "alive": w.proc.is_alive(), "ready": w.ready, "jobs": w.jobs,
+                             "age": round(time.monotonic() - w.started, 1)} for w in self._workers],
+            }
+
+    def _collect(self) -> Dict[Tuple[str, ...], float]:
+        with self._lock:
+            return {("busy",): self._busy, ("total",): len(self._workers)}
+
+
+POOL = ExtractPool(EXTRACT_WORKERS)
+metrics.Gauge("media_extract_workers", "Extraction worker processes.", ("state",), POOL._collect)
+
+
+def _extract_local(opts: Dict[str, Any], url: str, first_entry: bool) -> Dict[str, Any]:
+    from .cookies import youtube_dl
+    with youtube_dl(opts) as ydl:
+        info = ydl.extract_info(url, download=False)
+    if first_entry and isinstance(info, dict) and info.get("entries"):
+        return info["entries"][0]
+    return info
+
+
+def extract_info(opts: Dict[str, Any], url: str, first_entry: bool = False) -> Dict[str, Any]:
+    """
+    `ydl.extract_info(url, download=False)` in a worker process (in-process when the
+    pool is disabled or the worker died). `first_entry` returns a playlist's first item.
+    """
+    if EXTRACT_WORKERS <= 0:
+        return _extract_local(opts, url, first_entry)
+    try:
+        return POOL.extract_info(opts, url, first_entry)
+    except ExtractWorkerError as e:
+        LOG.warning("%s; extracting in-process", e)
+        return _extract_local(opts, url, first_entry)
+
+
+# ---------- ADMIN ROUTES ----------
+router = APIRouter(prefix="/admin", dependencies=[Depends(profiling.require_admin)])
+
+
+@router.get("/extract-workers")
+def extract_workers_status():
+    return POOL.stats()
@@ -0,0 +1,355 @@
+# backend/app/fingerprint.py
+"""
+Acoustic fingerprint index: recognise a track that was already processed even
+when it arrives as different bytes (a re-upload, a TikTok sound, a file).
+
+Fingerprints follow the Haitsma-Kalker scheme: the first FP_SECONDS of audio
+are decoded to mono PCM at FP_SAMPLE_RATE, cut into FP_FRAME-sample frames
+every FP_HOP samples, and each frame yields one 32-bit sub-fingerprint whose
+bits are the signs of the time/frequency differences of the energies in 33
+log-spaced bands (300-2000 Hz). They survive re-encoding, gain changes,
+noise and a shifted start, and cost ~4 bytes per 23 ms.
+
+The index is a sqlite file (FP_DB):
+
+    tracks   digest of the first input seen for the track + its fingerprint
+    hashes   sub-fingerprint -> (track, position), for candidate lookup
+    aliases  source URL -> track, so a known URL needs no download at all
+
+`match()` looks up the query's exact sub-fingerprints, votes on (track,
+offset), then verifies the best candidates by bit error rate over the
+aligned frames; below FP_MAX_BER is a match -- but only when the blocks of
+FP_BLOCK aligned frames that are below FP_MAX_BER on their own cover
+FP_MIN_COVERAGE of the query and the two durations agree within
+FP_DURATION_TOLERANCE, so an excerpt, a remix or a medley that shares a
+stretch of audio keeps its own digest. A URL alias is reused the same way
+only while the new input's duration agrees with the track's.
+benchmarks/bench_fingerprint.py measures the hit and false-positive rates on
+a test corpus.
+
+Needs NumPy (a requirement); if it is missing anyway -- a degraded mode, logged
+once -- or with FETCH_HELPER_FINGERPRINT=0 every input is simply its own track.
+"""
+import collections
+import logging
+import os
+import sqlite3
+import subprocess
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import APIRouter, Depends
+
+from . import metrics, profiling
+from .registry import register_process
+
+LOG = logging.getLogger("media_studio")
+
+# ---------- CONFIG ----------
+FP_ENABLED = os.environ.get("FETCH_HELPER_FINGERPRINT", "1") == "1"
+FP_DB = Path(os.environ.get("FETCH_HELPER_FINGERPRINT_DB",
+                            str(Path(tempfile.gettempdir()) / "fetch_helper_cache" / "fingerprints.sqlite3")))
+FP_SAMPLE_RATE = 5512
+FP_SECONDS = 120
+FP_FRAME = 2048  # 0.37 s
+FP_HOP = 128  # 23 ms
+FP_BANDS = 33
+FP_FMIN, FP_FMAX = 300.0, 2000.0
+FP_MIN_OVERLAP = 256  # aligned frames needed to judge a candidate (~6 s)
+FP_MAX_BER = 0.35  # bit error rate below which two fingerprints are the same recording
+FP_MIN_COVERAGE = 0.8  # share of the query's frames that must match the track
+FP_BLOCK = 64  # frames (~1.5 s) per coverage block
+FP_DURATION_TOLERANCE = (3.0, 0.02)  # durations agree within max(seconds, fraction of the longer one)
+FP_ALIAS_TTL = 7 * 86400.0  # adopt_input trusts a URL alias (unverifiable before the download) this long
+FP_CANDIDATES = 5
+FP_MAX_HASH_ROWS = 200  # sub-fingerprints this common (silence, ...) do not vote
+
+LOOKUPS = metrics.Counter(
+    "media_fingerprint_lookups_total", "Fingerprint lookups of music inputs by result.", ("result",))
+
+_NUMPY = []  # [module or None] once probed
+
+
+def _numpy():
+    if not _NUMPY:
+        try:
+            import numpy
+        except ImportError:
+            LOG.warning("NumPy is not installed; fingerprinting is disabled")
+            numpy = None
+        _NUMPY.append(numpy)
+    return _NUMPY[0]
+
+
+def available() -> bool:
+    return FP_ENABLED and _numpy() is not None
+
+
+# ---------- FINGERPRINTS ----------
+def fingerprint_pcm(pcm) -> Any:
+    """uint32 sub-fingerprints of mono float PCM at FP_SAMPLE_RATE (NumPy array)."""
+    np = _numpy()
+    pcm = np.asarray(pcm, dtype=np.float32)
+    if len(pcm) < FP_FRAME + FP_HOP:
+        return np.zeros(0, dtype=np.uint32)
+    frames = np.lib.stride_tricks.sliding_window_view(pcm, FP_FRAME)[::FP_HOP]
+    window = np.hanning(FP_FRAME).astype(np.float32)
+    edges = np.round(np.geomspace(FP_FMIN, FP_FMAX, FP_BANDS + 1) * FP_FRAME / FP_SAMPLE_RATE).astype(int)
+    energy = np.empty((len(frames), FP_BANDS))
+    for i in range(0, len(frames), 256):  # bounded memory for the FFT
+        spectrum = np.abs(np.fft.rfft(frames[i:i + 256] * window, axis=1)[:, :edges[-1]]) ** 2
+        energy[i:i + 256] = np.add.reduceat(spectrum, edges[:-1], axis=1)
+    diff = energy[:, :-1] - energy[:, 1:]  # (frames, 32)
+    bits = (diff[1:] - diff[:-1]) > 0
+    return (bits.astype(np.uint64) << np.arange(32, dtype=np.uint64)).sum(axis=1).astype(np.uint32)
+
+
+def fingerprint_file(path: str, job_id: Optional[str] = None) -> Any:
+    """Blocking: decode the first FP_SECONDS of `path` with ffmpeg and fingerprint it."""
+    np = _numpy()
+    cmd = ["ffmpeg", "-v", "error", "-i", path, "-t", str(FP_SECONDS), "-ac", "1", "-ar", str(FP_SAMPLE_RATE),
+           "-f", "s16le", "-"]
+    p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if job_id:
+        register_process(job_id, p)
+    raw, stderr = p.communicate()
+    if p.returncode != 0:
+        raise RuntimeError(f"ffmpeg decode failed: {stderr.decode(errors='ignore')[-500:]}")
+    pcm = np.frombuffer(raw[:len(raw) // 2 * 2], dtype="<i2").astype(np.float32) / 32768.0
+    return fingerprint_pcm(pcm)
+
+
+def probe_duration(path: str, job_id: Optional[str] = None) -> Optional[float]:
+    """Blocking: container duration of `path` in seconds (ffprobe), None if unknown."""
+    cmd = ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "default=nw=1:nk=1", path]
+    p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if job_id:
+        register_process(job_id, p)
+    out, _stderr = p.communicate()
+    try:
+        duration = float(out.decode(errors="ignore").strip())
+    except ValueError:
+        return None
+    return duration if p.returncode == 0 and duration > 0 else None
+
+
+def durations_agree(a: Optional[float], b: Optional[float]) -> bool:
+    """Both known and within FP_DURATION_TOLERANCE; an unknown duration never agrees."""
+    if not a or not b:
+        return False
+    seconds, fraction = FP_DURATION_TOLERANCE
+    return abs(a - b) <= max(seconds, fraction * max(a, b))
+
+
+def bit_error_rate(a, b, offset: int) -> Tuple[float, int]:
+    """BER of `b` aligned so that b[i] matches a[i + offset]; returns (ber, frames compared)."""
+    np = _numpy()
+    start_a, start_b = max(0, offset), max(0, -offset)
+    n = min(len(a) - start_a, len(b) - start_b)
+    if n <= 0:
+        return 1.0, 0
+    x = np.bitwise_xor(a[start_a:start_a + n], b[start_b:start_b + n])
+    return float(np.unpackbits(x.view(np.uint8)).sum()) / (32 * n), n
+
+
+def matched_frames(a, b, offset: int) -> int:
+    """Frames of `b` (aligned as in bit_error_rate) in FP_BLOCK-frame blocks whose own BER is below FP_MAX_BER."""
+    np = _numpy()
+    start_a, start_b = max(0, offset), max(0, -offset)
+    n = min(len(a) - start_a, len(b) - start_b)
+    if n <= 0:
+        return 0
+    x = np.bitwise_xor(a[start_a:start_a + n], b[start_b:start_b + n])
+    errors = np.unpackbits(x.view(np.uint8)).reshape(n, 32).sum(axis=1)
+    matched = 0
+    for i in range(0, n, FP_BLOCK):
+        block = errors[i:i + FP_BLOCK]
+        if block.sum() < FP_MAX_BER * 32 * len(block):
+            matched += len(block)
+    return matched
+
+
+# ---------- INDEX ----------
+class FingerprintIndex:
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+
+    def _conn(self) -> sqlite3.Connection:
+        if self._db is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            db = sqlite3.connect(str(self.path), check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript("""
+                CREATE TABLE IF NOT EXISTS tracks (
+                    id INTEGER PRIMARY KEY, digest TEXT UNIQUE NOT NULL, frames INTEGER NOT NULL,
+                    fp BLOB NOT NULL, created REAL NOT NULL, duration REAL);
+                CREATE TABLE IF NOT EXISTS hashes (
+                    hash INTEGER NOT NULL, track_id INTEGER NOT NULL, pos INTEGER NOT NULL,
+                    PRIMARY KEY (hash, track_id, pos)) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS aliases (
+                    url TEXT PRIMARY KEY, track_id INTEGER NOT NULL, created REAL NOT NULL);
+            """)
+            if "duration" not in [row[1] for row in db.execute("PRAGMA table_info(tracks)")]:
+                db.execute("ALTER TABLE tracks ADD COLUMN duration REAL")  # index from before durations
+            self._db = db
+        return self._db
+
+    def add(self, digest: str, fp, duration: Optional[float] = None) -> int:
+        with self._lock:
+            db = self._conn()
+            with db:
+                cur = db.execute("INSERT OR IGNORE INTO tracks (digest, frames, fp, created, duration) "
+                                 "VALUES (?, ?, ?, ?, ?)",
+                                 (digest, len(fp), fp.astype("<u4").tobytes(), time.time(), duration))
+                if not cur.rowcount:
+                    return db.execute("SELECT id FROM tracks WHERE digest = ?", (digest,)).fetchone()[0]
+                track_id = cur.lastrowid
+                db.executemany("INSERT OR IGNORE INTO hashes (hash, track_id, pos) VALUES (?, ?, ?)",
+                               ((h, track_id, pos) for pos, h in enumerate(fp.tolist())))
+            return track_id
+
+    def match(self, fp, duration: Optional[float]) -> Optional[Tuple[str, float]]:
+        """(digest, ber) of the indexed track `fp` (of an input `duration` s long) is a recording of, or None."""
+        np = _numpy()
+        if len(fp) < FP_MIN_OVERLAP:
+            return None
+        min_overlap = max(FP_MIN_OVERLAP, FP_MIN_COVERAGE * len(fp))
+        positions: Dict[int, List[int]] = collections.defaultdict(list)
+        for pos, h in enumerate(fp.tolist()):
+            if h not in (0, 0xFFFFFFFF):
+                positions[h].append(pos)
+        votes: collections.Counter = collections.Counter()
+        keys = list(positions)
+        with self._lock:
+            db = self._conn()
+            for i in range(0, len(keys), 500):
+                batch = keys[i:i + 500]
+                marks = ",".join("?" * len(batch))
+                rows = db.execute(f"SELECT hash, track_id, pos FROM hashes WHERE hash IN ({marks})", batch).fetchall()
+                per_hash = collections.Counter(h for h, _t, _p in rows)
+                for h, track_id, pos in rows:
+                    if per_hash[h] > FP_MAX_HASH_ROWS:
+                        continue
+                    for qpos in positions[h]:
+                        votes[(track_id, pos - qpos)] += 1
+            best: Optional[Tuple[str, float]] = None
+            seen = set()
+            for (track_id, offset), _n in votes.most_common(4 * FP_CANDIDATES):
+                if track_id in seen:
+                    continue
+                seen.add(track_id)
+                if len(seen) > FP_CANDIDATES:
+                    break
+                digest, blob, ref_duration = db.execute(
+                    "SELECT digest, fp, duration FROM tracks WHERE id = ?", (track_id,)).fetchone()
+                if not durations_agree(duration, ref_duration):
+                    continue
+                ref = np.frombuffer(blob, dtype="<u4")
+                for off in (offset - 1, offset, offset + 1):
+                    ber, n = bit_error_rate(ref, fp, off)
+                    if n >= min_overlap and ber < FP_MAX_BER and (best is None or ber < best[1]) \
+                            and matched_frames(ref, fp, off) >= min_overlap:
+                        best = (digest, ber)
+        return best
+
+    def alias(self, url: str, digest: str):
+        with self._lock:
+            db = self._conn()
+            with db:
+                db.execute("INSERT OR REPLACE INTO aliases (url, track_id, created) "
+                           "SELECT ?, id, ? FROM tracks WHERE digest = ?", (url, time.time(), digest))
+
+    def lookup_url(self, url: str) -> Optional[Tuple[str, Optional[float], float]]:
+        """(digest, duration, alias created) of the track `url` was aliased to."""
+        with self._lock:
+            row = self._conn().execute(
+                "SELECT t.digest, t.duration, a.created FROM aliases a JOIN tracks t ON t.id = a.track_id "
+                "WHERE a.url = ?", (url,)).fetchone()
+        return tuple(row) if row else None
+
+    def known(self, digest: str) -> bool:
+        with self._lock:
+            return self._conn().execute("SELECT 1 FROM tracks WHERE digest = ?", (digest,)).fetchone() is not None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            db = self._conn()
+            return {
+                "tracks": db.execute("SELECT COUNT(*) FROM tracks").fetchone()[0],
+                "aliases": db.execute("SELECT COUNT(*) FROM aliases").fetchone()[0],
+                "path": str(self.path),
+            }
+
+
+INDEX = FingerprintIndex(FP_DB)
+
+
+# ---------- ENTRY POINTS ----------
+def lookup_url(url: str) -> Optional[str]:
+    """
+    Digest of the track `url` was resolved to within FP_ALIAS_TTL, if any. It
+    cannot be checked against the input before downloading it, so an alias of
+    a track without a recorded duration (indexed before durations were) is
+    not used.
+    """
+    if not available():
+        return None
+    try:
+        row = INDEX.lookup_url(url)
+    except sqlite3.Error as e:
+        LOG.warning("fingerprint index: %s", e)
+        return None
+    if not row or not row[1] or time.time() - row[2] > FP_ALIAS_TTL:
+        return None
+    return row[0]
+
+
+def canonical_digest(path: str, digest: str, url: Optional[str] = None, job_id: Optional[str] = None) -> str:
+    """
+    Blocking: the digest under which `path` (content digest `digest`) is
+    indexed -- that of an earlier input of the same recording (or of what
+    `url` resolved to before) if there is one, else `digest` itself (which is
+    then added). Records `url` as an alias.
+    """
+    if not available():
+        return digest
+    try:
+        with profiling.span("fingerprint"):
+            aliased = INDEX.lookup_url(url) if url else None
+            duration = probe_duration(path, job_id) if aliased or not INDEX.known(digest) else None
+            if aliased and not durations_agree(duration, aliased[1]):
+                LOG.info("music input %s: %s no longer matches track %s in duration", digest[:12], url[:80],
+                         aliased[0][:12])
+                aliased = None
+            if aliased or INDEX.known(digest):
+                result, canonical = "known", aliased[0] if aliased else digest
+            else:
+                fp = fingerprint_file(path, job_id)
+                hit = INDEX.match(fp, duration)
+                if hit:
+                    result, canonical = "match", hit[0]
+                    LOG.info("music input %s matches track %s (BER %.3f)", digest[:12], canonical[:12], hit[1])
+                else:
+                    result, canonical = "new", digest
+                    INDEX.add(digest, fp, duration)
+            if url:
+                INDEX.alias(url, canonical)
+    except (RuntimeError, sqlite3.Error) as e:
+        LOG.warning("fingerprinting %s failed: %s", path, e)
+        result, canonical = "error", digest
+    LOOKUPS.inc(result=result)
+    return canonical
+
+
+# ---------- ADMIN ROUTES ----------
+router = APIRouter(prefix="/admin", dependencies=[Depends(profiling.require_admin)])
+
+
+@router.get("/fingerprints")
+def fingerprints_status():
+    return {"enabled": available(), **(INDEX.stats() if available() else {})}
@@ -0,0 +1,264 @@
+# backend/app/format_policy.py
+"""
+Server-cost-aware format selection for /download.
+
+`select_formats` (utils.py) picks the height closest to the preference and the
+highest-abr audio, which often means a VP9 + Opus pair that has to be fetched
+twice and merged. `choose()` scores every combined format and every
+video-only + audio-only pair instead, adding up:
+
+  quality    distance from the preferred height (worse below than above)
+  merge      a second download plus an ffmpeg mux
+  codec      codecs that do not remux cleanly into the MP4 we hand out
+  bytes      estimated size (filesize, filesize_approx or tbr * duration),
+             only when the caller has a byte budget
+  unknown    no size estimate at all
+  protocol   fragmented HLS/DASH downloads
+
+and a candidate over the byte budget only wins if nothing fits it. Without a
+budget the size only breaks ties between equally good candidates, so a long
+video is never downgraded below the preferred height for its size. The plan
+carries the cost breakdown and a one-line reason for the winner and the
+runners-up, which /download stores on the job record.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+
+# ---------- CONFIG ----------
+MP4_VIDEO_CODECS = ("avc1", "h264", "hev1", "hvc1", "h265", "av01")
+MP4_AUDIO_CODECS = ("mp4a", "aac", "mp3")
+FRAGMENTED_PROTOCOLS = ("m3u8", "m3u8_native", "http_dash_segments", "dash")
+
+W_BELOW = 12.0  # per "fraction of preferred height" missing
+W_ABOVE = 3.0  # per fraction above (only costs bytes; bytes are counted separately)
+MERGE_COST = 2.0
+VIDEO_CODEC_COST = 3.0
+AUDIO_CODEC_COST = 1.0
+BYTES_COST_PER_MB = 0.005  # with max_bytes only
+UNKNOWN_SIZE_COST = 1.0
+FRAGMENTED_COST = 0.5
+AUDIO_TARGET_ABR = 128  # kbps; higher bitrates only add bytes for most listeners
+EXPLAIN_TOP = 5
+
+
+def _codec(value: Optional[str]) -> str:
+    """'avc1.64001F' -> 'avc1'; a missing codec (direct links) is 'unknown', not 'none'."""
+    if value is None:
+        return "unknown"
+    return (value or "none").split(".")[0].lower()
+
+
+def _mp4_friendly(f: Dict[str, Any], field: str, codecs: Tuple[str, ...]) -> bool:
+    codec = _codec(f.get(field))
+    if codec == "unknown":
+        return f.get("ext") in ("mp4", "m4v", "m4a")
+    return codec in codecs
+
+
+def is_video_only(f: Dict[str, Any]) -> bool:
+    return _codec(f.get("vcodec")) != "none" and _codec(f.get("acodec")) == "none"
+
+
+def is_audio_only(f: Dict[str, Any]) -> bool:
+    return _codec(f.get("acodec")) != "none" and _codec(f.get("vcodec")) == "none"
+
+
+def is_combined(f: Dict[str, Any]) -> bool:
+    return _codec(f.get("acodec")) != "none" and _codec(f.get("vcodec")) != "none"
+
+
+def estimate_bytes(f: Dict[str, Any], duration: Optional[float]) -> Optional[int]:
+    size = f.get("filesize") or f.get("filesize_approx")
+    if size:
+        return int(size)
+    tbr = f.get("tbr") or ((f.get("vbr") or 0) + (f.get("abr") or 0)) or None
+    if tbr and duration:
+        return int(tbr * 1000 / 8 * duration)
+    return None
+
+
+def _usable(f: Dict[str, Any]) -> bool:
+    return not f.get("has_drm") and (f.get("url") or f.get("format_id")) is not None
+
+
+def _describe(f: Dict[str, Any]) -> str:
+    parts = [str(f.get("format_id"))]
+    if f.get("height"):
+        parts.append(f"{f['height']}p")
+    codecs = "/".join(c for c in (_codec(f.get("vcodec")), _codec(f.get("acodec"))) if c != "none")
+    if codecs:
+        parts.append(codecs)
+    return " ".join(parts)
+
+
+def _score(video: Dict[str, Any], audio: Optional[Dict[str, Any]], preferred: int, duration: Optional[float],
+           max_bytes: Optional[int]) -> Dict[str, Any]:
+    cost: Dict[str, float] = {}
+    height = video.get("height") or 0
+    if preferred and height:
+        if height < preferred:
+            cost["quality"] = W_BELOW * (preferred - height) / preferred
+        elif height > preferred:
+            cost["quality"] = W_ABOVE * (height - preferred) / preferred
+    elif not height:
+        cost["quality"] = W_BELOW * 0.25  # unknown height: assume a bit worse than asked
+
+    parts = [video] + ([audio] if audio else [])
+    if audio is not None:
+        cost["merge"] = MERGE_COST
+    if not _mp4_friendly(video, "vcodec", MP4_VIDEO_CODECS):
+        cost["codec"] = VIDEO_CODEC_COST
+    if not _mp4_friendly(audio or video, "acodec", MP4_AUDIO_CODECS):
+        cost["codec"] = cost.get("codec", 0.0) + AUDIO_CODEC_COST
+
+    sizes = [estimate_bytes(f, duration) for f in parts]
+    est = sum(s for s in sizes if s) if all(sizes) else None
+    if est is None:
+        cost["unknown_size"] = UNKNOWN_SIZE_COST
+    elif max_bytes:
+        cost["bytes"] = BYTES_COST_PER_MB * est / 1e6
+    if any((f.get("protocol") or "") in FRAGMENTED_PROTOCOLS for f in parts):
+        cost["protocol"] = FRAGMENTED_COST
+
+    over_budget = bool(max_bytes and est and est > max_bytes)
+    return {
+        "video": video,
+        "audio": audio,
+        "estimated_bytes": est,
+        "over_budget": over_budget,
+        "cost": {k: round(v, 3) for k, v in cost.items()},
+        "total": round(sum(cost.values()), 3),
+        "label": f"{_describe(video)}" + (f" + {_describe(audio)}" if audio else " (combined)"),
+    }
+
+
+def _reason(c: Dict[str, Any]) -> str:
+    est = c["estimated_bytes"]
+    size = f"~{est / 1e6:.1f} MB" if est else "size unknown"
+    breakdown = ", ".join(f"{k} {v}" for k, v in sorted(c["cost"].items(), key=lambda kv: -kv[1])) or "no cost"
+    budget = "; over budget" if c["over_budget"] else ""
+    return f"{c['label']}: {size}; cost {c['total']} ({breakdown}){budget}"
+
+
+def choose(formats: List[Dict[str, Any]], preferred_resolution: int = 1080, duration: Optional[float] = None,
+           max_bytes: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    """
+    Pick the cheapest acceptable video download.
+
+    Returns:
+        {"video": fmt, "audio": fmt | None (None = combined format), "estimated_bytes", "cost",
+         "explain": [reason for the winner, then runners-up]} or None if nothing is downloadable.
+    """
+    formats = [f for f in formats if _usable(f)]
+    combined = [f for f in formats if is_combined(f)]
+    videos = [f for f in formats if is_video_only(f)]
+    audios = [f for f in formats if is_audio_only(f)]
+
+    candidates = [_score(f, None, preferred_resolution, duration, max_bytes) for f in combined]
+    candidates += [_score(v, a, preferred_resolution, duration, max_bytes) for v in videos for a in audios]
+    if not candidates and videos:
+        # video-only sources (no audio track anywhere)
+        candidates = [_score(v, None, preferred_resolution, duration, max_bytes) for v in videos]
+    if not candidates:
+        return None
+
+    # smaller first among equal costs (the only say bytes have without a budget)
+    ranked = sorted(candidates, key=lambda c: (c["over_budget"], c["total"], c["estimated_bytes"] or float("inf")))
+    best = ranked[0]
+    return {
+        "video": best["video"],
+        "audio": best["audio"],
+        "estimated_bytes": best["estimated_bytes"],
+        "cost": best["cost"],
+        "explain": [_reason(c) for c in ranked[:EXPLAIN_TOP]],
+    }
+
+
+def choose_audio(formats: List[Dict[str, Any]], duration: Optional[float] = None,
+                 target_abr: int = AUDIO_TARGET_ABR, targets: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+    """
+    Smallest audio-only format at or above `target_abr` (else the best below it),
+    preferring codecs that can be stream-copied into one of `targets` (see
+    audio_targets), then AAC; falls back to the smallest combined format.
+    """
+    targets = targets or ["mp3"]
+    formats = [f for f in formats if _usable(f)]
+    audios = [f for f in formats if is_audio_only(f)]
+    pool = audios or [f for f in formats if is_combined(f)]
+    if not pool:
+        return None
+
+    def key(f) -> Tuple:
+        abr = f.get("abr") or f.get("tbr") or 0
+        enough = abr >= target_abr
+        est = estimate_bytes(f, duration)
+        return (
+            not enough,
+            passthrough_target(audio_codec(f), targets) is None,
+            not _mp4_friendly(f, "acodec", MP4_AUDIO_CODECS),
+            (est or float("inf")) if enough else -abr,
+        )
+
+    ranked = sorted(pool, key=key)
+    best = ranked[0]
+    reasons = []
+    for f in ranked[:EXPLAIN_TOP]:
+        est = estimate_bytes(f, duration)
+        size = f"~{est / 1e6:.1f} MB" if est else "size unknown"
+        kind = "audio-only" if is_audio_only(f) else "combined (video discarded)"
+        reasons.append(f"{_describe(f)} {kind}, {f.get('abr') or f.get('tbr') or '?'} kbps, {size}")
+    return {"audio": best, "estimated_bytes": estimate_bytes(best, duration), "explain": reasons}
+
+
+# ---------- AUDIO OUTPUT NEGOTIATION ----------
+# client token -> output target; targets map to (codecs that can be copied in, ext, media type)
+AUDIO_TOKENS = {
+    "m4a": "m4a", "aac": "m4a", "audio/mp4": "m4a", "audio/aac": "m4a", "audio/x-m4a": "m4a",
+    "opus": "opus", "audio/opus": "opus", "ogg": "ogg", "audio/ogg": "ogg",
+    "webm": "webm", "audio/webm": "webm",
+    "mp3": "mp3", "audio/mpeg": "mp3", "audio/mp3": "mp3",
+}
+AUDIO_TARGETS = {
+    "m4a": (("mp4a", "aac"), "m4a", "audio/mp4"),
+    "opus": (("opus",), "opus", "audio/ogg"),
+    "ogg": (("opus", "vorbis"), "ogg", "audio/ogg"),
+    "webm": (("opus", "vorbis"), "webm", "audio/webm"),
+    "mp3": (("mp3",), "mp3", "audio/mpeg"),
+}
+_EXT_CODECS = {"m4a": "mp4a", "mp3": "mp3", "opus": "opus", "ogg": "vorbis"}
+
+
+def audio_targets(requested: Optional[List[str]] = None, accept: Optional[str] = None) -> List[str]:
+    """
+    Output targets the client takes, best first. An explicit `audio_formats` list wins;
+    otherwise explicit audio types in the Accept header (q-values ignored, order kept).
+    MP3 is always the last resort, and the only target when nothing was negotiated.
+    """
+    tokens: List[str] = []
+    if requested:
+        tokens = [t.strip().lower() for t in requested]
+    elif accept:
+        tokens = [part.split(";")[0].strip().lower() for part in accept.split(",")]
+    out: List[str] = []
+    for t in tokens:
+        target = AUDIO_TOKENS.get(t)
+        if target and target not in out:
+            out.append(target)
+    if "mp3" not in out:
+        out.append("mp3")
+    return out
+
+
+def audio_codec(f: Dict[str, Any]) -> str:
+    codec = _codec(f.get("acodec"))
+    if codec == "unknown":
+        return _EXT_CODECS.get(f.get("ext") or "", "unknown")
+    return "mp4a" if codec == "aac" else codec
+
+
+def passthrough_target(codec: str, targets: List[str]) -> Optional[Tuple[str, str]]:
+    """(ext, media_type) of the first accepted target the codec can be stream-copied into."""
+    for t in targets:
+        codecs, ext, media_type = AUDIO_TARGETS[t]
+        if codec in codecs:
+            return ext, media_type
+    return None
@@ -0,0 +1,186 @@
+# backend/app/hls_enhance.py
+"""
+Streaming output for the local /enhance-video encoder.
+
+With `stream=true`, /enhance-video answers right away with a playlist URL
+instead of the finished MP4. One ffmpeg run applies the usual
+LOCAL_ENHANCE_FILTER / encoder and writes HLS with fMP4 segments of
+LOCAL_ENHANCE_HLS_SEGMENT_SECONDS (keyframes forced on the boundaries) into
+the job's directory. The EVENT playlist grows as segments complete, so a
+player (hls.js, Safari, ...) starts after the first segment while the rest
+is still encoding; ffmpeg writes segments under a temp name, so a listed
+segment is always complete.
+
+When the encode finishes, the MP4 download is the init segment followed by
+every media segment, byte for byte: a fragmented MP4 of the same frames, with
+no second encode or remux. It goes into result_cache under
+`local_enhance_hls_recipe()`. Jobs are forgotten (and their files removed)
+HLS_JOB_TTL after they finish.
+"""
+import asyncio
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from . import admission, result_cache
+from .presets import LOCAL_ENHANCE_ENCODER_ARGS, LOCAL_ENHANCE_FILTER, LOCAL_ENHANCE_HLS_SEGMENT_SECONDS
+from .progress import job_stage, run_ffmpeg
+from .registry import cleanup_registry, register_tmpfile
+
+LOG = logging.getLogger("media_studio")
+
+# ---------- CONFIG ----------
+HLS_PLAYLIST = "index.m3u8"
+HLS_INIT = "init.mp4"
+HLS_SEGMENT_PATTERN = "seg_%05d.m4s"
+HLS_JOB_TTL = 3600.0
+HLS_PLAYLIST_WAIT = 60.0  # longest a playlist request waits for the first segment
+HLS_POLL = 0.2
+
+MEDIA_TYPES = {".m3u8": "application/vnd.apple.mpegurl", ".mp4": "video/mp4", ".m4s": "video/iso.segment"}
+_NAME_RE = re.compile(r"^(index\.m3u8|init\.mp4|seg_\d{5}\.m4s)$")
+
+
+class _Encode:
+    def __init__(self, job_id: str, input_path: Optional[Path], output_path: Path, filename: str):
+        self.job_id = job_id
+        self.input_path = input_path
+        self.output_path = output_path
+        self.filename = filename
+        self.workdir = output_path.with_name(f"{job_id}_hls")
+        self.state = "running"  # -> done | failed
+        self.error: Optional[str] = None
+        self.finished = 0.0
+
+    def finish(self, state: str, error: Optional[str] = None):
+        with _LOCK:
+            self.state, self.error, self.finished = state, error, time.monotonic()
+
+
+_ENCODES: Dict[str, _Encode] = {}
+_LOCK = threading.Lock()
+
+
+def _prune_locked(now: float) -> List[str]:
+    expired = [e.job_id for e in _ENCODES.values() if e.finished and now - e.finished > HLS_JOB_TTL]
+    for job_id in expired:
+        del _ENCODES[job_id]
+    return expired
+
+
+def _register(enc: _Encode):
+    with _LOCK:
+        expired = _prune_locked(time.monotonic())
+        _ENCODES[enc.job_id] = enc
+    for job_id in expired:
+        cleanup_registry(job_id)
+
+
+def _segments(playlist: Path) -> List[str]:
+    lines = playlist.read_text().splitlines()
+    if "#EXT-X-ENDLIST" not in lines:
+        raise RuntimeError("playlist was not finalized")
+    return [line for line in lines if line and not line.startswith("#")]
+
+
+def _assemble(enc: _Encode):
+    """init segment + media segments -> one fragmented MP4 (plain byte concatenation)."""
+    part = enc.output_path.with_name(f".{enc.output_path.name}.part")
+    with open(part, "wb") as out:
+        for name in [HLS_INIT, *_segments(enc.workdir / HLS_PLAYLIST)]:
+            with open(enc.workdir / name, "rb") as f:
+                shutil.copyfileobj(f, out, 1024 * 1024)
+    os.replace(part, enc.output_path)
+
+
+def _encode(enc: _Encode, cache_key: str):
+    seg = LOCAL_ENHANCE_HLS_SEGMENT_SECONDS
+    cmd = [
+        "ffmpeg", "-y",
+        "-i", str(enc.input_path),
+        "-vf", LOCAL_ENHANCE_FILTER,
+        *LOCAL_ENHANCE_ENCODER_ARGS,
+        "-force_key_frames", f"expr:gte(t,n_forced*{seg})",
+        "-c:a", "copy",
+        "-f", "hls",
+        "-hls_time", str(seg),
+        "-hls_playlist_type", "event",
+        "-hls_segment_type", "fmp4",
+        "-hls_fmp4_init_filename", HLS_INIT,
+        "-hls_segment_filename", str(enc.workdir / HLS_SEGMENT_PATTERN),
+        "-hls_flags", "independent_segments+temp_file",
+        str(enc.workdir / HLS_PLAYLIST),
+    ]
+    try:
+        with job_stage(enc.job_id, "transcode"):
+            rc, stderr = run_ffmpeg(cmd, enc.job_id, "enhance hls")
+        if rc != 0:
+            raise RuntimeError(f"FFmpeg failed: {stderr[-200:]}")
+        _assemble(enc)
+        register_tmpfile(enc.job_id, str(enc.output_path))
+        result_cache.store(cache_key, "mp4", str(enc.output_path))
+    except Exception as e:
+        LOG.warning("Streaming enhance of %s failed: %s", enc.job_id, e)
+        enc.finish("failed", str(e))
+    else:
+        enc.finish("done")
+
+
+# ---------- ENTRY POINTS ----------
+async def start(job_id: str, input_path: Path, output_path: Path, cache_key: str, filename: str):
+    """
+    Start the segmented encode under a transcode admission slot (raises its
+    503 when saturated) and return once it is running; it does not depend on
+    the request that started it.
+    """
+    slot = await admission.admit("transcode").acquire()
+    enc = _Encode(job_id, input_path, output_path, filename)
+    try:
+        enc.workdir.mkdir(parents=True, exist_ok=True)
+    except OSError:
+        slot.release()
+        raise
+    register_tmpfile(job_id, str(enc.workdir))
+    _register(enc)
+    loop = asyncio.get_running_loop()
+
+    def run():
+        try:
+            _encode(enc, cache_key)
+        finally:
+            loop.call_soon_threadsafe(slot.release)
+
+    threading.Thread(target=run, name=f"enhance-hls-{job_id}", daemon=True).start()
+
+
+def finished(job_id: str, output_path: Path, filename: str):
+    """Register a job whose MP4 came from the cache: the download works, there is no playlist."""
+    enc = _Encode(job_id, None, output_path, filename)
+    enc.finish("done")
+    _register(enc)
+
+
+def get(job_id: str) -> Optional[_Encode]:
+    with _LOCK:
+        return _ENCODES.get(job_id)
+
+
+def segment_path(enc: _Encode, name: str) -> Optional[Path]:
+    """Path of a playlist / init / media segment file of the job (None for any other name)."""
+    return enc.workdir / name if _NAME_RE.match(name) else None
+
+
+async def wait_for_playlist(enc: _Encode) -> Optional[Path]:
+    """The playlist once ffmpeg has listed a first segment (None if the encode ends without one)."""
+    path = enc.workdir / HLS_PLAYLIST
+    deadline = time.monotonic() + HLS_PLAYLIST_WAIT
+    while not path.exists():
+        if enc.state != "running" or time.monotonic() > deadline:
+            return None
+        await asyncio.sleep(HLS_POLL)
+    return path
@@ -6,107 +6,73 @@ import subprocess
 import sys
 import uuid
 import os
-import threading
 import shutil
-import requests
 import re
+import time
+import asyncio
+import json
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import TYPE_CHECKING, Optional, Dict, Any, List, Union
 
-from fastapi import FastAPI, HTTPException, Body, Response, BackgroundTasks, UploadFile, File, Form
+from fastapi import (
+    APIRouter, FastAPI, HTTPException, Body, Request, Response, BackgroundTasks, UploadFile, File, Form, Query,
+)
 from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from pydantic import BaseModel
-from yt_dlp import YoutubeDL
-from yt_dlp.utils import DownloadError, UnsupportedError
 
-from .utils import select_formats
+from . import (
+    admission, cookies, extract_pool, fingerprint, format_policy, metrics, music_render, prefetch, profiling,
+    ranged_fetch, result_cache, scheduler, startup, thumbnails, uploads, url_precheck, waveform, zipstream,
+)
+from .cookies import youtube_dl
+from .progress import find_jobs, get_job, job_stage, new_job_id, run_ffmpeg, update_job, update_progress
+from .presets import remote_enhance_recipe
+from .registry import (
+    cleanup_registry as _cleanup_registry,
+    kill_processes as _kill_processes,
+    register_process as _register_process,
+    register_tmpfile as _register_tmpfile,
+)
+from .utils import parse_timestamp
+
+if TYPE_CHECKING:  # yt_dlp and requests are imported on first use (see startup.py)
+    from yt_dlp import YoutubeDL
 
 # --- CONFIGURATION: set your Colab/NGROK URL here when using cloud GPU features ---
 # Example: "https://a1b2-34-56.ngrok-free.app"
-COLAB_GPU_URL = "https://REPLACE-ME.ngrok-free.app"
+COLAB_GPU_URL = os.environ.get("COLAB_GPU_URL", "https://REPLACE-ME.ngrok-free.app")
 
 LOG = logging.getLogger("media_studio")
 LOG.setLevel(logging.INFO)
 
-app = FastAPI(title="Media Studio (Merged)")
-
-# ---------- REGISTRY (Processes & Temp Files) ----------
-PROCESS_REGISTRY: Dict[str, Dict[str, Any]] = {}
-PROCESS_REGISTRY_LOCK = threading.Lock()
-
-
-def _register_process(download_id: str, proc: subprocess.Popen):
-    with PROCESS_REGISTRY_LOCK:
-        entry = PROCESS_REGISTRY.setdefault(download_id, {"processes": [], "tmpfiles": [], "lock": threading.Lock()})
-        entry["processes"].append(proc)
-
-
-def _register_tmpfile(download_id: str, path: str):
-    with PROCESS_REGISTRY_LOCK:
-        entry = PROCESS_REGISTRY.setdefault(download_id, {"processes": [], "tmpfiles": [], "lock": threading.Lock()})
-        entry["tmpfiles"].append(path)
-
-
-def _cleanup_registry(download_id: str):
-    """Kill any running procs and remove tmp files/dirs registered for the given id."""
-    with PROCESS_REGISTRY_LOCK:
-        entry = PROCESS_REGISTRY.pop(download_id, None)
-    if not entry:
-        return
-    for p in entry.get("processes", []):
-        try:
-            if p.poll() is None:
-                p.kill()
-        except Exception:
-            pass
-    for f in entry.get("tmpfiles", []):
-        try:
-            if os.path.exists(f):
-                try:
-                    if os.path.isdir(f):
-                        shutil.rmtree(f, ignore_errors=True)
-                    else:
-                        os.remove(f)
-                except Exception:
-                    pass
-        except Exception:
-            pass
-
-
-def _kill_processes(download_id: str):
-    killed = []
-    with PROCESS_REGISTRY_LOCK:
-        entry = PROCESS_REGISTRY.get(download_id)
-        if not entry:
-            return killed
-        procs = list(entry.get("processes", []))
-    for p in procs:
-        try:
-            if p.poll() is None:
-                p.terminate()
-                try:
-                    p.wait(timeout=2)
-                except Exception:
-                    pass
-                if p.poll() is None:
-                    p.kill()
-                if p.poll() is not None:
-                    try:
-                        killed.append(p.pid)
-                    except Exception:
-                        pass
-        except Exception:
-            pass
-    _cleanup_registry(download_id)
-    return killed
-
+router = APIRouter()  # this app's routes; the app itself is built by create_app()
 
 # ---------- MODELS & HELPERS ----------
 class DownloadRequest(BaseModel):
     url: str
     mode: str
     preferred_resolution: Optional[int] = 1080
-    download_id: Optional[str] = None
+    download_id: Optional[str] = None  # client label only; the job id comes back as X-Job-Id
+    # Optional clip range: seconds or "HH:MM:SS[.ms]". Only that part is fetched.
+    start: Optional[Union[float, str]] = None
+    end: Optional[Union[float, str]] = None
+    accurate_cut: bool = False  # re-encode around the cuts instead of snapping to keyframes
+    max_bytes: Optional[int] = None  # download budget for format selection
+    # Audio mode: containers the client takes, best first ("m4a", "opus", "ogg", "webm", "mp3").
+    # Unset -> explicit audio types in the Accept header, else MP3 as before.
+    audio_formats: Optional[List[str]] = None
+    audio_bitrate: Optional[int] = None  # kbps
+
+
+class BatchRequest(BaseModel):
+    urls: Optional[List[str]] = None
+    playlist_url: Optional[str] = None
+    mode: str = "video"
+    preferred_resolution: Optional[int] = 1080
+    batch_id: Optional[str] = None  # client label only; the id comes back as X-Batch-Id
+    max_items: Optional[int] = None
+    audio_formats: Optional[List[str]] = None
+    audio_bitrate: Optional[int] = None
 
 
 def _clean_url(url: str) -> str:
@@ -132,39 +98,20 @@ def _clean_url(url: str) -> str:
     return url
 
 
-# --- Helper: try extraction with cookie fallback ---
-def _extract_info_with_cookie_fallback(ydl_opts: dict, url: str):
+# --- Helper: extraction with the shared cookie jar ---
+def _extract_info_with_cookies(ydl_opts: dict, url: str):
     """
-    Tries extraction. If Chrome cookies are locked, retries without them.
+    Extracts info in a worker process (extract_pool) using the shared cookie jar (see cookies.py). A locked Chrome
+    cookie DB is handled there, so there is no retry without cookies here.
     """
+    url_precheck.precheck(url)
     try:
-        with YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
-            if isinstance(info, dict) and info.get("entries"):
-                return info["entries"][0]
-            return info
+        with profiling.span("extract_info"):
+            return extract_pool.extract_info(ydl_opts, url, first_entry=True)
     except Exception as e:
-        msg = str(e)
-        # Check for chrome cookie DB permission errors and retry without cookies
-        if "Could not copy Chrome cookie database" in msg or "Permission denied" in msg:
-            LOG.warning("Chrome cookies locked. Retrying without cookies...")
-            fallback_opts = dict(ydl_opts)
-            fallback_opts.pop("cookiesfrombrowser", None)
-            fallback_opts.pop("cookiefile", None)
-            try:
-                with YoutubeDL(fallback_opts) as ydl:
-                    info = ydl.extract_info(url, download=False)
-                    if isinstance(info, dict) and info.get("entries"):
-                        return info["entries"][0]
-                    return info
-            except UnsupportedError:
-                raise HTTPException(status_code=400, detail="This website is not currently supported.")
-            except Exception as e2:
-                if "Unsupported URL" in str(e2):
-                    raise HTTPException(status_code=400, detail="This website is not currently supported.")
-                raise e2
-        # If not cookie-related, map some common cases to friendly HTTP errors
-        if "Unsupported URL" in msg:
+        url_precheck.remember_failure(url, e)
+        # Map some common cases to friendly HTTP errors
+        if "UnsupportedError" in url_precheck.error_classes(e) or "Unsupported URL" in str(e):
             raise HTTPException(status_code=400, detail="This website is not currently supported.")
         raise e
 
@@ -195,24 +142,20 @@ def _detect_content_type(url: str, info: dict):
     return platform, content_type
 
 
-def _run_ffmpeg_filter(input_path: str, output_path: str, filter_complex: str, download_id: str):
-    """Helper to run ffmpeg audio filters and register outputs.
-    Raises RuntimeError on ffmpeg failure.
-    """
-    cmd = ["ffmpeg", "-y", "-i", input_path, "-af", filter_complex, "-vn", output_path]
-    p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    _register_process(download_id, p)
-    stdout, stderr = p.communicate()
-    if p.returncode != 0:
-        msg = stderr.decode(errors="ignore")[:1000]
-        raise RuntimeError(f"ffmpeg filter failed: {msg}")
-    _register_tmpfile(download_id, output_path)
-
-
 # ---------- NEW: Offload/Colab endpoints ----------
-@app.post("/enhance-video")
-async def enhance_video_endpoint(file: UploadFile = File(...)):
-    """Offload video enhancement to Colab/remote GPU (expects COLAB_GPU_URL to be set)."""
+@router.post("/enhance-video")
+async def enhance_video_endpoint(
+    file: Optional[UploadFile] = File(None),
+    upload_id: Optional[str] = Form(None),
+    job_id: Optional[str] = Form(None),
+):
+    """
+    Offload video enhancement to Colab/remote GPU (expects COLAB_GPU_URL to be set).
+    Takes either a multipart `file` or the `upload_id` of a resumable upload (/uploads).
+    """
+    import requests
+    if not file and not upload_id:
+        raise HTTPException(status_code=400, detail="Provide a file or an upload_id")
     if "ngrok" not in COLAB_GPU_URL and not COLAB_GPU_URL.startswith("http"):
         raise HTTPException(500, "Colab URL not configured in backend! Please set COLAB_GPU_URL in media_studio.py")
 
@@ -220,46 +163,71 @@ async def enhance_video_endpoint(file: UploadFile = File(...)):
     tmpdir.mkdir(parents=True, exist_ok=True)
     input_path = tmpdir / f"in_{uuid.uuid4().hex}.mp4"
     output_path = tmpdir / f"out_{uuid.uuid4().hex}.mp4"
-    job_id = f"colab_{uuid.uuid4().hex}"
-    try:
-        # Save local upload temporarily
-        with open(input_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        _register_tmpfile(job_id, str(input_path))
-
-        # Post to Colab endpoint
-        LOG.info(f"Offloading {file.filename} to Colab GPU at {COLAB_GPU_URL}...")
+    job_id = new_job_id("colab", job_id)
+    claimed = None  # upload_id once this request holds the upload; put back if processing fails
+    async with admission.admit("remote_gpu"):
         try:
-            with open(input_path, "rb") as f:
-                colab_response = requests.post(
-                    f"{COLAB_GPU_URL.rstrip('/')}/enhance-video-ai",
-                    files={"file": f},
-                    timeout=600
-                )
-        except requests.exceptions.RequestException as e:
-            raise HTTPException(500, f"Failed to connect to Colab: {str(e)}")
-
-        if colab_response.status_code != 200:
-            raise HTTPException(500, f"Colab GPU Failed processing: {colab_response.text}")
-
-        with open(output_path, "wb") as f:
-            f.write(colab_response.content)
-        _register_tmpfile(job_id, str(output_path))
-
-        return FileResponse(output_path, filename="enhanced_video.mp4", media_type="video/mp4")
-    except HTTPException as he:
-        raise he
-    except Exception as e:
-        LOG.exception("Enhance error")
-        raise HTTPException(500, str(e))
-    finally:
-        # cleanup will be handled by registry (registered files) or can be removed here
-        pass
+            # Save local upload temporarily (hashing in the same pass for the result cache);
+            # a resumable upload is just moved
+            if upload_id:
+                input_digest, filename = await uploads.claim(upload_id, input_path)
+                claimed = upload_id
+            else:
+                with job_stage(job_id, "upload"):
+                    input_digest = await profiling.run_in_threadpool(result_cache.copy_and_hash, file.file,
+                                                                     str(input_path))
+                filename = file.filename
+            _register_tmpfile(job_id, str(input_path))
+
+            cache_key = result_cache.recipe_key(input_digest, remote_enhance_recipe())
+            cached = result_cache.lookup(cache_key, "mp4")
+            if cached:
+                LOG.info("Enhancement cache hit for %s", filename)
+                result_cache.materialize(cached, str(output_path))
+                _register_tmpfile(job_id, str(output_path))
+                return FileResponse(output_path, filename="enhanced_video.mp4", media_type="video/mp4",
+                                    headers={"X-Job-Id": job_id})
+
+            # Post to Colab endpoint
+            LOG.info(f"Offloading {filename} to Colab GPU at {COLAB_GPU_URL}...")
+            try:
+                with job_stage(job_id, "remote_gpu"), metrics.remote_gpu_timer("enhance-video-ai") as timer, \
+                        open(input_path, "rb") as f:
+                    colab_response = await profiling.run_in_threadpool(
+                        requests.post,
+                        f"{COLAB_GPU_URL.rstrip('/')}/enhance-video-ai",
+                        files={"file": f},
+                        timeout=600
+                    )
+                    timer.status = colab_response.status_code
+            except requests.exceptions.RequestException as e:
+                raise HTTPException(500, f"Failed to connect to Colab: {str(e)}")
+
+            if colab_response.status_code != 200:
+                raise HTTPException(500, f"Colab GPU Failed processing: {colab_response.text}")
+
+            await profiling.run_in_threadpool(output_path.write_bytes, colab_response.content)
+            _register_tmpfile(job_id, str(output_path))
+            result_cache.store(cache_key, "mp4", str(output_path))
+
+            return FileResponse(output_path, filename="enhanced_video.mp4", media_type="video/mp4",
+                                headers={"X-Job-Id": job_id})
+        except HTTPException as he:
+            await uploads.restore(claimed)
+            raise he
+        except Exception as e:
+            LOG.exception("Enhance error")
+            await uploads.restore(claimed)
+            raise HTTPException(500, str(e))
+        finally:
+            # cleanup will be handled by registry (registered files) or can be removed here
+            pass
 
 
-@app.post("/generate-music-prompt")
+@router.post("/generate-music-prompt")
 async def generate_music_prompt(prompt: str = Form(...)):
     """Forward text prompt to Colab/remote MusicGen and return audio blob (wav)."""
+    import requests
     if "ngrok" not in COLAB_GPU_URL and not COLAB_GPU_URL.startswith("http"):
         raise HTTPException(500, "Colab URL not configured! Please set COLAB_GPU_URL in media_studio.py")
 
@@ -268,38 +236,41 @@ async def generate_music_prompt(prompt: str = Form(...)):
     output_path = tmpdir / f"gen_{uuid.uuid4().hex}.wav"
     job_id = f"gen_{uuid.uuid4().hex}"
 
-    try:
-        LOG.info("Sending MusicGen prompt to Colab: %s", (prompt[:120] + "...") if len(prompt) > 120 else prompt)
+    async with admission.admit("remote_gpu"):
         try:
-            resp = requests.post(f"{COLAB_GPU_URL.rstrip('/')}/generate-music-ai", data={"prompt": prompt}, timeout=300)
-        except requests.exceptions.RequestException as e:
-            raise HTTPException(500, f"Failed to connect to Colab: {str(e)}")
+            LOG.info("Sending MusicGen prompt to Colab: %s", (prompt[:120] + "...") if len(prompt) > 120 else prompt)
+            try:
+                with metrics.remote_gpu_timer("generate-music-ai") as timer:
+                    resp = await profiling.run_in_threadpool(
+                        requests.post, f"{COLAB_GPU_URL.rstrip('/')}/generate-music-ai",
+                        data={"prompt": prompt}, timeout=300)
+                    timer.status = resp.status_code
+            except requests.exceptions.RequestException as e:
+                raise HTTPException(500, f"Failed to connect to Colab: {str(e)}")
 
-        if resp.status_code != 200:
-            raise HTTPException(500, f"Colab MusicGen Failed: {resp.text}")
+            if resp.status_code != 200:
+                raise HTTPException(500, f"Colab MusicGen Failed: {resp.text}")
 
-        with open(output_path, "wb") as f:
-            f.write(resp.content)
-        _register_tmpfile(job_id, str(output_path))
+            await profiling.run_in_threadpool(output_path.write_bytes, resp.content)
+            _register_tmpfile(job_id, str(output_path))
 
-        return FileResponse(output_path, filename="ai_generated_music.wav", media_type="audio/wav")
-    except HTTPException as he:
-        raise he
-    except Exception as e:
-        LOG.exception("MusicGen error")
-        _cleanup_registry(job_id)
-        raise HTTPException(status_code=500, detail=str(e))
+            return FileResponse(output_path, filename="ai_generated_music.wav", media_type="audio/wav")
+        except HTTPException as he:
+            raise he
+        except Exception as e:
+            LOG.exception("MusicGen error")
+            _cleanup_registry(job_id)
+            raise HTTPException(status_code=500, detail=str(e))
 
 
 # ---------- ENDPOINTS ----------
-@app.post("/info")
+@router.post("/info")
 async def info_endpoint(payload: dict = Body(...)):
     raw_url = (payload.get("url") or "").strip()
     if not raw_url:
         raise HTTPException(status_code=400, detail="Missing url")
     # Clean URL early
     url = _clean_url(raw_url)
-    cookie_file = "cookies.txt"
 
     try:
         ydl_opts = {
@@ -307,13 +278,15 @@ async def info_endpoint(payload: dict = Body(...)):
             "no_warnings": True,
             "noplaylist": True,
             "force_ipv4": True,
-            "cookiesfrombrowser": ("chrome",),
         }
-        if os.path.exists(cookie_file):
-            ydl_opts["cookiefile"] = cookie_file
 
-        info = _extract_info_with_cookie_fallback(ydl_opts, url)
-        platform, content_type = _detect_content_type(url, info)
+        async with scheduler.slot(scheduler.platform_for_url(url), "extract"):
+            with metrics.extraction_timer() as timer:
+                info = await profiling.run_in_threadpool(_extract_info_with_cookies, ydl_opts, url)
+                platform, content_type = _detect_content_type(url, info)
+                timer.platform = platform
+        if prefetch.PREFETCH_ENABLED:
+            await profiling.run_in_threadpool(prefetch.schedule, url, info, platform)
 
         formats = info.get("formats") or []
         best_mp4 = None
@@ -351,20 +324,28 @@ async def info_endpoint(payload: dict = Body(...)):
         raise HTTPException(status_code=400, detail=str(e))
 
 
-@app.get("/proxy-image")
-def proxy_image_endpoint(url: str):
+@router.get("/metrics")
+def metrics_endpoint():
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@router.get("/proxy-image")
+async def proxy_image_endpoint(
+    url: str,
+    request: Request,
+    width: Optional[int] = Query(None, ge=16, le=4096),
+    fmt: Optional[str] = Query(None, alias="format", pattern="^(webp|jpeg)$"),
+):
+    """The image at `url`; with `width`/`format`, a resized WebP/JPEG variant (see thumbnails.py)."""
     if not url:
         return Response(status_code=404)
-    try:
-        headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) Chrome/120.0.0.0 Safari/537.36"}
-        resp = requests.get(url, headers=headers, stream=True, timeout=10)
-        return Response(content=resp.content, media_type="image/jpeg") if resp.status_code == 200 else Response(status_code=404)
-    except Exception:
-        return Response(status_code=404)
+    headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) Chrome/120.0.0.0 Safari/537.36"}
+    return await thumbnails.proxy_image(url, width, fmt, request.headers.get("accept", ""), headers)
 
 
-@app.get("/proxy-video")
+@router.get("/proxy-video")
 def proxy_video_endpoint(url: str):
+    import requests
     if not url:
         return Response(status_code=404)
     try:
@@ -378,134 +359,425 @@ def proxy_video_endpoint(url: str):
 
 
 # ---------- DOWNLOAD LOGIC ----------
-def _safe_extract_info(ydl: YoutubeDL, url: str):
+def _safe_extract_info(ydl: "YoutubeDL", url: str):
     info = ydl.extract_info(url, download=False)
     if isinstance(info, dict) and info.get("entries"):
         return info["entries"][0]
     return info
 
 
-def _yt_dlp_download_cli(url: str, format_spec: str, outtmpl: str, download_id: str):
-    base_cmd = [sys.executable, "-m", "yt_dlp"]
-    if os.path.exists("cookies.txt"):
-        base_cmd.extend(["--cookies", "cookies.txt"])
-
-    cmd_with_browser = list(base_cmd) + ["--cookies-from-browser", "chrome", "-f", str(format_spec), "-o", outtmpl, url]
-    cmd_no_browser = list(base_cmd) + ["-f", str(format_spec), "-o", outtmpl, url]
-
-    def run_cmd(cmd):
+def _yt_dlp_download_cli(url: str, format_spec: str, outtmpl: str, download_id: str,
+                         section: Optional[tuple] = None, accurate_cut: bool = False):
+    """
+    `section=(start, end)` downloads only that time range: yt-dlp hands the range to
+    ffmpeg, which fetches just the covering HLS/DASH fragments (or byte ranges of a
+    progressive file) and stream-copies the cut, snapping to keyframes unless
+    `accurate_cut` (--force-keyframes-at-cuts, re-encodes around the cut points).
+    """
+    cmd = [sys.executable, "-m", "yt_dlp"]
+    # per-call copy of the shared cookie jar, kept outside the output dir
+    cookie_copy = Path(tempfile.gettempdir()) / f"{download_id}_{uuid.uuid4().hex[:8]}_cookies.txt"
+    if cookies.COOKIES.write_cookiefile(str(cookie_copy)):
+        _register_tmpfile(download_id, str(cookie_copy))
+        cmd.extend(["--cookies", str(cookie_copy)])
+    cmd.extend(["--concurrent-fragments", str(ranged_fetch.FRAGMENT_CONCURRENCY)])  # HLS/DASH fragments
+    if section:
+        cmd.extend(["--download-sections", f"*{section[0]:.3f}-{section[1]:.3f}"])
+        if accurate_cut:
+            cmd.append("--force-keyframes-at-cuts")
+    cmd.extend(["-f", str(format_spec), "-o", outtmpl, url])
+
+    with job_stage(download_id, "download"):
         p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
         _register_process(download_id, p)
-        stdout, stderr = p.communicate()
-        return p.returncode, stderr or b""
-
-    rc, se = run_cmd(cmd_with_browser)
-    se_text = se.decode(errors="ignore")
-
-    if rc != 0 and ("Could not copy Chrome cookie database" in se_text or "Permission denied" in se_text):
-        LOG.warning("CLI cookie copy failed. Retrying without browser cookies.")
-        rc, se = run_cmd(cmd_no_browser)
-        se_text = se.decode(errors="ignore")
+        with profiling.span("subprocess:yt_dlp"):
+            _stdout, stderr = p.communicate()
+        rc = p.returncode
+        se_text = (stderr or b"").decode(errors="ignore")
 
     if rc != 0:
         raise RuntimeError(f"Download failed: {se_text[:200]}")
 
     base = Path(outtmpl).parent
     files = sorted(base.glob("*"), key=lambda f: f.stat().st_mtime, reverse=True)
-    return str(files[0]) if files else outtmpl
+    result = str(files[0]) if files else outtmpl
+    if os.path.exists(result):
+        metrics.DOWNLOADED_BYTES.inc(os.path.getsize(result), source="download")
+    return result
+
+
+def _fetch_format(url: str, fmt: dict, tmpdir: Path, stem: str, download_id: str, platform: str,
+                  section: Optional[tuple] = None, accurate_cut: bool = False) -> str:
+    """
+    Download one format: adopt a finished /info prefetch if there is one, else direct
+    progressive URLs with parallel range requests (ranged_fetch), everything else --
+    or a failed ranged fetch -- via the yt-dlp CLI.
+    Throughput is recorded per platform and method.
+    """
+    dest = tmpdir / f"{stem}.{fmt.get('ext') or 'bin'}"
+    if not section and prefetch.claim(url, fmt, str(dest), download_id):
+        update_progress(download_id, f"download_{stem}", {"state": "done", "method": "prefetch"})
+        return str(dest)
+    if not section and ranged_fetch.is_direct(fmt):
+        resume_key = f"{url}\n{fmt.get('format_id')}"
+        try:
+            with job_stage(download_id, "download"):
+                stats = ranged_fetch.fetch(fmt["url"], str(dest), headers=ranged_fetch.request_headers(fmt),
+                                           job_id=download_id, label=f"download_{stem}", resume_key=resume_key)
+            update_progress(download_id, f"download_{stem}", {"state": "done", "method": "ranged", **stats})
+            if stats["seconds"] > 0:
+                ranged_fetch.DOWNLOAD_THROUGHPUT.observe(stats["bytes"] / stats["seconds"],
+                                                         platform=metrics.platform_label(platform), method="ranged")
+            metrics.DOWNLOADED_BYTES.inc(stats["bytes"], source="download")
+            return str(dest)
+        except ranged_fetch.RangedFetchError as e:
+            LOG.warning("Ranged fetch failed (%s); falling back to yt-dlp", e)
+            ranged_fetch.discard_partial(resume_key)
+            for leftover in tmpdir.glob(f"{dest.name}*"):
+                leftover.unlink(missing_ok=True)
+
+    t0 = time.perf_counter()
+    path = _yt_dlp_download_cli(url, fmt.get("format_id"), str(tmpdir / f"{stem}.%(ext)s"), download_id,
+                                section=section, accurate_cut=accurate_cut)
+    elapsed = time.perf_counter() - t0
+    if os.path.exists(path) and elapsed > 0:
+        ranged_fetch.DOWNLOAD_THROUGHPUT.observe(os.path.getsize(path) / elapsed,
+                                                 platform=metrics.platform_label(platform), method="ytdlp")
+    return path
 
 
 def _ffmpeg_merge(video: str, audio: str, out: str, download_id: str):
     cmd = ["ffmpeg", "-y", "-i", video, "-i", audio, "-c", "copy", out]
-    p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    _register_process(download_id, p)
-    stdout, stderr = p.communicate()
-    if p.returncode != 0:
-        msg = stderr.decode(errors="ignore")[:1000]
-        raise RuntimeError(f"ffmpeg merge failed: {msg}")
+    with job_stage(download_id, "merge"):
+        rc, stderr = run_ffmpeg(cmd, download_id, "merge")
+    if rc != 0:
+        raise RuntimeError(f"ffmpeg merge failed: {stderr[-1000:]}")
     return out
 
 
-@app.post("/download")
-async def download(req: DownloadRequest, background_tasks: BackgroundTasks):
+def _deliver_audio(path: str, codec: str, targets: List[str], bitrate: Optional[int], tmpdir: Path,
+                   download_id: str, duration: Optional[float]):
+    """
+    Stream-copy the downloaded audio into the first accepted container that can hold
+    its codec (AAC -> .m4a, Opus -> .opus/.ogg/.webm); transcode to MP3 only when
+    the client takes nothing else or the copy fails. Returns (path, filename, media_type).
+    """
+    target = format_policy.passthrough_target(codec, targets)
+    if target:
+        ext, media_type = target
+        if Path(path).suffix.lower() == f".{ext}":
+            update_job(download_id, audio_output={"codec": codec, "container": ext, "transcoded": False})
+            return path, f"audio.{ext}", media_type
+        out = tmpdir / f"audio.{ext}"
+        cmd = ["ffmpeg", "-y", "-i", path, "-vn", "-map", "0:a:0", "-c:a", "copy"]
+        if ext == "m4a":
+            cmd += ["-movflags", "+faststart"]
+        with job_stage(download_id, "remux"):
+            rc, stderr = run_ffmpeg(cmd + [str(out)], download_id, "audio_remux", duration=duration)
+        if rc == 0:
+            _register_tmpfile(download_id, str(out))
+            update_job(download_id, audio_output={"codec": codec, "container": ext, "transcoded": False})
+            return str(out), f"audio.{ext}", media_type
+        LOG.warning("audio remux to %s failed, falling back to MP3: %s", ext, stderr[-300:])
+
+    mp3_path = tmpdir / "audio.mp3"
+    quality = ["-b:a", f"{int(bitrate)}k"] if bitrate else ["-q:a", "2"]
+    cmd = ["ffmpeg", "-y", "-i", path, "-vn", "-acodec", "libmp3lame"] + quality + [str(mp3_path)]
+    with job_stage(download_id, "transcode"):
+        rc, stderr = run_ffmpeg(cmd, download_id, "mp3", duration=duration)
+    if rc != 0:
+        raise RuntimeError(f"ffmpeg mp3 conversion failed: {stderr[-1000:]}")
+    final = str(mp3_path)
+    _register_tmpfile(download_id, final)
+    update_job(download_id, audio_output={"codec": "mp3", "container": "mp3", "transcoded": True})
+    return final, "audio.mp3", "audio/mpeg"
+
+
+def _download_selected(url: str, mode: str, info: dict, preferred: int, tmpdir: Path, download_id: str,
+                       section: Optional[tuple] = None, accurate_cut: bool = False, max_bytes: Optional[int] = None,
+                       audio_targets: Optional[List[str]] = None, audio_bitrate: Optional[int] = None):
+    """
+    Blocking part of /download (yt-dlp CLI + ffmpeg), run in a worker thread.
+    Formats come from format_policy; its reasoning is stored on the job record.
+    Returns (path, filename, media_type).
+    """
+    clip = {"section": section, "accurate_cut": accurate_cut}
+    platform = _detect_content_type(url, info)[0]
+    stem = re.sub(r"[^A-Za-z0-9_-]", "_", str(info.get("id") or "media"))[:64]
+    duration = (section[1] - section[0]) if section else info.get("duration")
+    formats = info.get("formats") or []
+
+    if mode == "audio":
+        targets = audio_targets or ["mp3"]
+        plan = format_policy.choose_audio(formats, duration=duration, targets=targets,
+                                          target_abr=audio_bitrate or format_policy.AUDIO_TARGET_ABR)
+        if not plan:
+            raise HTTPException(500, "No audio found")
+        update_job(download_id, format_plan={"mode": "audio", "targets": targets,
+                                             "estimated_bytes": plan["estimated_bytes"], "explain": plan["explain"]})
+        path = _fetch_format(url, plan["audio"], tmpdir, stem, download_id, platform, **clip)
+        _register_tmpfile(download_id, path)
+        return _deliver_audio(path, format_policy.audio_codec(plan["audio"]), targets, audio_bitrate, tmpdir,
+                              download_id, duration)
+
+    plan = format_policy.choose(formats, preferred_resolution=preferred, duration=duration, max_bytes=max_bytes)
+    if not plan:
+        raise HTTPException(500, "No downloadable format found")
+    update_job(download_id, format_plan={"mode": mode, "estimated_bytes": plan["estimated_bytes"],
+                                         "cost": plan["cost"], "explain": plan["explain"]})
+    video_fmt, audio_fmt = plan["video"], plan["audio"]
+
+    if audio_fmt is None:
+        path = _fetch_format(url, video_fmt, tmpdir, stem, download_id, platform, **clip)
+        _register_tmpfile(download_id, path)
+        return path, Path(path).name, "video/mp4"
+
+    v_path = _fetch_format(url, video_fmt, tmpdir, "video", download_id, platform, **clip)
+    a_path = _fetch_format(url, audio_fmt, tmpdir, "audio", download_id, platform, **clip)
+    _register_tmpfile(download_id, v_path)
+    _register_tmpfile(download_id, a_path)
+    merged = str(tmpdir / "merged.mp4")
+    merged_path = _ffmpeg_merge(v_path, a_path, merged, download_id)
+    _register_tmpfile(download_id, merged_path)
+    return merged_path, "video.mp4", "video/mp4"
+
+
+@router.post("/download")
+async def download(req: DownloadRequest, background_tasks: BackgroundTasks, request: Request):
     # Clean incoming URL early
     url = _clean_url((req.url or "").strip())
     mode = req.mode
     preferred = int(req.preferred_resolution or 1080)
-    download_id = req.download_id or f"dl_{uuid.uuid4().hex}"
-    tmpdir = Path(tempfile.mkdtemp(prefix="vd_"))
-
+    download_id = new_job_id("dl", req.download_id)
     try:
-        ydl_opts = {"quiet": True, "no_warnings": True, "force_ipv4": True, "cookiesfrombrowser": ("chrome",)}
-        if os.path.exists("cookies.txt"):
-            ydl_opts["cookiefile"] = "cookies.txt"
+        start, end = parse_timestamp(req.start), parse_timestamp(req.end)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    if end is not None and end <= (start or 0.0):
+        raise HTTPException(400, "end must be after start")
 
-        info = _extract_info_with_cookie_fallback(ydl_opts, url)
-        formats = info.get("formats") or []
+    async with admission.admit("download"):
+        tmpdir = Path(tempfile.mkdtemp(prefix="vd_"))
 
-        video_fmt, audio_fmt = select_formats(formats, preferred_resolution=preferred)
-
-        def combined_best():
-            for f in reversed(formats):
-                if f.get("vcodec") != "none" and f.get("acodec") != "none":
-                    return f
-            return None
-
-        if mode == "audio":
-            chosen = audio_fmt or combined_best()
-            if not chosen:
-                _cleanup_registry(download_id)
-                raise HTTPException(500, "No audio found")
-            fmt_id = chosen.get("format_id")
-            path = _yt_dlp_download_cli(url, fmt_id, str(tmpdir / "%(id)s.%(ext)s"), download_id)
-            _register_tmpfile(download_id, path)
-            mp3_path = tmpdir / "audio.mp3"
-            cmd = ["ffmpeg", "-y", "-i", path, "-vn", "-acodec", "libmp3lame", "-q:a", "2", str(mp3_path)]
-            p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            _register_process(download_id, p)
-            p.communicate()
-            final = str(mp3_path)
-            _register_tmpfile(download_id, final)
+        try:
+            ydl_opts = {"quiet": True, "no_warnings": True, "force_ipv4": True}
+
+            async with scheduler.slot(scheduler.platform_for_url(url), "extract"):
+                with job_stage(download_id, "extract"), metrics.extraction_timer() as timer:
+                    info = await profiling.run_in_threadpool(_extract_info_with_cookies, ydl_opts, url)
+                    platform = timer.platform = _detect_content_type(url, info)[0]
+
+            section = None
+            if start is not None or end is not None:
+                duration = info.get("duration")
+                section_end = min(end, duration) if end is not None and duration else (end or duration)
+                if not section_end:
+                    raise HTTPException(400, "end is required when the media duration is unknown")
+                if (start or 0.0) >= section_end:
+                    raise HTTPException(400, "start is beyond the end of the media")
+                section = (start or 0.0, float(section_end))
+                update_job(download_id,
+                           section={"start": section[0], "end": section[1], "accurate_cut": req.accurate_cut})
+
+            async with scheduler.slot(platform, "download"):
+                path, filename, media_type = await profiling.run_in_threadpool(
+                    _download_selected, url, mode, info, preferred, tmpdir, download_id, section, req.accurate_cut,
+                    req.max_bytes, format_policy.audio_targets(req.audio_formats, request.headers.get("accept")),
+                    req.audio_bitrate)
+            if section:
+                filename = f"{Path(filename).stem}_{int(section[0])}-{int(section[1])}{Path(filename).suffix}"
             background_tasks.add_task(_cleanup_registry, download_id)
-            return FileResponse(final, filename="audio.mp3", media_type="audio/mpeg")
+            return FileResponse(path, filename=filename, media_type=media_type, headers={"X-Job-Id": download_id})
+
+        except HTTPException as he:
+            _cleanup_registry(download_id)
+            raise he
+        except Exception as e:
+            LOG.exception("download error")
+            _cleanup_registry(download_id)
+            raise HTTPException(500, str(e))
+
+
+# ---------- BATCH / PLAYLIST DOWNLOADS ----------
+BATCH_MAX_ITEMS = 100
+BATCH_CONCURRENCY = 4  # per batch; the platform scheduler still applies on top
+
+
+def _playlist_entry_urls(playlist_url: str, limit: int) -> List[Dict[str, Any]]:
+    """Flat playlist extraction: item URLs and titles without resolving each video."""
+    url_precheck.precheck(playlist_url)
+    opts = {"quiet": True, "no_warnings": True, "force_ipv4": True,
+            "extract_flat": "in_playlist", "playlistend": limit}
+    with profiling.span("extract_playlist"):
+        info = extract_pool.extract_info(opts, playlist_url)
+    entries = (info or {}).get("entries") or [info]
+    out = []
+    for e in entries:
+        if not e:
+            continue
+        item_url = e.get("webpage_url") or e.get("url")
+        if item_url:
+            out.append({"url": item_url, "title": e.get("title")})
+        if len(out) >= limit:
+            break
+    return out
 
-        combined = combined_best()
-        if combined:
-            path = _yt_dlp_download_cli(url, combined.get("format_id"), str(tmpdir / "%(id)s.%(ext)s"), download_id)
-            _register_tmpfile(download_id, path)
-            background_tasks.add_task(_cleanup_registry, download_id)
-            return FileResponse(path, filename=Path(path).name, media_type="video/mp4")
-
-        v_path = _yt_dlp_download_cli(url, video_fmt.get("format_id"), str(tmpdir / "video.%(ext)s"), download_id)
-        a_path = _yt_dlp_download_cli(url, audio_fmt.get("format_id"), str(tmpdir / "audio.%(ext)s"), download_id)
-        _register_tmpfile(download_id, v_path)
-        _register_tmpfile(download_id, a_path)
-        merged = str(tmpdir / "merged.mp4")
-        merged_path = _ffmpeg_merge(v_path, a_path, merged, download_id)
-        _register_tmpfile(download_id, merged_path)
-        background_tasks.add_task(_cleanup_registry, download_id)
-        return FileResponse(merged_path, filename="video.mp4", media_type="video/mp4")
 
-    except HTTPException as he:
-        _cleanup_registry(download_id)
-        raise he
-    except Exception as e:
-        LOG.exception("download error")
-        _cleanup_registry(download_id)
-        raise HTTPException(500, str(e))
+def _archive_name(index: int, title: Optional[str], path: str) -> str:
+    stem = re.sub(r'[\\/:*?"<>|\x00-\x1f]+', "_", (title or Path(path).stem)).strip(" ._") or "item"
+    return f"{index + 1:03d} - {stem[:80]}{Path(path).suffix}"
 
 
-@app.delete("/download/{download_id}")
+@router.post("/batch")
+async def batch_download(req: BatchRequest):
+    """
+    Download a playlist or a list of URLs and stream them back as one ZIP.
+    Items are fetched concurrently (within the per-platform scheduler limits) and
+    appended to the archive in completion order; a batch_manifest.json with the
+    per-item outcome is the last member. Per-item state: GET /jobs/{batch_id};
+    each item's own stages/progress: GET /jobs/{item job_id}.
+    """
+    admission.check("download")  # shed a batch up front rather than fail every item
+    limit = max(1, min(int(req.max_items or BATCH_MAX_ITEMS), BATCH_MAX_ITEMS))
+    preferred = int(req.preferred_resolution or 1080)
+    batch_id = new_job_id("batch", req.batch_id)
+
+    if req.playlist_url:
+        playlist_url = req.playlist_url.strip()  # not _clean_url: list= is the point here
+        try:
+            async with scheduler.slot(scheduler.platform_for_url(playlist_url), "extract"):
+                entries = await profiling.run_in_threadpool(_playlist_entry_urls, playlist_url, limit)
+        except HTTPException:
+            raise
+        except Exception as e:
+            LOG.exception("playlist extraction error")
+            raise HTTPException(400, str(e))
+    else:
+        entries = [{"url": u, "title": None} for u in (req.urls or []) if u and u.strip()][:limit]
+    if not entries:
+        raise HTTPException(400, "Provide playlist_url or a non-empty urls list")
+
+    items = [
+        {"index": i, "url": _clean_url(e["url"].strip()), "title": e.get("title"),
+         "job_id": f"{batch_id}_{i}", "state": "queued"}
+        for i, e in enumerate(entries)
+    ]
+
+    def publish():
+        update_job(batch_id, kind="batch", total=len(items),
+                   completed=sum(1 for it in items if it["state"] in ("done", "failed")),
+                   items=[dict(it) for it in items])
+
+    def set_item(item, **fields):
+        item.update(fields)
+        publish()
+
+    publish()
+    sem = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def run_item(item):
+        job_id = item["job_id"]
+        tmpdir = Path(tempfile.mkdtemp(prefix="vd_"))
+        _register_tmpfile(job_id, str(tmpdir))
+        async with sem:
+            # each item is a /download's worth of work, so it holds a download slot like one
+            slot = await admission.admit("download").acquire()
+            try:
+                set_item(item, state="extracting")
+                ydl_opts = {"quiet": True, "no_warnings": True, "force_ipv4": True}
+                async with scheduler.slot(scheduler.platform_for_url(item["url"]), "extract"):
+                    with job_stage(job_id, "extract"), metrics.extraction_timer() as timer:
+                        info = await profiling.run_in_threadpool(_extract_info_with_cookies, ydl_opts, item["url"])
+                        platform = timer.platform = _detect_content_type(item["url"], info)[0]
+                set_item(item, state="downloading", title=info.get("title") or item["title"])
+                async with scheduler.slot(platform, "download"):
+                    path, _filename, _media_type = await profiling.run_in_threadpool(
+                        _download_selected, item["url"], req.mode, info, preferred, tmpdir, job_id,
+                        audio_targets=format_policy.audio_targets(req.audio_formats),
+                        audio_bitrate=req.audio_bitrate)
+            finally:
+                slot.release()
+        return path
+
+    async def stream():
+        zs = zipstream.ZipStream()
+        zf = zipstream.open_archive(zs)
+        pending = {asyncio.create_task(run_item(it)): it for it in items}
+        try:
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    item = pending.pop(task)
+                    exc = task.exception()
+                    if exc is not None:
+                        detail = exc.detail if isinstance(exc, HTTPException) else str(exc)
+                        LOG.warning("batch %s item %s failed: %s", batch_id, item["index"], detail)
+                        set_item(item, state="failed", error=str(detail)[:500])
+                        _cleanup_registry(item["job_id"])
+                        continue
+                    path = task.result()
+                    arcname = _archive_name(item["index"], item.get("title"), path)
+                    set_item(item, state="streaming", filename=arcname, bytes=os.path.getsize(path))
+                    async for chunk in zipstream.add_file(zf, zs, arcname, path):
+                        yield chunk
+                    set_item(item, state="done")
+                    _cleanup_registry(item["job_id"])
+            manifest = json.dumps({"batch_id": batch_id, "items": items}, indent=2).encode()
+            yield zipstream.add_bytes(zf, zs, "batch_manifest.json", manifest)
+            yield zipstream.close_archive(zf, zs)
+            update_job(batch_id, state="done")
+        finally:
+            # client went away (or we failed): stop outstanding work and drop temp files
+            for task in pending:
+                task.cancel()
+            for item in items:
+                _cleanup_registry(item["job_id"])
+
+    return StreamingResponse(
+        stream(),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{batch_id}.zip"', "X-Batch-Id": batch_id},
+    )
+
+
+@router.delete("/download/{download_id}")
 async def cancel_download(download_id: str):
+    music_render.forget(download_id)
     killed = _kill_processes(download_id)
     return JSONResponse({"killed": killed})
 
 
+@router.get("/jobs")
+async def jobs_by_label(label: str):
+    """Ids of the live jobs a client labelled `label` (the id it sent with the request)."""
+    return {"label": label, "job_ids": find_jobs(label)}
+
+
+@router.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    """Stage timings and live ffmpeg progress for a download/generation/enhance job."""
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return job
+
+
 # ---------- AI MUSIC GENERATION ENDPOINTS (local FFmpeg variants kept) ----------
-@app.post("/generate-music")
+def _download_music_input(ydl_opts: dict, url: str, job_id: str):
+    with job_stage(job_id, "download"), youtube_dl(ydl_opts) as ydl:
+        ydl.download([url])
+
+
+def _save_music_upload(file: UploadFile, input_path: Path, job_id: str):
+    with job_stage(job_id, "upload"), open(input_path, "wb") as buffer:
+        shutil.copyfileobj(file.file, buffer)
+
+
+@router.post("/generate-music")
 async def generate_music(
     url: Optional[str] = Form(None),
-    file: Optional[UploadFile] = File(None)
+    file: Optional[UploadFile] = File(None),
+    job_id: Optional[str] = Form(None),
 ):
     """
     Local remix generation (FFmpeg filters). Works as before: accepts URL or uploaded file.
@@ -515,61 +787,44 @@ async def generate_music(
     if not url and not file:
         raise HTTPException(status_code=400, detail="Provide a URL or File")
 
-    job_id = f"gen_{uuid.uuid4().hex}"
+    job_id = new_job_id("gen", job_id)
     tmpdir = Path(tempfile.gettempdir()) / "fetch_helper_ai"
     tmpdir.mkdir(parents=True, exist_ok=True)
     input_path = tmpdir / f"{job_id}_input.mp3"
 
+    if url and not file:
+        # reject unsupported/recently failed links before creating any job state
+        await profiling.run_in_threadpool(url_precheck.precheck, _clean_url(url))
+
+    source_url = None
     try:
         if file:
-            with open(input_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
+            await profiling.run_in_threadpool(_save_music_upload, file, input_path, job_id)
             _register_tmpfile(job_id, str(input_path))
         else:
             # Clean the URL before downloading
             clean_url = _clean_url(url)
+            source_url = clean_url
             ydl_opts = {
                 "format": "bestaudio/best",
                 "outtmpl": str(input_path),
                 "quiet": True,
                 "no_warnings": True,
-                "cookiesfrombrowser": ("chrome",),
             }
-            if os.path.exists("cookies.txt"):
-                ydl_opts["cookiefile"] = "cookies.txt"
 
-            try:
-                with YoutubeDL(ydl_opts) as ydl:
-                    ydl.download([clean_url])
-            except Exception:
-                if "cookiesfrombrowser" in ydl_opts: del ydl_opts["cookiesfrombrowser"]
-                if "cookiefile" in ydl_opts: del ydl_opts["cookiefile"]
-                with YoutubeDL(ydl_opts) as ydl:
-                    ydl.download([clean_url])
+            if await profiling.run_in_threadpool(music_render.adopt_input, clean_url, input_path):
+                LOG.info("Music input for %s reused from an earlier job", clean_url)
+            else:
+                async with admission.admit("download"), \
+                        scheduler.slot(scheduler.platform_for_url(clean_url), "download"):
+                    await profiling.run_in_threadpool(_download_music_input, ydl_opts, clean_url, job_id)
+                if input_path.exists():
+                    metrics.DOWNLOADED_BYTES.inc(input_path.stat().st_size, source="music_input")
 
             _register_tmpfile(job_id, str(input_path))
 
-        variations = []
-
-        p1 = tmpdir / f"{job_id}_lofi.mp3"
-        _run_ffmpeg_filter(str(input_path), str(p1), "atempo=0.85,lowpass=f=3000", job_id)
-        variations.append({"id": "lofi", "name": "Lo-Fi Slow", "desc": "Chill, Relaxed, Slowed", "file": str(p1)})
-
-        p2 = tmpdir / f"{job_id}_nightcore.mp3"
-        _run_ffmpeg_filter(str(input_path), str(p2), "atempo=1.25,asetrate=44100*1.1", job_id)
-        variations.append({"id": "nightcore", "name": "Nightcore", "desc": "Fast, Energetic, High Pitch", "file": str(p2)})
-
-        p3 = tmpdir / f"{job_id}_bass.mp3"
-        _run_ffmpeg_filter(str(input_path), str(p3), "bass=g=15:f=110:w=0.6", job_id)
-        variations.append({"id": "bass", "name": "Bass Boosted", "desc": "Heavy Bass, Club Vibe", "file": str(p3)})
-
-        p4 = tmpdir / f"{job_id}_reverb.mp3"
-        _run_ffmpeg_filter(str(input_path), str(p4), "aecho=0.8:0.9:1000:0.3", job_id)
-        variations.append({"id": "reverb", "name": "Ethereal", "desc": "Spacious, Dreamy, Echo", "file": str(p4)})
-
-        p5 = tmpdir / f"{job_id}_retro.mp3"
-        _run_ffmpeg_filter(str(input_path), str(p5), "acrusher=level_in=8:level_out=18:bits=8:mode=log:aa=1", job_id)
-        variations.append({"id": "retro", "name": "8-Bit Retro", "desc": "Crunchy, Old School, Arcade", "file": str(p5)})
+        # variations render in the background / on first play (music_render)
+        variations = await music_render.start(job_id, input_path, tmpdir, source_url)
 
         return {
             "job_id": job_id,
@@ -580,17 +835,80 @@ async def generate_music(
             ],
         }
 
+    except HTTPException:
+        _cleanup_registry(job_id)
+        raise
     except Exception as e:
         LOG.exception("AI Gen Error")
         _cleanup_registry(job_id)
         raise HTTPException(status_code=500, detail=f"Generation failed: {str(e)}")
 
 
-@app.get("/stream-generated/{job_id}/{var_id}")
-async def stream_generated(job_id: str, var_id: str):
+@router.get("/stream-generated/{job_id}/{var_id}")
+async def stream_generated(job_id: str, var_id: str, request: Request):
+    # unstarted: render now, ahead of the background queue (503 when transcode slots are saturated)
+    await music_render.render_on_demand(job_id, var_id)
+    if music_render.state(job_id, var_id) == "running":
+        if music_render.is_preview_request(request.headers.get("range")):
+            # play while it renders; the finished file (with Range support) is served from the next request on
+            return StreamingResponse(music_render.tail(job_id, var_id), media_type="audio/mpeg",
+                                     headers={"Cache-Control": "no-store"})
+        try:  # a seek into the unfinished part: wait for the render
+            await music_render.wait_rendered(job_id, var_id)
+        except RuntimeError as e:
+            raise HTTPException(status_code=500, detail=f"Generation failed: {e}")
+    # FileResponse answers Range / If-Range requests (206, 416) itself
     tmpdir = Path(tempfile.gettempdir()) / "fetch_helper_ai"
     filename = f"{job_id}_{var_id}.mp3"
     path = tmpdir / filename
     if path.exists():
         return FileResponse(path, media_type="audio/mpeg", filename=f"{var_id}.mp3")
     return Response(status_code=404)
+
+
+@router.get("/peaks-generated/{job_id}/{var_id}")
+async def peaks_generated(job_id: str, var_id: str, width: int = 1000):
+    """Waveform peaks (audiowaveform .dat, 8-bit) of a variation, or of the input with var_id=original."""
+    tmpdir = Path(tempfile.gettempdir()) / "fetch_helper_ai"
+    if var_id == "original":
+        path = tmpdir / f"{job_id}_input.mp3"
+    else:
+        try:  # renders it now if nobody has started it
+            await music_render.wait_rendered(job_id, var_id)
+        except RuntimeError as e:
+            raise HTTPException(status_code=500, detail=f"Generation failed: {e}")
+        path = tmpdir / f"{job_id}_{var_id}.mp3"
+    if not path.exists():
+        return Response(status_code=404)
+    try:
+        if not waveform.cached(str(path)):
+            async with admission.admit("transcode"):
+                await profiling.run_in_threadpool(waveform.compute, str(path), job_id)
+        data = await profiling.run_in_threadpool(waveform.read_level, str(path), max(1, width))
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=f"Waveform failed: {e}")
+    return Response(data, media_type="application/octet-stream", headers={"Cache-Control": "private, max-age=3600"})
+
+
+# ---------- APP ----------
+def create_app(warm_up: Optional[bool] = None) -> FastAPI:
+    """
+    Build the app (`uvicorn --factory app.main:create_app`; `app.main:app` still works).
+    `warm_up` (default FETCH_HELPER_WARMUP) preloads yt_dlp & co. after startup.
+    """
+    app = FastAPI(title="Media Studio (Merged)", lifespan=startup.lifespan(warm_up))
+    app.add_middleware(metrics.MetricsMiddleware)
+    app.add_middleware(profiling.ProfilingMiddleware)
+    app.include_router(profiling.router)
+    app.include_router(cookies.router)
+    app.include_router(scheduler.router)
+    app.include_router(extract_pool.router)
+    app.include_router(prefetch.router)
+    app.include_router(admission.router)
+    app.include_router(fingerprint.router)
+    app.include_router(uploads.router)
+    app.include_router(router)
+    return app
+
+
+app = create_app()
@@ -2,121 +2,50 @@
 import logging
 import traceback
 import tempfile
-import subprocess
 import sys
-import uuid
 import os
-import threading
 import shutil
-import requests
 import re
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Optional
 
-from fastapi import FastAPI, HTTPException, Body, Response, BackgroundTasks, UploadFile, File, Form
+from fastapi import (
+    APIRouter, FastAPI, HTTPException, Body, Request, Response, BackgroundTasks, UploadFile, File, Form, Query,
+)
 from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from yt_dlp import YoutubeDL
-from yt_dlp.utils import DownloadError, UnsupportedError
 
+from . import (
+    admission, cookies, extract_pool, fingerprint, hls_enhance, metrics, music_render, profiling, result_cache,
+    scheduler, startup, thumbnails, uploads, url_precheck, waveform,
+)
+from .cookies import youtube_dl
+from .parallel_enhance import ChunkingUnavailable, enhance_chunked
+from .progress import find_jobs, get_job, job_stage, new_job_id, run_ffmpeg
+from .presets import (
+    LOCAL_ENHANCE_ENCODER_ARGS,
+    LOCAL_ENHANCE_FILTER,
+    local_enhance_chunked_recipe,
+    local_enhance_hls_recipe,
+    local_enhance_recipe,
+    remote_enhance_recipe,
+)
+from .registry import cleanup_registry as _cleanup_registry, register_tmpfile as _register_tmpfile
 from .utils import select_formats
 
 # ---------- CONFIG ----------
 # Replace this with your Colab/ngrok URL when you want remote GPU processing.
 # Example: COLAB_GPU_URL = "https://a1b2-34-56.ngrok-free.app"
-COLAB_GPU_URL = "https://REPLACE-WITH-YOUR-NGROK-URL.ngrok-free.app"
+COLAB_GPU_URL = os.environ.get("COLAB_GPU_URL", "https://REPLACE-WITH-YOUR-NGROK-URL.ngrok-free.app")
+
+# Local fallback: split long videos at keyframes and enhance segments on all cores.
+LOCAL_ENHANCE_CHUNKED = True
 
 LOG = logging.getLogger("media_studio")
 LOG.setLevel(logging.INFO)
 
-app = FastAPI(title="Media Studio (Merged)")
-
-# Allow CORS during dev; narrow origins in production
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=[
-        "http://localhost:3000",
-        "http://127.0.0.1:3000",
-        "http://localhost:5173",
-        "http://127.0.0.1:5173",
-        "http://localhost:8000",
-    ],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# ---------- REGISTRY (Processes & Temp Files) ----------
-PROCESS_REGISTRY: Dict[str, Dict[str, Any]] = {}
-PROCESS_REGISTRY_LOCK = threading.Lock()
-
-
-def _register_process(download_id: str, proc: subprocess.Popen):
-    with PROCESS_REGISTRY_LOCK:
-        entry = PROCESS_REGISTRY.setdefault(download_id, {"processes": [], "tmpfiles": [], "lock": threading.Lock()})
-        entry["processes"].append(proc)
-
-
-def _register_tmpfile(download_id: str, path: str):
-    with PROCESS_REGISTRY_LOCK:
-        entry = PROCESS_REGISTRY.setdefault(download_id, {"processes": [], "tmpfiles": [], "lock": threading.Lock()})
-        entry["tmpfiles"].append(path)
-
-
-def _cleanup_registry(download_id: str):
-    """Kill any running procs and remove tmp files/dirs registered for the given id."""
-    with PROCESS_REGISTRY_LOCK:
-        entry = PROCESS_REGISTRY.pop(download_id, None)
-    if not entry:
-        return
-    for p in entry.get("processes", []):
-        try:
-            if p.poll() is None:
-                p.kill()
-        except Exception:
-            pass
-    for f in entry.get("tmpfiles", []):
-        try:
-            if os.path.exists(f):
-                try:
-                    if os.path.isdir(f):
-                        shutil.rmtree(f, ignore_errors=True)
-                    else:
-                        os.remove(f)
-                except Exception:
-                    pass
-        except Exception:
-            pass
-
-
-def _kill_processes(download_id: str):
-    killed = []
-    with PROCESS_REGISTRY_LOCK:
-        entry = PROCESS_REGISTRY.get(download_id)
-        if not entry:
-            return killed
-        procs = list(entry.get("processes", []))
-    for p in procs:
-        try:
-            if p.poll() is None:
-                p.terminate()
-                try:
-                    p.wait(timeout=2)
-                except Exception:
-                    pass
-                if p.poll() is None:
-                    p.kill()
-                if p.poll() is not None:
-                    try:
-                        killed.append(p.pid)
-                    except Exception:
-                        pass
-        except Exception:
-            pass
-    _cleanup_registry(download_id)
-    return killed
-
+router = APIRouter()  # this app's routes; the app itself is built by create_app()
 
 # ---------- MODELS & HELPERS ----------
 class DownloadRequest(BaseModel):
@@ -145,36 +74,18 @@ def _clean_url(url: str) -> str:
     return url
 
 
-def _extract_info_with_cookie_fallback(ydl_opts: dict, url: str):
+def _extract_info_with_cookies(ydl_opts: dict, url: str):
     """
-    Extract info using yt_dlp; if chrome cookie DB is locked, retry without cookies.
+    Extract info in an extraction worker (extract_pool) with the shared cookie jar (locked chrome cookie DB is
+    handled in cookies.py).
     """
+    url_precheck.precheck(url)
     try:
-        with YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
-            if isinstance(info, dict) and info.get("entries"):
-                return info["entries"][0]
-            return info
+        with profiling.span("extract_info"):
+            return extract_pool.extract_info(ydl_opts, url, first_entry=True)
     except Exception as e:
-        msg = str(e)
-        if "Could not copy Chrome cookie database" in msg or "Permission denied" in msg:
-            LOG.warning("Chrome cookies locked. Retrying without cookies...")
-            fallback_opts = dict(ydl_opts)
-            fallback_opts.pop("cookiesfrombrowser", None)
-            fallback_opts.pop("cookiefile", None)
-            try:
-                with YoutubeDL(fallback_opts) as ydl:
-                    info = ydl.extract_info(url, download=False)
-                    if isinstance(info, dict) and info.get("entries"):
-                        return info["entries"][0]
-                    return info
-            except UnsupportedError:
-                raise HTTPException(status_code=400, detail="This website is not currently supported.")
-            except Exception as e2:
-                if "Unsupported URL" in str(e2):
-                    raise HTTPException(status_code=400, detail="This website is not currently supported.")
-                raise e2
-        if "Unsupported URL" in msg:
+        url_precheck.remember_failure(url, e)
+        if "UnsupportedError" in url_precheck.error_classes(e) or "Unsupported URL" in str(e):
             raise HTTPException(status_code=400, detail="This website is not currently supported.")
         raise e
 
@@ -205,19 +116,8 @@ def _detect_content_type(url: str, info: dict):
     return platform, content_type
 
 
-def _run_ffmpeg_filter(input_path: str, output_path: str, filter_complex: str, download_id: str):
-    cmd = ["ffmpeg", "-y", "-i", input_path, "-af", filter_complex, "-vn", output_path]
-    p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    _register_process(download_id, p)
-    stdout, stderr = p.communicate()
-    if p.returncode != 0:
-        msg = stderr.decode(errors="ignore")[:1000]
-        raise RuntimeError(f"ffmpeg filter failed: {msg}")
-    _register_tmpfile(download_id, output_path)
-
-
 # ---------- ENDPOINTS ----------
-@app.post("/info")
+@router.post("/info")
 async def info_endpoint(payload: dict = Body(...)):
     raw_url = (payload.get("url") or "").strip()
     LOG.info("Incoming /info raw_url=%s", raw_url)
@@ -225,7 +125,6 @@ async def info_endpoint(payload: dict = Body(...)):
         raise HTTPException(status_code=400, detail="Missing url")
     url = _clean_url(raw_url)
     LOG.info("Using cleaned URL: %s", url)
-    cookie_file = "cookies.txt"
 
     try:
         ydl_opts = {
@@ -233,13 +132,13 @@ async def info_endpoint(payload: dict = Body(...)):
             "no_warnings": True,
             "noplaylist": True,
             "force_ipv4": True,
-            "cookiesfrombrowser": ("chrome",),
         }
-        if os.path.exists(cookie_file):
-            ydl_opts["cookiefile"] = cookie_file
 
-        info = _extract_info_with_cookie_fallback(ydl_opts, url)
-        platform, content_type = _detect_content_type(url, info)
+        async with scheduler.slot(scheduler.platform_for_url(url), "extract"):
+            with metrics.extraction_timer() as timer:
+                info = await profiling.run_in_threadpool(_extract_info_with_cookies, ydl_opts, url)
+                platform, content_type = _detect_content_type(url, info)
+                timer.platform = platform
 
         formats = info.get("formats") or []
         best_mp4 = None
@@ -276,82 +175,81 @@ async def info_endpoint(payload: dict = Body(...)):
         raise HTTPException(status_code=400, detail=str(e))
 
 
-@app.get("/proxy-image")
-def proxy_image_endpoint(url: str):
+@router.get("/metrics")
+def metrics_endpoint():
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@router.get("/proxy-image")
+async def proxy_image_endpoint(
+    url: str,
+    request: Request,
+    width: Optional[int] = Query(None, ge=16, le=4096),
+    fmt: Optional[str] = Query(None, alias="format", pattern="^(webp|jpeg)$"),
+):
+    """The image at `url`; with `width`/`format`, a resized WebP/JPEG variant (see thumbnails.py)."""
     if not url:
         return Response(status_code=404)
-    try:
-        headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"}
-        resp = requests.get(url, headers=headers, stream=True, timeout=10)
-        if resp.status_code == 200:
-            return Response(content=resp.content, media_type="image/jpeg")
-        return Response(status_code=404)
-    except Exception:
-        return Response(status_code=404)
+    headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"}
+    return await thumbnails.proxy_image(url, width, fmt, request.headers.get("accept", ""), headers)
 
 
 # ---------- AI MUSIC (local FFmpeg-based variations) ----------
-@app.post("/generate-music")
+def _download_music_input(ydl_opts: dict, url: str, job_id: str):
+    with job_stage(job_id, "download"), youtube_dl(ydl_opts) as ydl:
+        ydl.download([url])
+
+
+def _save_music_upload(file: UploadFile, input_path: Path, job_id: str):
+    with job_stage(job_id, "upload"), open(input_path, "wb") as buffer:
+        shutil.copyfileobj(file.file, buffer)
+
+
+@router.post("/generate-music")
 async def generate_music(
     url: Optional[str] = Form(None),
-    file: Optional[UploadFile] = File(None)
+    file: Optional[UploadFile] = File(None),
+    job_id: Optional[str] = Form(None),
 ):
     if not url and not file:
         raise HTTPException(status_code=400, detail="Provide a URL or File")
 
-    job_id = f"gen_{uuid.uuid4().hex}"
+    job_id = new_job_id("gen", job_id)
     tmpdir = Path(tempfile.gettempdir()) / "fetch_helper_ai"
     tmpdir.mkdir(parents=True, exist_ok=True)
     input_path = tmpdir / f"{job_id}_input.mp3"
 
+    if url and not file:
+        # reject unsupported/recently failed links before creating any job state
+        await profiling.run_in_threadpool(url_precheck.precheck, _clean_url(url))
+
+    source_url = None
     try:
         if file:
-            with open(input_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
+            await profiling.run_in_threadpool(_save_music_upload, file, input_path, job_id)
             _register_tmpfile(job_id, str(input_path))
         else:
             clean_url = _clean_url(url)
+            source_url = clean_url
             ydl_opts = {
                 "format": "bestaudio/best",
                 "outtmpl": str(input_path),
                 "quiet": True,
                 "no_warnings": True,
-                "cookiesfrombrowser": ("chrome",),
             }
-            if os.path.exists("cookies.txt"):
-                ydl_opts["cookiefile"] = "cookies.txt"
 
-            try:
-                with YoutubeDL(ydl_opts) as ydl:
-                    ydl.download([clean_url])
-            except Exception:
-                if "cookiesfrombrowser" in ydl_opts: del ydl_opts["cookiesfrombrowser"]
-                if "cookiefile" in ydl_opts: del ydl_opts["cookiefile"]
-                with YoutubeDL(ydl_opts) as ydl:
-                    ydl.download([clean_url])
+            if await profiling.run_in_threadpool(music_render.adopt_input, clean_url, input_path):
+                LOG.info("Music input for %s reused from an earlier job", clean_url)
+            else:
+                async with admission.admit("download"), \
+                        scheduler.slot(scheduler.platform_for_url(clean_url), "download"):
+                    await profiling.run_in_threadpool(_download_music_input, ydl_opts, clean_url, job_id)
+                if input_path.exists():
+                    metrics.DOWNLOADED_BYTES.inc(input_path.stat().st_size, source="music_input")
             _register_tmpfile(job_id, str(input_path))
 
-        # generate five variations using ffmpeg DSP filters
-        variations = []
-        p1 = tmpdir / f"{job_id}_lofi.mp3"
-        _run_ffmpeg_filter(str(input_path), str(p1), "atempo=0.85,lowpass=f=3000", job_id)
-        variations.append({"id": "lofi", "name": "Lo-Fi Slow", "desc": "Chill, Relaxed, Slowed", "file": str(p1)})
-
-        p2 = tmpdir / f"{job_id}_nightcore.mp3"
-        _run_ffmpeg_filter(str(input_path), str(p2), "atempo=1.25,asetrate=44100*1.1", job_id)
-        variations.append({"id": "nightcore", "name": "Nightcore", "desc": "Fast, Energetic, High Pitch", "file": str(p2)})
-
-        p3 = tmpdir / f"{job_id}_bass.mp3"
-        _run_ffmpeg_filter(str(input_path), str(p3), "bass=g=15:f=110:w=0.6", job_id)
-        variations.append({"id": "bass", "name": "Bass Boosted", "desc": "Heavy Bass, Club Vibe", "file": str(p3)})
-
-        p4 = tmpdir / f"{job_id}_reverb.mp3"
-        _run_ffmpeg_filter(str(input_path), str(p4), "aecho=0.8:0.9:1000:0.3", job_id)
-        variations.append({"id": "reverb", "name": "Ethereal", "desc": "Spacious, Dreamy, Echo", "file": str(p4)})
-
-        p5 = tmpdir / f"{job_id}_retro.mp3"
-        _run_ffmpeg_filter(str(input_path), str(p5), "acrusher=level_in=8:level_out=18:bits=8:mode=log:aa=1", job_id)
-        variations.append({"id": "retro", "name": "8-Bit Retro", "desc": "Crunchy, Old School, Arcade", "file": str(p5)})
+        # variations render in the background / on first play (music_render)
+        variations = await music_render.start(job_id, input_path, tmpdir, source_url)
 
         return {
             "job_id": job_id,
@@ -361,14 +259,44 @@ async def generate_music(
                 for v in variations
             ],
         }
+    except HTTPException:
+        _cleanup_registry(job_id)
+        raise
     except Exception as e:
         LOG.exception("AI Gen Error")
         _cleanup_registry(job_id)
         raise HTTPException(status_code=500, detail=f"Generation failed: {str(e)}")
 
 
-@app.get("/stream-generated/{job_id}/{var_id}")
-async def stream_generated(job_id: str, var_id: str):
+@router.get("/jobs")
+async def jobs_by_label(label: str):
+    """Ids of the live jobs a client labelled `label` (the id it sent with the request)."""
+    return {"label": label, "job_ids": find_jobs(label)}
+
+
+@router.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    """Stage timings and live ffmpeg progress for a generation/enhance job."""
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return job
+
+
+@router.get("/stream-generated/{job_id}/{var_id}")
+async def stream_generated(job_id: str, var_id: str, request: Request):
+    # unstarted: render now, ahead of the background queue (503 when transcode slots are saturated)
+    await music_render.render_on_demand(job_id, var_id)
+    if music_render.state(job_id, var_id) == "running":
+        if music_render.is_preview_request(request.headers.get("range")):
+            # play while it renders; the finished file (with Range support) is served from the next request on
+            return StreamingResponse(music_render.tail(job_id, var_id), media_type="audio/mpeg",
+                                     headers={"Cache-Control": "no-store"})
+        try:  # a seek into the unfinished part: wait for the render
+            await music_render.wait_rendered(job_id, var_id)
+        except RuntimeError as e:
+            raise HTTPException(status_code=500, detail=f"Generation failed: {e}")
+    # FileResponse answers Range / If-Range requests (206, 416) itself
     tmpdir = Path(tempfile.gettempdir()) / "fetch_helper_ai"
     filename = f"{job_id}_{var_id}.mp3"
     path = tmpdir / filename
@@ -377,70 +305,216 @@ async def stream_generated(job_id: str, var_id: str):
     return Response(status_code=404)
 
 
+@router.get("/peaks-generated/{job_id}/{var_id}")
+async def peaks_generated(job_id: str, var_id: str, width: int = 1000):
+    """Waveform peaks (audiowaveform .dat, 8-bit) of a variation, or of the input with var_id=original."""
+    tmpdir = Path(tempfile.gettempdir()) / "fetch_helper_ai"
+    if var_id == "original":
+        path = tmpdir / f"{job_id}_input.mp3"
+    else:
+        try:  # renders it now if nobody has started it
+            await music_render.wait_rendered(job_id, var_id)
+        except RuntimeError as e:
+            raise HTTPException(status_code=500, detail=f"Generation failed: {e}")
+        path = tmpdir / f"{job_id}_{var_id}.mp3"
+    if not path.exists():
+        return Response(status_code=404)
+    try:
+        if not waveform.cached(str(path)):
+            async with admission.admit("transcode"):
+                await profiling.run_in_threadpool(waveform.compute, str(path), job_id)
+        data = await profiling.run_in_threadpool(waveform.read_level, str(path), max(1, width))
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=f"Waveform failed: {e}")
+    return Response(data, media_type="application/octet-stream", headers={"Cache-Control": "private, max-age=3600"})
+
+
 # ---------- VIDEO ENHANCER (remote-forwarding with local fallback) ----------
 def _local_upscale(input_p: str, output_p: str, job_id: str):
     """
     Local fallback: apply sharpening + scale (FFmpeg).
     Blocking call (keeps behavior simple).
     """
-    filter_cmd = "unsharp=5:5:1.0:5:5:0.0,scale=1920:-2"
     cmd = [
         "ffmpeg", "-y",
         "-i", input_p,
-        "-vf", filter_cmd,
-        "-c:v", "libx264", "-preset", "fast", "-crf", "23",
+        "-vf", LOCAL_ENHANCE_FILTER,
+        *LOCAL_ENHANCE_ENCODER_ARGS,
         "-c:a", "copy",
         output_p
     ]
-    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    _register_process(job_id, process)
-    stdout, stderr = process.communicate()
-    if process.returncode != 0:
-        raise RuntimeError(f"FFmpeg failed: {stderr.decode(errors='ignore')[:200]}")
+    rc, stderr = run_ffmpeg(cmd, job_id, "enhance")
+    if rc != 0:
+        raise RuntimeError(f"FFmpeg failed: {stderr[-200:]}")
+
+
+def _local_enhance(input_p: str, output_p: str, job_id: str, chunked: Optional[bool] = None) -> bool:
+    """
+    Segment-parallel enhance when worthwhile, otherwise (or if it fails) the single-process
+    `_local_upscale`. Returns whether the output came from the chunked path.
+    """
+    with job_stage(job_id, "transcode"):
+        if LOCAL_ENHANCE_CHUNKED if chunked is None else chunked:
+            try:
+                enhance_chunked(input_p, output_p, job_id)
+                return True
+            except ChunkingUnavailable as e:
+                LOG.info("Chunked enhance not used for %s: %s", job_id, e)
+            except RuntimeError as e:
+                LOG.warning("Chunked enhance of %s failed (%s); retrying in one process", job_id, e)
+        _local_upscale(input_p, output_p, job_id)
+        return False
+
+
+async def _enhance_video_stream(job_id: str, input_path: Path, output_path: Path, input_digest: str, filename: str,
+                                cache_keys: tuple, claimed: Optional[str] = None) -> dict:
+    hls_key = result_cache.recipe_key(input_digest, local_enhance_hls_recipe())
+    result = {
+        "job_id": job_id,
+        "playlist_url": f"/enhanced/{job_id}/{hls_enhance.HLS_PLAYLIST}",
+        "mp4_url": f"/enhanced/{job_id}/video.mp4",
+        "progress_url": f"/jobs/{job_id}",
+    }
+    for key in (hls_key, *cache_keys):
+        cached = result_cache.lookup(key, "mp4")
+        if cached:
+            LOG.info("Enhancement cache hit for job %s", job_id)
+            result_cache.materialize(cached, str(output_path))
+            _register_tmpfile(job_id, str(output_path))
+            hls_enhance.finished(job_id, output_path, filename)
+            return {**result, "playlist_url": None, "ready": True}
+    try:
+        await hls_enhance.start(job_id, input_path, output_path, hls_key, filename)
+    except Exception:
+        await uploads.restore(claimed)
+        _cleanup_registry(job_id)
+        raise
+    return {**result, "ready": False}
 
 
-@app.post("/enhance-video")
-async def enhance_video(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
+@router.get("/enhanced/{job_id}/{name}")
+async def enhanced_output(job_id: str, name: str):
+    """Playlist and segments of a streaming /enhance-video job, or its MP4 (video.mp4) once the encode is done."""
+    enc = hls_enhance.get(job_id)
+    if enc is None:
+        return Response(status_code=404)
+    if name == "video.mp4":
+        if enc.state == "running":
+            raise HTTPException(status_code=409, detail="Still encoding; play the playlist or retry later",
+                                headers={"Retry-After": "10"})
+        if enc.state == "failed":
+            raise HTTPException(status_code=500, detail=f"Enhancement failed: {enc.error}")
+        return FileResponse(enc.output_path, filename=f"enhanced_{enc.filename}", media_type="video/mp4")
+    path = hls_enhance.segment_path(enc, name)
+    if path is None:
+        return Response(status_code=404)
+    if name == hls_enhance.HLS_PLAYLIST:
+        path = await hls_enhance.wait_for_playlist(enc)
+        if path is None:
+            if enc.state == "failed":
+                raise HTTPException(status_code=500, detail=f"Enhancement failed: {enc.error}")
+            return Response(status_code=404)
+        # the playlist grows until #EXT-X-ENDLIST: players must re-fetch it
+        return FileResponse(path, media_type=hls_enhance.MEDIA_TYPES[".m3u8"], headers={"Cache-Control": "no-cache"})
+    if not path.exists():
+        return Response(status_code=404)
+    return FileResponse(path, media_type=hls_enhance.MEDIA_TYPES[path.suffix],
+                        headers={"Cache-Control": "private, max-age=3600"})
+
+
+@router.post("/enhance-video")
+async def enhance_video(
+    background_tasks: BackgroundTasks,
+    file: Optional[UploadFile] = File(None),
+    upload_id: Optional[str] = Form(None),
+    chunked: Optional[bool] = Form(None),
+    stream: Optional[bool] = Form(None),
+    job_id: Optional[str] = Form(None),
+):
     """
     Attempts to forward the uploaded file to remote COLAB_GPU_URL (if configured).
-    If remote is not configured or fails, falls back to a local FFmpeg-based enhancer.
+    If remote is not configured or fails, falls back to a local FFmpeg-based enhancer
+    (segment-parallel unless `chunked=false`). Takes either a multipart `file` or the
+    `upload_id` of a resumable upload (/uploads).
+
+    With `stream=true` the local encoder writes HLS segments instead and the response is
+    JSON with a playlist URL that plays while the encode runs (see hls_enhance.py).
     """
-    job_id = f"enhance_{uuid.uuid4().hex}"
+    import requests
+    if not file and not upload_id:
+        raise HTTPException(status_code=400, detail="Provide a file or an upload_id")
+    job_id = new_job_id("enhance", job_id)
     tmpdir = Path(tempfile.gettempdir()) / "fetch_helper_ai"
     tmpdir.mkdir(parents=True, exist_ok=True)
 
     input_path = tmpdir / f"{job_id}_input.mp4"
     output_path = tmpdir / f"{job_id}_enhanced.mp4"
 
-    # Save upload locally
+    # Save upload locally (hashing in the same pass for the result cache); a resumable upload is just moved
+    claimed = None  # upload_id once this request holds the upload; put back if processing fails
     try:
-        with open(input_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        if upload_id:
+            input_digest, filename = await uploads.claim(upload_id, input_path)
+            claimed = upload_id
+        else:
+            with job_stage(job_id, "upload"):
+                input_digest = await profiling.run_in_threadpool(result_cache.copy_and_hash, file.file,
+                                                                 str(input_path))
+            filename = file.filename
         _register_tmpfile(job_id, str(input_path))
+    except HTTPException:
+        raise
     except Exception as e:
         LOG.exception("Failed saving uploaded file")
         raise HTTPException(status_code=500, detail=f"Failed to save upload: {e}")
 
+    remote_key = result_cache.recipe_key(input_digest, remote_enhance_recipe())
+    local_key = result_cache.recipe_key(input_digest, local_enhance_recipe())
+    chunked_key = result_cache.recipe_key(input_digest, local_enhance_chunked_recipe())
+
     # If COLAB_GPU_URL is configured (looks like an http(s) URL), try forwarding
-    if isinstance(globals().get("COLAB_GPU_URL"), str) and COLAB_GPU_URL.strip() and COLAB_GPU_URL.startswith("http"):
+    remote_configured = isinstance(globals().get("COLAB_GPU_URL"), str) and COLAB_GPU_URL.strip() and COLAB_GPU_URL.startswith("http")
+    if stream:  # the remote GPU only returns whole files: stream from the local encoder
+        cache_keys = (remote_key, local_key, chunked_key) if remote_configured else (local_key, chunked_key)
+        return await _enhance_video_stream(job_id, input_path, output_path, input_digest, filename, cache_keys,
+                                           claimed)
+    for key in ((remote_key, local_key, chunked_key) if remote_configured else (local_key, chunked_key)):
+        cached = result_cache.lookup(key, "mp4")
+        if cached:
+            LOG.info("Enhancement cache hit for job %s", job_id)
+            result_cache.materialize(cached, str(output_path))
+            _register_tmpfile(job_id, str(output_path))
+            background_tasks.add_task(_cleanup_registry, job_id)
+            return FileResponse(output_path, filename=f"enhanced_{filename}", media_type="video/mp4",
+                                headers={"X-Job-Id": job_id})
+
+    if remote_configured:
         remote_url = COLAB_GPU_URL.rstrip("/") + "/enhance-video-ai"
         LOG.info("Forwarding enhancement job %s to remote GPU at %s", job_id, remote_url)
         try:
-            with open(input_path, "rb") as f:
-                resp = requests.post(remote_url, files={"file": f}, timeout=600)
+            async with admission.admit("remote_gpu"):
+                with job_stage(job_id, "remote_gpu"), metrics.remote_gpu_timer("enhance-video-ai") as timer, \
+                        open(input_path, "rb") as f:
+                    resp = await profiling.run_in_threadpool(requests.post, remote_url, files={"file": f}, timeout=600)
+                    timer.status = resp.status_code
         except requests.exceptions.RequestException as e:
             LOG.warning("Remote Colab unreachable: %s — falling back to local processing", e)
             resp = None
+        except HTTPException as e:  # remote GPU queue full: the local transcode class decides
+            LOG.info("Remote GPU busy (%s) — falling back to local processing", e.detail)
+            resp = None
 
         if resp and resp.status_code == 200:
             try:
-                with open(output_path, "wb") as out:
-                    out.write(resp.content)
+                await profiling.run_in_threadpool(output_path.write_bytes, resp.content)
                 _register_tmpfile(job_id, str(output_path))
+                result_cache.store(remote_key, "mp4", str(output_path))
                 background_tasks.add_task(_cleanup_registry, job_id)
-                return FileResponse(output_path, filename=f"enhanced_{file.filename}", media_type="video/mp4")
+                return FileResponse(output_path, filename=f"enhanced_{filename}", media_type="video/mp4",
+                                    headers={"X-Job-Id": job_id})
             except Exception as e:
                 LOG.exception("Failed to write remote response")
+                await uploads.restore(claimed)
                 _cleanup_registry(job_id)
                 raise HTTPException(status_code=500, detail=f"Failed to save remote enhanced file: {e}")
         else:
@@ -448,11 +522,58 @@ async def enhance_video(background_tasks: BackgroundTasks, file: UploadFile = Fi
 
     # Local fallback
     try:
-        _local_upscale(str(input_path), str(output_path), job_id)
+        async with admission.admit("transcode"):
+            used_chunks = await profiling.run_in_threadpool(_local_enhance, str(input_path), str(output_path), job_id,
+                                                            chunked=chunked)
         _register_tmpfile(job_id, str(output_path))
+        result_cache.store(chunked_key if used_chunks else local_key, "mp4", str(output_path))
         background_tasks.add_task(_cleanup_registry, job_id)
-        return FileResponse(output_path, filename=f"enhanced_{file.filename}", media_type="video/mp4")
+        return FileResponse(output_path, filename=f"enhanced_{filename}", media_type="video/mp4",
+                            headers={"X-Job-Id": job_id})
+    except HTTPException:
+        await uploads.restore(claimed)
+        _cleanup_registry(job_id)
+        raise
     except Exception as e:
         LOG.exception("Enhancement Error")
+        await uploads.restore(claimed)
         _cleanup_registry(job_id)
         raise HTTPException(status_code=500, detail=f"Enhancement failed: {str(e)}")
+
+
+# ---------- APP ----------
+def create_app(warm_up: Optional[bool] = None) -> FastAPI:
+    """
+    Build the app (`uvicorn --factory app.media_studio:create_app`; `app.media_studio:app` still works).
+    `warm_up` (default FETCH_HELPER_WARMUP) preloads yt_dlp & co. after startup.
+    """
+    app = FastAPI(title="Media Studio (Merged)", lifespan=startup.lifespan(warm_up))
+
+    # Allow CORS during dev; narrow origins in production
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=[
+            "http://localhost:3000",
+            "http://127.0.0.1:3000",
+            "http://localhost:5173",
+            "http://127.0.0.1:5173",
+            "http://localhost:8000",
+        ],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    app.add_middleware(metrics.MetricsMiddleware)
+    app.add_middleware(profiling.ProfilingMiddleware)
+    app.include_router(profiling.router)
+    app.include_router(cookies.router)
+    app.include_router(scheduler.router)
+    app.include_router(extract_pool.router)
+    app.include_router(admission.router)
+    app.include_router(fingerprint.router)
+    app.include_router(uploads.router)
+    app.include_router(router)
+    return app
+
+
+app = create_app()
@@ -0,0 +1,288 @@
+# backend/app/metrics.py
+"""
+Minimal Prometheus text-format metrics for the media apps (no client library needed).
+
+Label values are always drawn from small fixed sets: routes are the route
+templates ("/stream-generated/{job_id}/{var_id}", never the raw path),
+platforms are folded into KNOWN_PLATFORMS + "Other", remote endpoints and
+disk areas are fixed names. Gauges that need a scan (processes, disk usage)
+are computed at scrape time.
+"""
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from .registry import PROCESS_REGISTRY, PROCESS_REGISTRY_LOCK
+
+# ---------- CONFIG ----------
+KNOWN_PLATFORMS = ("YouTube", "Instagram", "TikTok", "X (Twitter)", "Facebook", "Imgur")
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+DISK_USAGE_TTL = 15.0  # seconds between directory scans
+
+_TMP = Path(tempfile.gettempdir())
+DISK_AREAS: Dict[str, Callable[[], Iterable[Path]]] = {
+    "ai_tmp": lambda: [_TMP / "fetch_helper_ai"],
+    "colab_tmp": lambda: [_TMP / "fetch_ai_cache"],
+    "download_tmp": lambda: _TMP.glob("vd_*"),
+    "cache": lambda: [_TMP / "fetch_helper_cache"],
+}
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, doc: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.doc = doc
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        METRICS.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labels)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_fmt_labels(self.labels, k)} {v}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, doc: str, labels: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, doc, labels)
+        self.buckets = tuple(buckets)
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, (list(s[0]), s[1], s[2])) for k, s in self._values.items())
+        lines = self.header()
+        for key, (counts, total, n) in items:
+            for b, c in zip(self.buckets, counts):
+                le = 'le="%s"' % b
+                lines.append(f"{self.name}_bucket{_fmt_labels(self.labels, key, le)} {c}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_fmt_labels(self.labels, key, le)} {n}")
+            lines.append(f"{self.name}_sum{_fmt_labels(self.labels, key)} {total}")
+            lines.append(f"{self.name}_count{_fmt_labels(self.labels, key)} {n}")
+        return lines
+
+
+class Gauge(_Metric):
+    """Scrape-time gauge: `collect()` returns {label-values-tuple: value}."""
+    kind = "gauge"
+
+    def __init__(self, name: str, doc: str, labels: Tuple[str, ...], collect: Callable[[], Dict[Tuple[str, ...], float]]):
+        super().__init__(name, doc, labels)
+        self.collect = collect
+
+    def render(self) -> List[str]:
+        try:
+            values = self.collect()
+        except Exception:
+            values = {}
+        return self.header() + [f"{self.name}{_fmt_labels(self.labels, k)} {v}" for k, v in sorted(values.items())]
+
+
+METRICS: List[_Metric] = []
+
+
+def platform_label(platform: Optional[str]) -> str:
+    return platform if platform in KNOWN_PLATFORMS else "Other"
+
+
+# ---------- COLLECTORS ----------
+def _collect_processes() -> Dict[Tuple[str, ...], float]:
+    with PROCESS_REGISTRY_LOCK:
+        procs = [p for entry in PROCESS_REGISTRY.values() for p in entry.get("processes", [])]
+        jobs = len(PROCESS_REGISTRY)
+    running = 0
+    for p in procs:
+        try:
+            if p.poll() is None:
+                running += 1
+        except Exception:
+            pass
+    return {("running",): running, ("registered_jobs",): jobs}
+
+
+_disk_cache: Dict[str, float] = {}
+_disk_cache_at = 0.0
+_disk_lock = threading.Lock()
+
+
+def _dir_size(path: Path) -> int:
+    if path.is_file():
+        return path.stat().st_size
+    total = 0
+    for root, _dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def _collect_disk() -> Dict[Tuple[str, ...], float]:
+    global _disk_cache_at
+    with _disk_lock:
+        if time.monotonic() - _disk_cache_at > DISK_USAGE_TTL:
+            usage = {}
+            for area, paths in DISK_AREAS.items():
+                total = 0
+                for p in paths():
+                    try:
+                        if p.exists():
+                            total += _dir_size(p)
+                    except OSError:
+                        pass
+                usage[area] = total
+            _disk_cache.clear()
+            _disk_cache.update(usage)
+            _disk_cache_at = time.monotonic()
+        return {(k,): v for k, v in _disk_cache.items()}
+
+
+# ---------- METRICS ----------
+HTTP_REQUEST_SECONDS = Histogram(
+    "media_http_request_duration_seconds", "HTTP request latency by route template.",
+    ("method", "route", "status"))
+HTTP_SERVED_BYTES = Counter(
+    "media_http_response_bytes_total", "Response body bytes sent, by route template.", ("route",))
+EXTRACT_SECONDS = Histogram(
+    "media_ytdlp_extract_duration_seconds", "yt-dlp metadata extraction time by platform.",
+    ("platform", "outcome"))
+DOWNLOADED_BYTES = Counter(
+    "media_downloaded_bytes_total", "Bytes fetched from media platforms.", ("source",))
+REMOTE_GPU_SECONDS = Histogram(
+    "media_remote_gpu_request_duration_seconds", "Remote GPU (Colab) call latency.",
+    ("endpoint", "outcome"))
+REMOTE_GPU_ERRORS = Counter(
+    "media_remote_gpu_errors_total", "Remote GPU calls that failed or returned non-200.",
+    ("endpoint", "reason"))
+Gauge("media_subprocesses", "Child processes and jobs tracked in PROCESS_REGISTRY.", ("state",), _collect_processes)
+Gauge("media_disk_usage_bytes", "Disk used by temp and cache areas.", ("area",), _collect_disk)
+
+
+def render() -> str:
+    lines: List[str] = []
+    for m in METRICS:
+        lines.extend(m.render())
+    return "\n".join(lines) + "\n"
+
+
+class _Timer:
+    def __init__(self):
+        self.platform: Optional[str] = None
+        self.status: Optional[int] = None
+
+
+@contextmanager
+def extraction_timer():
+    """Times a yt-dlp extraction; set `.platform` inside the block once it is known."""
+    t = _Timer()
+    t0 = time.perf_counter()
+    outcome = "error"
+    try:
+        yield t
+        outcome = "ok"
+    finally:
+        EXTRACT_SECONDS.observe(time.perf_counter() - t0, platform=platform_label(t.platform), outcome=outcome)
+
+
+@contextmanager
+def remote_gpu_timer(endpoint: str):
+    """Times a remote GPU call; set `.status` to the HTTP status inside the block."""
+    t = _Timer()
+    t0 = time.perf_counter()
+    outcome = "connect_error"
+    try:
+        yield t
+        outcome = "ok" if t.status == 200 else "http_error"
+    finally:
+        REMOTE_GPU_SECONDS.observe(time.perf_counter() - t0, endpoint=endpoint, outcome=outcome)
+        if outcome != "ok":
+            REMOTE_GPU_ERRORS.inc(endpoint=endpoint, reason=outcome)
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware (does not buffer streaming/file responses)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        t0 = time.perf_counter()
+        status = {"code": 500}
+        sent = {"bytes": 0}
+
+        async def counting_send(message):
+            mtype = message["type"]
+            if mtype == "http.response.start":
+                status["code"] = message["status"]
+            elif mtype == "http.response.body":
+                sent["bytes"] += len(message.get("body", b""))
+            elif mtype == "http.response.pathsend":
+                try:
+                    sent["bytes"] += os.path.getsize(message["path"])
+                except OSError:
+                    pass
+            await send(message)
+
+        try:
+            await self.app(scope, receive, counting_send)
+        finally:
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - t0, method=scope.get("method", ""), route=route,
+                status=f"{status['code'] // 100}xx")
+            HTTP_SERVED_BYTES.inc(sent["bytes"], route=route)
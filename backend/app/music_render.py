@@ -0,0 +1,344 @@
+# backend/app/music_render.py
+"""
+Lazy rendering of the /generate-music variations.
+
+/generate-music used to render every MUSIC_VARIATIONS entry before answering,
+while most users play one or two. It now only ingests the input and calls
+`start()`; the stream URLs work right away and each variation is rendered at
+most once per job:
+
+  * in the background, by MUSIC_RENDER_WORKERS threads shared by all jobs,
+    in MUSIC_PRIORITY order (every job's first choice before anyone's
+    second, older jobs first within a rank). Each background render holds a
+    transcode admission slot, but only takes one that is idle with nobody
+    queued, so requests always go first and never get a 503 on its account;
+  * on demand, when /stream-generated asks for one that nobody has started:
+    that request renders it itself instead of waiting for its turn;
+  * requests for a variation that is already rendering wait for that render
+    (`wait_rendered()`, on the event loop, no thread held) instead of
+    starting another ffmpeg.
+
+With MUSIC_PRERENDER off (FETCH_HELPER_MUSIC_PRERENDER=0) nothing renders in
+the background, so variations nobody plays never cost an ffmpeg run. Renders
+reuse/fill result_cache as before and are written under a temp name, so a
+half-written file is never served. Jobs are forgotten after MUSIC_JOB_TTL.
+
+Cache keys use the input's fingerprint.canonical_digest(), so another
+upload or link of an already processed recording reuses its variations, and
+a link that was resolved before reuses the cached input (`adopt_input()`)
+without downloading it again.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from . import admission, fingerprint, metrics, profiling, result_cache
+from .presets import MUSIC_ENCODER_ARGS, MUSIC_OUTPUT_EXT, MUSIC_VARIATIONS, music_variation_recipe
+from .progress import job_stage, run_ffmpeg
+from .registry import register_tmpfile
+
+LOG = logging.getLogger("media_studio")
+
+# ---------- CONFIG ----------
+MUSIC_PRERENDER = os.environ.get("FETCH_HELPER_MUSIC_PRERENDER", "1") == "1"
+MUSIC_RENDER_WORKERS = int(os.environ.get("FETCH_HELPER_MUSIC_RENDER_WORKERS",
+                                          str(max(1, (os.cpu_count() or 1) // 2))))
+# variation ids, most likely played first; ids not listed keep their MUSIC_VARIATIONS order after these
+MUSIC_PRIORITY = [v for v in os.environ.get("FETCH_HELPER_MUSIC_PRIORITY", "").split(",") if v]
+MUSIC_JOB_TTL = 3600.0
+MUSIC_RENDER_WAIT = 600.0  # longest a request waits on someone else's render
+MUSIC_SLOT_POLL = 0.5  # seconds between a background worker's looks for an idle transcode slot
+TAIL_CHUNK = 64 * 1024
+TAIL_POLL = 0.05  # seconds between looks at a growing render
+RENDER_POLL = 0.1  # seconds between a waiting request's looks at someone else's render
+
+_INPUT_RECIPE = {"op": "music-input"}  # result_cache entry of a track's downloaded input
+
+RENDERS = metrics.Counter(
+    "media_music_renders_total", "Music variation renders by trigger and outcome.", ("trigger", "outcome"))
+
+
+class _Job:
+    def __init__(self, job_id: str, input_path: Path, tmpdir: Path, digest: str,
+                 loop: asyncio.AbstractEventLoop):
+        self.job_id = job_id
+        self.loop = loop  # the event loop admission runs on
+        self.input_path = input_path
+        self.tmpdir = tmpdir
+        self.digest = digest
+        self.created = time.monotonic()
+        self.renders: Dict[str, "_Render"] = {}
+
+
+class _Render:
+    def __init__(self, job: _Job, variation: dict, rank: int):
+        self.job = job
+        self.variation = variation
+        self.rank = rank
+        self.path = job.tmpdir / f"{job.job_id}_{variation['id']}.{MUSIC_OUTPUT_EXT}"
+        self.part = self.path.with_name(f".{self.path.stem}.part{self.path.suffix}")  # ffmpeg writes here
+        self.state = "pending"  # -> running -> done | failed (a failed render may be retried)
+        self.error: Optional[str] = None
+        self.done = threading.Event()
+
+
+_JOBS: Dict[str, _Job] = {}
+_LOCK = threading.Lock()
+_QUEUE: List[Tuple[int, int, _Render]] = []  # (rank, seq, render) heap
+_QUEUE_COND = threading.Condition(_LOCK)
+_SEQ = itertools.count()
+_WORKERS: List[threading.Thread] = []
+
+
+def _ranked() -> List[dict]:
+    order = {vid: i for i, vid in enumerate(MUSIC_PRIORITY)}
+    return sorted(MUSIC_VARIATIONS, key=lambda v: order.get(v["id"], len(order)))
+
+
+def _prune_locked(now: float):
+    for job_id in [j.job_id for j in _JOBS.values() if now - j.created > MUSIC_JOB_TTL]:
+        del _JOBS[job_id]  # queued renders of it are skipped by the workers
+
+
+def _claim(render: _Render) -> bool:
+    """Take over a render nobody is working on; the caller must then run `_render`."""
+    with _LOCK:
+        if render.state not in ("pending", "failed"):
+            return False
+        render.state = "running"
+        render.done.clear()
+        return True
+
+
+def _render(render: _Render, trigger: str):
+    job, v = render.job, render.variation
+    outcome = "failed"
+    try:
+        key = result_cache.recipe_key(job.digest, music_variation_recipe(v))
+        cached = result_cache.lookup(key, MUSIC_OUTPUT_EXT)
+        if cached:
+            result_cache.materialize(cached, str(render.path))
+            outcome = "cached"
+        else:
+            part = render.part
+            cmd = ["ffmpeg", "-y", "-i", str(job.input_path), "-af", v["filter"], *MUSIC_ENCODER_ARGS, "-vn",
+                   str(part)]
+            with job_stage(job.job_id, "transcode"):
+                rc, stderr = run_ffmpeg(cmd, job.job_id, f"filter {render.path.stem}")
+            if rc != 0:
+                try:
+                    part.unlink()
+                except OSError:
+                    pass
+                raise RuntimeError(f"ffmpeg filter failed: {stderr[-1000:]}")
+            os.replace(part, render.path)
+            result_cache.store(key, MUSIC_OUTPUT_EXT, str(render.path))
+            outcome = "rendered"
+        register_tmpfile(job.job_id, str(render.path))
+        state, error = "done", None
+    except Exception as e:
+        LOG.warning("music variation %s of %s failed: %s", v["id"], job.job_id, e)
+        state, error = "failed", str(e)
+    RENDERS.inc(trigger=trigger, outcome=outcome)
+    with _LOCK:
+        render.state, render.error = state, error
+        render.done.set()
+
+
+def _idle_slot(render: _Render) -> Optional[admission.admit]:
+    """Blocking: wait for an idle transcode slot on the job's loop (None once the job is gone)."""
+    slot = admission.admit("transcode")
+    while True:
+        with _LOCK:
+            if _JOBS.get(render.job.job_id) is not render.job or render.state not in ("pending", "failed"):
+                return None
+        try:
+            if asyncio.run_coroutine_threadsafe(slot.try_acquire(), render.job.loop).result():
+                return slot
+        except RuntimeError:  # the loop has shut down
+            return None
+        time.sleep(MUSIC_SLOT_POLL)
+
+
+def _worker():
+    while True:
+        with _QUEUE_COND:
+            while not _QUEUE:
+                _QUEUE_COND.wait()
+            _rank, _seq, render = heapq.heappop(_QUEUE)
+        slot = _idle_slot(render)
+        if slot is None:
+            continue
+        try:
+            if _claim(render):
+                _render(render, "background")
+        finally:
+            render.job.loop.call_soon_threadsafe(slot.release)
+
+
+def _ensure_workers_locked():
+    while len(_WORKERS) < MUSIC_RENDER_WORKERS:
+        t = threading.Thread(target=_worker, name=f"music-render-{len(_WORKERS)}", daemon=True)
+        t.start()
+        _WORKERS.append(t)
+
+
+def _lookup(job_id: str, var_id: str) -> Optional[_Render]:
+    with _LOCK:
+        job = _JOBS.get(job_id)
+        return job.renders.get(var_id) if job else None
+
+
+# ---------- ENTRY POINTS ----------
+def adopt_input(url: str, input_path: Path) -> bool:
+    """
+    Blocking: copy the cached input of the track `url` resolved to last time
+    into `input_path`, if any (only a recent alias of a track with a recorded
+    duration, see fingerprint.lookup_url; start() re-checks the duration).
+    """
+    canonical = fingerprint.lookup_url(url)
+    cached = result_cache.lookup(result_cache.recipe_key(canonical, _INPUT_RECIPE), MUSIC_OUTPUT_EXT) \
+        if canonical else None
+    if not cached:
+        return False
+    result_cache.materialize(cached, str(input_path))
+    return True
+
+
+def _ingest(job_id: str, input_path: Path, url: Optional[str]) -> str:
+    """Blocking: the input's canonical digest; a downloaded input is cached for adopt_input()."""
+    digest = result_cache.file_digest(str(input_path))
+    canonical = fingerprint.canonical_digest(str(input_path), digest, url, job_id)
+    if url and fingerprint.available():
+        key = result_cache.recipe_key(canonical, _INPUT_RECIPE)
+        if not result_cache.lookup(key, MUSIC_OUTPUT_EXT):
+            result_cache.store(key, MUSIC_OUTPUT_EXT, str(input_path))
+    return canonical
+
+
+async def start(job_id: str, input_path: Path, tmpdir: Path, url: Optional[str] = None) -> List[dict]:
+    """
+    Register an ingested input (hashing and fingerprinting it in a worker
+    thread) and queue its background renders. `url` is the link it was
+    downloaded from. Returns the variations in MUSIC_VARIATIONS order.
+    """
+    canonical = await profiling.run_in_threadpool(_ingest, job_id, input_path, url)
+    job = _Job(job_id, input_path, tmpdir, canonical, asyncio.get_running_loop())
+    with _QUEUE_COND:
+        _prune_locked(time.monotonic())
+        _JOBS[job_id] = job
+        for rank, v in enumerate(_ranked()):
+            job.renders[v["id"]] = render = _Render(job, v, rank)
+            if MUSIC_PRERENDER:
+                heapq.heappush(_QUEUE, (rank, next(_SEQ), render))
+        if MUSIC_PRERENDER:
+            _ensure_workers_locked()
+            _QUEUE_COND.notify_all()
+    return list(MUSIC_VARIATIONS)
+
+
+def state(job_id: str, var_id: str) -> Optional[str]:
+    """pending / running / done / failed, or None for an unknown job or variation."""
+    render = _lookup(job_id, var_id)
+    return render.state if render else None
+
+
+async def render_on_demand(job_id: str, var_id: str) -> bool:
+    """
+    If nobody is rendering the variation, start it now, ahead of the background
+    queue, under a transcode admission slot (raises its 503 when saturated).
+    Returns once the render is running; it carries on if the client goes away.
+    """
+    render = _lookup(job_id, var_id)
+    if render is None or not _claim(render):
+        return False
+    try:
+        slot = await admission.admit("transcode").acquire()
+    except HTTPException as e:
+        with _LOCK:  # anyone already waiting on this claim fails too; the next request retries
+            render.state, render.error = "failed", str(e.detail)
+            render.done.set()
+        raise
+    loop = asyncio.get_running_loop()
+
+    def run():
+        try:
+            _render(render, "on_demand")
+        finally:
+            loop.call_soon_threadsafe(slot.release)
+
+    threading.Thread(target=run, name=f"music-render-{job_id}-{var_id}", daemon=True).start()
+    return True
+
+
+async def wait_rendered(job_id: str, var_id: str) -> Optional[Path]:
+    """
+    Start the variation if nobody has (`render_on_demand`), then wait for the
+    render without tying up a worker thread. Returns its path (None for an
+    unknown job or variation); raises RuntimeError if the render failed or
+    outlasted MUSIC_RENDER_WAIT.
+    """
+    render = _lookup(job_id, var_id)
+    if render is None:
+        return None
+    await render_on_demand(job_id, var_id)
+    deadline = time.monotonic() + MUSIC_RENDER_WAIT
+    while not render.done.is_set():
+        if time.monotonic() > deadline:
+            raise RuntimeError("timed out waiting for the variation to render")
+        await asyncio.sleep(RENDER_POLL)
+    if render.state != "done":
+        raise RuntimeError(render.error or "render failed")
+    return render.path
+
+
+def is_preview_request(range_header: Optional[str]) -> bool:
+    """A plain GET or an open range from 0 (how <audio> starts playback) can take the live tail."""
+    return not range_header or range_header.replace(" ", "").lower() == "bytes=0-"
+
+
+def tail(job_id: str, var_id: str) -> Iterator[bytes]:
+    """
+    The variation's bytes as ffmpeg writes them, ending when the render does
+    (sync generator for StreamingResponse). Playback starts with the first
+    frames instead of after the whole render.
+    """
+    render = _lookup(job_id, var_id)
+    if render is None:
+        return
+    f = None
+    while f is None and not render.done.is_set():
+        try:
+            f = open(render.part, "rb")
+        except FileNotFoundError:  # ffmpeg has not created it yet
+            render.done.wait(TAIL_POLL)
+    if f is None:  # finished before we could attach
+        if render.state != "done":
+            return
+        f = open(render.path, "rb")
+    with f:  # the descriptor survives the part -> final rename
+        while True:
+            data = f.read(TAIL_CHUNK)
+            if data:
+                yield data
+            elif render.done.is_set():
+                rest = f.read()
+                if rest:
+                    yield rest
+                return
+            else:
+                render.done.wait(TAIL_POLL)
+
+
+def forget(job_id: str):
+    """Drop a job (e.g. on cancel); its queued renders never run."""
+    with _LOCK:
+        _JOBS.pop(job_id, None)
@@ -0,0 +1,191 @@
+# backend/app/parallel_enhance.py
+"""
+Segment-parallel version of the local FFmpeg enhancer.
+
+The input's video stream is cut at existing keyframes with stream copy, every
+segment is run through the same filter/encoder as `_local_upscale` in its own
+ffmpeg process (a pool sized to the machine), and the encoded segments are
+joined with the concat demuxer (stream copy) while the original audio is
+remuxed in. Because cuts only happen on keyframes and nothing is re-timed, the
+frame count is preserved; this is verified and we fall back to the single
+process path if it ever is not.
+"""
+import logging
+import os
+import subprocess
+import tempfile
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import List, Optional
+
+from .presets import LOCAL_ENHANCE_ENCODER_ARGS, LOCAL_ENHANCE_FILTER
+from .progress import run_ffmpeg
+from .registry import job_processes, register_process, register_tmpfile
+
+LOG = logging.getLogger("media_studio")
+
+# ---------- CONFIG ----------
+# Below this duration one ffmpeg process already keeps the box busy long enough.
+CHUNKED_MIN_DURATION = 60.0
+# Segments shorter than this cost more in process start-up than they save.
+MIN_SEGMENT_SECONDS = 10.0
+# libx264 threads per segment encoder; workers = cpu_count // this.
+THREADS_PER_SEGMENT = 2
+# Aim for a few segments per worker so a slow segment does not leave cores idle at the end.
+SEGMENTS_PER_WORKER = 3
+
+
+class ChunkingUnavailable(RuntimeError):
+    """The input cannot be split safely (too short, no keyframe index, ...)."""
+
+
+def default_workers() -> int:
+    return max(1, (os.cpu_count() or 1) // THREADS_PER_SEGMENT)
+
+
+def _ffmpeg(cmd: List[str], job_id: str, label: str, duration: Optional[float] = None):
+    rc, stderr = run_ffmpeg(cmd, job_id, label, duration=duration)
+    if rc != 0:
+        raise RuntimeError(f"ffmpeg {label} failed: {stderr[-500:]}")
+
+
+def _run(cmd: List[str], job_id: str, what: str) -> str:
+    p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    register_process(job_id, p)
+    stdout, stderr = p.communicate()
+    if p.returncode != 0:
+        raise RuntimeError(f"{what} failed: {stderr.decode(errors='ignore')[:500]}")
+    return stdout.decode(errors="ignore")
+
+
+def probe_duration(path: str, job_id: str) -> float:
+    out = _run(["ffprobe", "-v", "error", "-show_entries", "format=duration",
+                "-of", "default=nw=1:nk=1", path], job_id, "ffprobe duration")
+    try:
+        return float(out.strip())
+    except ValueError:
+        return 0.0
+
+
+def keyframe_times(path: str, job_id: str) -> List[float]:
+    """Keyframe timestamps of the first video stream (reads packets only, no decoding)."""
+    out = _run(["ffprobe", "-v", "error", "-select_streams", "v:0",
+                "-show_entries", "packet=pts_time,flags", "-of", "csv=p=0", path],
+               job_id, "ffprobe keyframes")
+    times = []
+    for line in out.splitlines():
+        parts = line.strip().split(",")
+        if len(parts) < 2 or "K" not in parts[1]:
+            continue
+        try:
+            times.append(float(parts[0]))
+        except ValueError:
+            continue
+    return sorted(times)
+
+
+def count_video_frames(path: str, job_id: str) -> int:
+    out = _run(["ffprobe", "-v", "error", "-select_streams", "v:0", "-count_packets",
+                "-show_entries", "stream=nb_read_packets", "-of", "csv=p=0", path],
+               job_id, "ffprobe frame count")
+    try:
+        return int(out.strip().split(",")[0])
+    except ValueError:
+        return -1
+
+
+def _stop_segments(job_id: str, before: set, futures: list):
+    """Kill the job's ffmpeg processes not in `before` until every segment task has returned."""
+    while True:
+        for p in job_processes(job_id):
+            if id(p) not in before and p.poll() is None:
+                p.kill()
+        # cancel()ed futures never count as done for wait()
+        _done, running = wait([f for f in futures if not f.cancelled()], timeout=0.5)
+        if not running:
+            return
+
+
+def plan_split_points(keyframes: List[float], duration: float, workers: int) -> List[float]:
+    """Pick keyframes roughly `duration / (workers * SEGMENTS_PER_WORKER)` apart."""
+    target = max(MIN_SEGMENT_SECONDS, duration / max(1, workers * SEGMENTS_PER_WORKER))
+    points = []
+    last = 0.0
+    for t in keyframes:
+        if t - last >= target and duration - t >= MIN_SEGMENT_SECONDS:
+            points.append(t)
+            last = t
+    return points
+
+
+def enhance_chunked(input_p: str, output_p: str, job_id: str, workers: Optional[int] = None):
+    """
+    Blocking. Raises ChunkingUnavailable when the input should go through the
+    single-process `_local_upscale` instead, RuntimeError on ffmpeg failures.
+    """
+    workers = workers or default_workers()
+    duration = probe_duration(input_p, job_id)
+    if duration < CHUNKED_MIN_DURATION or workers < 2:
+        raise ChunkingUnavailable(f"duration {duration:.1f}s / {workers} workers not worth chunking")
+
+    points = plan_split_points(keyframe_times(input_p, job_id), duration, workers)
+    if not points:
+        raise ChunkingUnavailable("no usable keyframes to split on")
+
+    workdir = Path(tempfile.mkdtemp(prefix=f"{job_id}_chunks_"))
+    register_tmpfile(job_id, str(workdir))
+
+    # 1) split video only, on the keyframes we picked (stream copy => exact cut points)
+    _ffmpeg([
+        "ffmpeg", "-y", "-i", input_p,
+        "-map", "0:v:0", "-c", "copy", "-an",
+        "-f", "segment", "-segment_times", ",".join(f"{t:.6f}" for t in points),
+        "-reset_timestamps", "1",
+        str(workdir / "src_%04d.mkv"),
+    ], job_id, "split", duration)
+    sources = sorted(workdir.glob("src_*.mkv"))
+    if len(sources) < 2:
+        raise ChunkingUnavailable("split produced a single segment")
+
+    # 2) enhance segments in parallel, one ffmpeg (with a few x264 threads) per worker
+    def encode(src: Path) -> Path:
+        dst = src.with_name(src.name.replace("src_", "enh_").replace(".mkv", ".mp4"))
+        _ffmpeg([
+            "ffmpeg", "-y", "-i", str(src),
+            "-vf", LOCAL_ENHANCE_FILTER,
+            *LOCAL_ENHANCE_ENCODER_ARGS,
+            "-threads", str(THREADS_PER_SEGMENT),
+            "-fps_mode", "passthrough",
+            "-an", str(dst),
+        ], job_id, f"enhance {src.stem}")
+        return dst
+
+    LOG.info("Chunked enhance %s: %d segments on %d workers", job_id, len(sources), workers)
+    before = {id(p) for p in job_processes(job_id)}
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="enhance") as pool:
+        futures = [pool.submit(encode, src) for src in sources]
+        wait(futures, return_when=FIRST_EXCEPTION)
+        failed = next((f for f in futures if f.done() and not f.cancelled() and f.exception()), None)
+        if failed is not None:
+            # one bad segment sinks the job: drop the queued ones and stop the running encoders now
+            pool.shutdown(wait=False, cancel_futures=True)
+            _stop_segments(job_id, before, futures)
+            raise failed.exception()
+        encoded = [f.result() for f in futures]
+
+    # 3) concat (stream copy) and remux the untouched original audio
+    list_file = workdir / "segments.txt"
+    list_file.write_text("".join(f"file '{p.as_posix()}'\n" for p in encoded))
+    _ffmpeg([
+        "ffmpeg", "-y",
+        "-f", "concat", "-safe", "0", "-i", str(list_file),
+        "-i", input_p,
+        "-map", "0:v:0", "-map", "1:a?",
+        "-c", "copy",
+        output_p,
+    ], job_id, "concat", duration)
+
+    src_frames = count_video_frames(input_p, job_id)
+    out_frames = count_video_frames(output_p, job_id)
+    if src_frames != out_frames:
+        raise ChunkingUnavailable(f"frame count mismatch after concat ({out_frames} != {src_frames})")
@@ -0,0 +1,323 @@
+# backend/app/prefetch.py
+"""
+Speculative download of the likely /download right after /info.
+
+Most users press download within seconds of seeing the preview. With
+PREFETCH_ENABLED, /info hands the extracted info to `schedule()`, which picks
+the formats format_policy would choose for the default resolution and starts
+fetching them into PREFETCH_DIR in the background. /download asks `claim()`
+for each format it is about to fetch: a finished prefetch is moved into the
+job's temp dir; a running one is waited for only while its remaining bytes at
+its current rate take under PREFETCH_ADOPT_MAX_ETA (a slow or stalled one is
+cancelled and the download fetches directly, at full connection count), and
+the wait stops when the download is cancelled. Anything else is fetched as
+usual.
+
+Prefetches are low priority and bounded:
+  * only direct progressive formats (ranged_fetch), with fewer connections
+    than a real download and at most PREFETCH_WORKERS at a time;
+  * nothing starts while the platform lane has real jobs queued or is in
+    backoff;
+  * estimated sizes are reserved against PREFETCH_BUDGET_BYTES (and
+    PREFETCH_ITEM_MAX_BYTES per file) before a fetch starts;
+  * anything not claimed within PREFETCH_CLAIM_TIMEOUT of /info is cancelled
+    and deleted.
+"""
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from fastapi import APIRouter, Depends
+
+from . import format_policy, metrics, profiling, ranged_fetch, scheduler
+from .progress import get_job
+from .registry import cleanup_registry, kill_processes, register_process
+
+LOG = logging.getLogger("media_studio")
+
+# ---------- CONFIG ----------
+PREFETCH_ENABLED = os.environ.get("FETCH_HELPER_PREFETCH", "0") == "1"
+PREFETCH_DIR = Path(tempfile.gettempdir()) / "fetch_helper_cache" / "prefetch"
+PREFETCH_BUDGET_BYTES = int(os.environ.get("FETCH_HELPER_PREFETCH_BUDGET_MB", "2048")) * 1024 * 1024
+PREFETCH_ITEM_MAX_BYTES = 512 * 1024 * 1024
+PREFETCH_CLAIM_TIMEOUT = float(os.environ.get("FETCH_HELPER_PREFETCH_TIMEOUT", "90"))
+PREFETCH_ADOPT_MAX_ETA = 5.0  # adopt a running prefetch only if it should finish within this
+PREFETCH_ADOPT_WAIT = 30.0  # hard cap on waiting for one
+PREFETCH_ADOPT_POLL = 0.25
+PREFETCH_ADOPT_STALL = 2.0  # no progress report for this long: the prefetch is stalled
+PREFETCH_WORKERS = 2
+PREFETCH_CONNECTIONS = 2
+PREFETCH_RESOLUTION = 1080  # DownloadRequest.preferred_resolution default
+
+PREFETCHES = metrics.Counter(
+    "media_prefetch_total", "Speculative downloads after /info by outcome.", ("outcome",))
+
+
+class _Entry:
+    def __init__(self, key: str, url: str, fmt: Dict[str, Any], reserved: int):
+        self.key = key
+        self.url = url
+        self.fmt = fmt
+        self.reserved = reserved
+        self.path = PREFETCH_DIR / f"{key}.{fmt.get('ext') or 'bin'}"
+        self.job_id = f"pf_{key[:32]}"
+        self.created = time.monotonic()
+        self.done = threading.Event()
+        self.started = False
+        self.ok = False
+        self.claimed = False
+        self.dropped = False  # expired/abandoned: whoever finishes last removes the files
+        self.timer: Optional[threading.Timer] = None
+
+
+_ENTRIES: Dict[str, _Entry] = {}
+_LOCK = threading.Lock()
+_POOL = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="prefetch")
+
+
+def _key(url: str, format_id: Any) -> str:
+    return hashlib.sha1(f"{url}\n{format_id}".encode()).hexdigest()
+
+
+def _reserved_locked() -> int:
+    return sum(e.reserved for e in _ENTRIES.values())
+
+
+def _remove_files(entry: _Entry):
+    for p in PREFETCH_DIR.glob(f"{entry.key}.*"):
+        try:
+            p.unlink()
+        except OSError:
+            pass
+
+
+def _sweep_stale():
+    """Files left by a previous process (entries live in memory only)."""
+    cutoff = time.time() - PREFETCH_CLAIM_TIMEOUT
+    with _LOCK:
+        live = set(_ENTRIES)
+    try:
+        paths = list(PREFETCH_DIR.iterdir())
+    except OSError:
+        return
+    for p in paths:
+        try:
+            if p.name.split(".", 1)[0] not in live and p.stat().st_mtime < cutoff:
+                p.unlink()
+        except OSError:
+            pass
+
+
+def _drop(entry: _Entry):
+    """Forget the entry; files go now if the fetch has finished, else when it does."""
+    with _LOCK:
+        if _ENTRIES.get(entry.key) is entry:
+            del _ENTRIES[entry.key]
+        entry.dropped = True
+        finished = entry.done.is_set()
+        if entry.timer is not None:
+            entry.timer.cancel()
+    if finished:
+        _remove_files(entry)
+    else:
+        kill_processes(entry.job_id)  # sets ranged_fetch's cancel event
+
+
+def _expire(entry: _Entry):
+    with _LOCK:
+        if entry.claimed or entry.dropped:
+            return
+    PREFETCHES.inc(outcome="expired")
+    LOG.info("prefetch of %s not claimed within %.0fs; cancelling", entry.url[:80], PREFETCH_CLAIM_TIMEOUT)
+    _drop(entry)
+
+
+def _run(entry: _Entry):
+    with _LOCK:
+        if entry.dropped:
+            entry.done.set()
+            return
+        entry.started = True
+    try:
+        PREFETCH_DIR.mkdir(parents=True, exist_ok=True)
+        stats = ranged_fetch.fetch(entry.fmt["url"], str(entry.path), headers=ranged_fetch.request_headers(entry.fmt),
+                                   connections=PREFETCH_CONNECTIONS, job_id=entry.job_id, label="prefetch")
+        metrics.DOWNLOADED_BYTES.inc(stats["bytes"], source="prefetch")
+        entry.ok = True
+    except ranged_fetch.FetchCancelled:
+        pass
+    except Exception as e:
+        LOG.info("prefetch of %s failed: %s", entry.url[:80], e)
+        PREFETCHES.inc(outcome="failed")
+    finally:
+        cleanup_registry(entry.job_id)
+        with _LOCK:
+            entry.done.set()
+            remove = entry.dropped or not entry.ok
+            if not entry.ok and _ENTRIES.get(entry.key) is entry:
+                del _ENTRIES[entry.key]
+        if remove:
+            _remove_files(entry)
+
+
+# ---------- ENTRY POINTS ----------
+def schedule(url: str, info: Dict[str, Any], platform: str) -> int:
+    """Start prefetching the default download of `info` (non-blocking). Returns the number of files queued."""
+    if not PREFETCH_ENABLED:
+        return 0
+    plan = format_policy.choose(info.get("formats") or [], preferred_resolution=PREFETCH_RESOLUTION,
+                                duration=info.get("duration"))
+    if not plan:
+        return 0
+    lane = scheduler.lane(platform).snapshot()
+    if lane["queued"] or lane["backoff_remaining"]:
+        PREFETCHES.inc(outcome="skipped_busy")
+        return 0
+    _sweep_stale()
+
+    queued = 0
+    for fmt in (plan["video"], plan["audio"]):
+        if fmt is None:
+            continue
+        if not ranged_fetch.is_direct(fmt):
+            PREFETCHES.inc(outcome="skipped_protocol")
+            continue
+        size = format_policy.estimate_bytes(fmt, info.get("duration"))
+        if not size or size > PREFETCH_ITEM_MAX_BYTES:
+            PREFETCHES.inc(outcome="skipped_size")
+            continue
+        key = _key(url, fmt.get("format_id"))
+        with _LOCK:
+            if key in _ENTRIES:
+                continue
+            if _reserved_locked() + size > PREFETCH_BUDGET_BYTES:
+                PREFETCHES.inc(outcome="skipped_budget")
+                continue
+            entry = _ENTRIES[key] = _Entry(key, url, fmt, size)
+            entry.timer = threading.Timer(PREFETCH_CLAIM_TIMEOUT, _expire, (entry,))
+            entry.timer.daemon = True
+            entry.timer.start()
+        _POOL.submit(_run, entry)
+        PREFETCHES.inc(outcome="started")
+        queued += 1
+    return queued
+
+
+def _eta(entry: _Entry) -> Optional[float]:
+    """Seconds the running prefetch still needs at its current rate (None if unknown or stalled)."""
+    job = get_job(entry.job_id)
+    if job is None or time.time() - job["updated"] > PREFETCH_ADOPT_STALL:
+        return None
+    info = job["progress"].get("prefetch") or {}
+    total, got, speed = info.get("total"), info.get("bytes"), info.get("speed")
+    if not total or got is None or not speed:
+        return None
+    return max(0, total - got) / speed
+
+
+def _wait(entry: _Entry, job_id: Optional[str]) -> bool:
+    """Wait for a running prefetch while it stays within PREFETCH_ADOPT_MAX_ETA; False to give up on it."""
+    cancel = ranged_fetch.CancelHandle()
+    if job_id:
+        register_process(job_id, cancel)  # DELETE /download/{id} ends the wait
+    deadline = time.monotonic() + PREFETCH_ADOPT_WAIT
+    try:
+        while not entry.done.wait(PREFETCH_ADOPT_POLL):
+            if cancel.event.is_set():
+                raise ranged_fetch.FetchCancelled("cancelled")
+            eta = _eta(entry)
+            if eta is None or eta > PREFETCH_ADOPT_MAX_ETA or time.monotonic() + eta > deadline:
+                PREFETCHES.inc(outcome="too_slow")
+                return False
+        return entry.ok
+    finally:
+        cancel.finished = True
+
+
+def claim(url: str, fmt: Dict[str, Any], dest: str, job_id: Optional[str] = None) -> Optional[str]:
+    """
+    Adopt a prefetch of (`url`, `fmt`) by moving it to `dest`. Blocks while a
+    started prefetch that is about to finish does; returns None (fetch it
+    yourself) when there is nothing usable. Raises ranged_fetch.FetchCancelled
+    if job `job_id` is cancelled meanwhile.
+    """
+    key = _key(url, fmt.get("format_id"))
+    with _LOCK:
+        entry = _ENTRIES.get(key)
+        if entry is None or entry.dropped:
+            return None
+        started = entry.started
+        if started:
+            entry.claimed = True
+            if entry.timer is not None:
+                entry.timer.cancel()
+    if not started:
+        # still queued behind other prefetches: a direct fetch is faster
+        PREFETCHES.inc(outcome="abandoned")
+        _drop(entry)
+        return None
+
+    try:
+        with profiling.span("prefetch_wait"):
+            usable = _wait(entry, job_id)
+    except ranged_fetch.FetchCancelled:
+        _drop(entry)
+        raise
+    if not usable:
+        _drop(entry)
+        return None
+    with _LOCK:
+        _ENTRIES.pop(key, None)
+    try:
+        os.replace(entry.path, dest)
+    except OSError:
+        try:
+            shutil.move(str(entry.path), dest)
+        except OSError:
+            _remove_files(entry)
+            return None
+    PREFETCHES.inc(outcome="adopted")
+    return dest
+
+
+def stats() -> Dict[str, Any]:
+    now = time.monotonic()
+    with _LOCK:
+        entries = list(_ENTRIES.values())
+        reserved = _reserved_locked()
+    return {
+        "enabled": PREFETCH_ENABLED,
+        "reserved_bytes": reserved,
+        "budget_bytes": PREFETCH_BUDGET_BYTES,
+        "entries": [
+            {"url": e.url, "format_id": e.fmt.get("format_id"), "reserved": e.reserved,
+             "state": "ready" if e.ok else "running" if e.started else "queued",
+             "age": round(now - e.created, 1)}
+            for e in entries
+        ],
+    }
+
+
+def _collect_reserved() -> Dict[Tuple[str, ...], float]:
+    with _LOCK:
+        return {(): float(_reserved_locked())}
+
+
+metrics.Gauge("media_prefetch_reserved_bytes", "Budget held by running or unclaimed prefetches.", (),
+              _collect_reserved)
+
+
+# ---------- ADMIN ROUTES ----------
+router = APIRouter(prefix="/admin", dependencies=[Depends(profiling.require_admin)])
+
+
+@router.get("/prefetch")
+def prefetch_status():
+    return stats()
@@ -0,0 +1,73 @@
+# backend/app/presets.py
+"""
+Processing presets shared by the media apps.
+
+Everything that changes the bytes of an output lives here, because the result
+cache keys on these definitions: editing a filter chain or encoder flag gives
+new cache keys, so stale entries are never served.
+"""
+
+# ---------- AI MUSIC (local FFmpeg-based variations) ----------
+# Output container/encoder for variations (ffmpeg picks libmp3lame from the .mp3 extension).
+MUSIC_OUTPUT_EXT = "mp3"
+MUSIC_ENCODER_ARGS = []
+
+MUSIC_VARIATIONS = [
+    {"id": "lofi", "name": "Lo-Fi Slow", "desc": "Chill, Relaxed, Slowed",
+     "filter": "atempo=0.85,lowpass=f=3000"},
+    {"id": "nightcore", "name": "Nightcore", "desc": "Fast, Energetic, High Pitch",
+     "filter": "atempo=1.25,asetrate=44100*1.1"},
+    {"id": "bass", "name": "Bass Boosted", "desc": "Heavy Bass, Club Vibe",
+     "filter": "bass=g=15:f=110:w=0.6"},
+    {"id": "reverb", "name": "Ethereal", "desc": "Spacious, Dreamy, Echo",
+     "filter": "aecho=0.8:0.9:1000:0.3"},
+    {"id": "retro", "name": "8-Bit Retro", "desc": "Crunchy, Old School, Arcade",
+     "filter": "acrusher=level_in=8:level_out=18:bits=8:mode=log:aa=1"},
+]
+
+# ---------- VIDEO ENHANCER ----------
+LOCAL_ENHANCE_FILTER = "unsharp=5:5:1.0:5:5:0.0,scale=1920:-2"
+LOCAL_ENHANCE_ENCODER_ARGS = ["-c:v", "libx264", "-preset", "fast", "-crf", "23"]
+# Streaming (HLS) output: segment length; keyframes are forced on every boundary.
+LOCAL_ENHANCE_HLS_SEGMENT_SECONDS = 4
+
+# Bump when the remote GPU notebook changes its model/settings; the backend cannot see that itself.
+REMOTE_ENHANCE_VERSION = 1
+
+
+def music_variation_recipe(variation: dict) -> dict:
+    """Cache recipe for one variation (display name/description do not affect the output)."""
+    return {
+        "op": "music-variation",
+        "filter": variation["filter"],
+        "encoder": MUSIC_ENCODER_ARGS,
+        "ext": MUSIC_OUTPUT_EXT,
+    }
+
+
+def local_enhance_recipe() -> dict:
+    return {
+        "op": "enhance-local",
+        "filter": LOCAL_ENHANCE_FILTER,
+        "encoder": LOCAL_ENHANCE_ENCODER_ARGS,
+        "audio": "copy",
+    }
+
+
+def local_enhance_chunked_recipe() -> dict:
+    """Segment-parallel encodes are stitched at keyframes, so their MP4 differs from the single-process one."""
+    return {**local_enhance_recipe(), "op": "enhance-local-chunked"}
+
+
+def local_enhance_hls_recipe() -> dict:
+    """The segmented encode forces keyframes, so its MP4 is not byte-identical to `local_enhance_recipe`'s."""
+    return {
+        **local_enhance_recipe(),
+        "op": "enhance-local-hls",
+        "segment_seconds": LOCAL_ENHANCE_HLS_SEGMENT_SECONDS,
+        "container": "fmp4",
+    }
+
+
+def remote_enhance_recipe() -> dict:
+    return {"op": "enhance-remote", "endpoint": "/enhance-video-ai", "version": REMOTE_ENHANCE_VERSION}
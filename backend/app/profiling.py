@@ -0,0 +1,305 @@
+# backend/app/profiling.py
+"""
+Opt-in per-request profiling.
+
+A request is profiled when it carries `X-Profile: 1` or is picked by the
+admin-set sample rate (POST /admin/profiling). For a profiled request we run
+cProfile on the handler's thread, on every worker-thread call made through
+`run_in_threadpool`, and record wall-clock spans (`span("extract_info")`)
+around the interesting blocking steps. The merged .prof plus a JSON summary
+are written to PROFILE_DIR and listed under /admin/profiles; the response
+carries `X-Profile-Id`. Both /admin/* and the X-Profile header need
+FETCH_HELPER_ADMIN_TOKEN (sent as `X-Admin-Token`); while it is unset they are
+open to loopback clients only.
+
+cProfile on the event-loop thread also sees whatever other requests run there
+meanwhile, and only one request at a time gets it (a second profiler on the
+same thread would silently replace the first); an overlapping profiled request
+keeps its worker-thread profiles and spans, which are exact for the request.
+
+When nothing is being profiled the middleware is a header scan and a float
+compare, and `span()` / `run_in_threadpool` reduce to a context-var lookup.
+"""
+import contextvars
+import cProfile
+import hmac
+import io
+import json
+import logging
+import os
+import pstats
+import random
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from fastapi import APIRouter, Body, Depends, Header, HTTPException, Request
+from fastapi.responses import FileResponse
+from starlette.concurrency import run_in_threadpool as _starlette_run_in_threadpool
+
+LOG = logging.getLogger("media_studio")
+
+# ---------- CONFIG ----------
+PROFILE_DIR = Path(tempfile.gettempdir()) / "fetch_helper_profiles"
+PROFILE_KEEP = 200
+PROFILE_HEADER = b"x-profile"
+# If set, /admin/* and the X-Profile header require `X-Admin-Token: <token>`; if unset, both are
+# honoured for loopback clients only.
+ADMIN_TOKEN = os.environ.get("FETCH_HELPER_ADMIN_TOKEN")
+_ADMIN_HEADER = b"x-admin-token"
+
+PROFILE_STATE = {"sample_rate": 0.0}
+
+_CURRENT: contextvars.ContextVar[Optional["ProfileSession"]] = contextvars.ContextVar("profile_session", default=None)
+_LOOP_PROFILE = threading.Lock()  # held while a request's cProfile runs on the event-loop thread
+
+
+class ProfileSession:
+    def __init__(self, method: str, path: str, reason: str):
+        self.id = f"{time.strftime('%Y%m%d-%H%M%S')}_{uuid.uuid4().hex[:8]}"
+        self.method = method
+        self.path = path
+        self.reason = reason
+        self.started = time.time()
+        self.profiles: List[cProfile.Profile] = []
+        self.spans: Dict[str, Dict[str, float]] = {}
+        self.threads = 0
+        self._lock = threading.Lock()
+
+    def add_span(self, name: str, seconds: float):
+        with self._lock:
+            s = self.spans.setdefault(name, {"count": 0, "total": 0.0, "max": 0.0})
+            s["count"] += 1
+            s["total"] += seconds
+            s["max"] = max(s["max"], seconds)
+
+    def start_profile(self) -> Optional[cProfile.Profile]:
+        prof = cProfile.Profile()
+        try:
+            prof.enable()
+        except ValueError:
+            # another profiler is active on this thread/interpreter; keep wall spans only
+            return None
+        return prof
+
+    def stop_profile(self, prof: Optional[cProfile.Profile]):
+        if prof is None:
+            return
+        prof.disable()
+        with self._lock:
+            self.profiles.append(prof)
+
+    def run_profiled(self, func, *args, **kwargs):
+        """Executed inside a worker thread."""
+        token = _CURRENT.set(self)
+        prof = self.start_profile()
+        t0 = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.stop_profile(prof)
+            with self._lock:
+                self.threads += 1
+            self.add_span(f"thread:{getattr(func, '__name__', 'call')}", time.perf_counter() - t0)
+            _CURRENT.reset(token)
+
+    def save(self, status: int) -> Path:
+        PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+        wall = time.time() - self.started
+        top = ""
+        prof_path = PROFILE_DIR / f"{self.id}.prof"
+        with self._lock:
+            profiles = list(self.profiles)
+        if profiles:
+            stats = pstats.Stats(profiles[0])
+            for p in profiles[1:]:
+                stats.add(p)
+            stats.dump_stats(str(prof_path))
+            buf = io.StringIO()
+            pstats.Stats(str(prof_path), stream=buf).sort_stats("cumulative").print_stats(30)
+            top = buf.getvalue()
+        summary = {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status": status,
+            "reason": self.reason,
+            "started": self.started,
+            "wall_seconds": round(wall, 4),
+            "worker_threads": self.threads,
+            "spans": {k: {"count": v["count"], "total": round(v["total"], 4), "max": round(v["max"], 4)}
+                      for k, v in sorted(self.spans.items(), key=lambda kv: -kv[1]["total"])},
+            "has_cpu_profile": bool(profiles),
+            "top_cumulative": top,
+        }
+        (PROFILE_DIR / f"{self.id}.json").write_text(json.dumps(summary, indent=2))
+        _prune()
+        return prof_path
+
+
+def _prune():
+    summaries = sorted(PROFILE_DIR.glob("*.json"), key=lambda p: p.stat().st_mtime)
+    for old in summaries[: max(0, len(summaries) - PROFILE_KEEP)]:
+        for p in (old, old.with_suffix(".prof")):
+            try:
+                p.unlink()
+            except OSError:
+                pass
+
+
+@contextmanager
+def _timed_span(session: ProfileSession, name: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        session.add_span(name, time.perf_counter() - t0)
+
+
+def span(name: str):
+    """Wall-clock span for the current profiled request (no-op otherwise)."""
+    session = _CURRENT.get()
+    if session is None:
+        return nullcontext()
+    return _timed_span(session, name)
+
+
+async def run_in_threadpool(func, *args, **kwargs):
+    """starlette's run_in_threadpool, extending the request's profile into the worker thread."""
+    session = _CURRENT.get()
+    if session is None:
+        return await _starlette_run_in_threadpool(func, *args, **kwargs)
+    return await _starlette_run_in_threadpool(session.run_profiled, func, *args, **kwargs)
+
+
+def _header(scope, name: bytes) -> Optional[bytes]:
+    for k, v in scope.get("headers") or ():
+        if k == name:
+            return v
+    return None
+
+
+class ProfilingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        reason = None
+        if _header(scope, PROFILE_HEADER) in (b"1", b"true") and _admin_ok(scope, _header(scope, _ADMIN_HEADER)):
+            reason = "header"
+        else:
+            rate = PROFILE_STATE["sample_rate"]
+            if rate > 0 and random.random() < rate:
+                reason = "sampled"
+        if reason is None:
+            await self.app(scope, receive, send)
+            return
+
+        session = ProfileSession(scope.get("method", ""), scope.get("path", ""), reason)
+        status = {"code": 500}
+
+        async def tagging_send(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                message = dict(message)
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", session.id.encode())]
+            await send(message)
+
+        token = _CURRENT.set(session)
+        prof = None
+        if _LOOP_PROFILE.acquire(blocking=False):
+            prof = session.start_profile()
+            if prof is None:
+                _LOOP_PROFILE.release()
+        try:
+            await self.app(scope, receive, tagging_send)
+        finally:
+            if prof is not None:
+                session.stop_profile(prof)
+                _LOOP_PROFILE.release()
+            _CURRENT.reset(token)
+            try:
+                await _starlette_run_in_threadpool(session.save, status["code"])
+            except Exception:
+                LOG.warning("Failed to save profile %s", session.id, exc_info=True)
+
+
+# ---------- ADMIN ROUTES ----------
+_LOOPBACK_HOSTS = ("127.0.0.1", "::1", "localhost")
+
+
+def _admin_ok(scope, supplied) -> bool:
+    """Fail closed: the configured token, or -- with none configured -- a loopback client."""
+    if not ADMIN_TOKEN:
+        client = scope.get("client") or ("", 0)
+        return client[0] in _LOOPBACK_HOSTS or client[0].startswith("127.")
+    if isinstance(supplied, bytes):
+        supplied = supplied.decode(errors="ignore")
+    return supplied is not None and hmac.compare_digest(supplied.encode(), ADMIN_TOKEN.encode())
+
+
+def require_admin(request: Request, x_admin_token: Optional[str] = Header(None)):
+    if not _admin_ok(request.scope, x_admin_token):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+
+router = APIRouter(prefix="/admin", dependencies=[Depends(require_admin)])
+
+
+@router.get("/profiling")
+def profiling_status():
+    return {"sample_rate": PROFILE_STATE["sample_rate"], "profile_dir": str(PROFILE_DIR)}
+
+
+@router.post("/profiling")
+def set_profiling(payload: dict = Body(...)):
+    try:
+        rate = float(payload.get("sample_rate", 0.0))
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="sample_rate must be a number")
+    if not 0.0 <= rate <= 1.0:
+        raise HTTPException(status_code=400, detail="sample_rate must be between 0 and 1")
+    PROFILE_STATE["sample_rate"] = rate
+    LOG.info("Profiling sample rate set to %s", rate)
+    return {"sample_rate": rate}
+
+
+@router.get("/profiles")
+def list_profiles(limit: int = 50):
+    if not PROFILE_DIR.exists():
+        return []
+    out = []
+    for p in sorted(PROFILE_DIR.glob("*.json"), key=lambda p: p.stat().st_mtime, reverse=True)[:limit]:
+        try:
+            s = json.loads(p.read_text())
+        except (OSError, ValueError):
+            continue
+        s.pop("top_cumulative", None)
+        out.append(s)
+    return out
+
+
+def _profile_file(profile_id: str, suffix: str) -> Path:
+    path = PROFILE_DIR / f"{Path(profile_id).name}{suffix}"
+    if not path.exists():
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return path
+
+
+@router.get("/profiles/{profile_id}")
+def get_profile(profile_id: str):
+    return json.loads(_profile_file(profile_id, ".json").read_text())
+
+
+@router.get("/profiles/{profile_id}/prof")
+def download_profile(profile_id: str):
+    """Raw pstats file (open with `python -m pstats` or snakeviz)."""
+    return FileResponse(_profile_file(profile_id, ".prof"), media_type="application/octet-stream",
+                        filename=f"{profile_id}.prof")
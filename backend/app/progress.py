@@ -0,0 +1,195 @@
+# backend/app/progress.py
+"""
+Per-job progress records: live ffmpeg progress and stage timings.
+
+Every ffmpeg call goes through `run_ffmpeg`, which adds `-progress pipe:1` and
+folds the key=value stream (out_time, speed, fps, ...) into the job record as
+it arrives. Stages (extract, download, merge, transcode, upload) are timed with
+`job_stage`. Records are kept in memory for JOB_RECORD_TTL seconds and served
+by GET /jobs/{job_id}. Job ids are always generated here; an id the client
+sent along is kept only as the record's `client_label` (GET /jobs?label=...).
+"""
+import collections
+import re
+import subprocess
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import profiling
+from .registry import register_process
+
+# ---------- CONFIG ----------
+JOB_RECORD_TTL = 3600
+JOB_RECORD_MAX = 2000
+STDERR_TAIL_LINES = 50
+
+JOB_RECORDS: Dict[str, Dict[str, Any]] = {}
+JOB_RECORDS_LOCK = threading.Lock()
+
+_LABEL_RE = re.compile(r"^[A-Za-z0-9_.:-]{1,64}$")
+
+
+def new_job_id(prefix: str, label: Optional[str] = None) -> str:
+    """
+    A fresh server-side job id. A client-supplied id never becomes the job id
+    (it would name files and registry entries another request may share); a
+    well-formed one is recorded as the job's `client_label`.
+    """
+    job_id = f"{prefix}_{uuid.uuid4().hex}"
+    if label and _LABEL_RE.match(label):
+        update_job(job_id, client_label=label)
+    return job_id
+
+
+def find_jobs(label: str) -> List[str]:
+    """Ids of the live jobs carrying `label`, newest first."""
+    with JOB_RECORDS_LOCK:
+        found = [r for r in JOB_RECORDS.values() if r.get("client_label") == label]
+    return [r["job_id"] for r in sorted(found, key=lambda r: r["created"], reverse=True)]
+
+
+def _prune_locked(now: float):
+    if len(JOB_RECORDS) <= JOB_RECORD_MAX:
+        expired = [k for k, r in JOB_RECORDS.items() if now - r["updated"] > JOB_RECORD_TTL]
+    else:
+        expired = sorted(JOB_RECORDS, key=lambda k: JOB_RECORDS[k]["updated"])[: len(JOB_RECORDS) - JOB_RECORD_MAX]
+    for k in expired:
+        JOB_RECORDS.pop(k, None)
+
+
+def _record_locked(job_id: str) -> Dict[str, Any]:
+    now = time.time()
+    rec = JOB_RECORDS.get(job_id)
+    if rec is None:
+        _prune_locked(now)
+        rec = JOB_RECORDS[job_id] = {"job_id": job_id, "created": now, "updated": now, "stages": {}, "progress": {}}
+    rec["updated"] = now
+    return rec
+
+
+def update_job(job_id: str, **fields):
+    with JOB_RECORDS_LOCK:
+        _record_locked(job_id).update(fields)
+
+
+def update_progress(job_id: str, label: str, info: Dict[str, Any]):
+    """Progress for work that is not an ffmpeg run (e.g. ranged HTTP fetches)."""
+    with JOB_RECORDS_LOCK:
+        _record_locked(job_id)["progress"][label] = info
+
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """JSON-ready snapshot of a job record (None if unknown/expired)."""
+    with JOB_RECORDS_LOCK:
+        rec = JOB_RECORDS.get(job_id)
+        if rec is None:
+            return None
+        snap = dict(rec)
+        snap["stages"] = {k: dict(v) for k, v in rec["stages"].items()}
+        snap["progress"] = {k: dict(v) for k, v in rec["progress"].items()}
+    now = time.time()
+    for st in snap["stages"].values():
+        if st.get("ended") is None:
+            st["elapsed"] = round(now - st["started"], 3)
+    return snap
+
+
+@contextmanager
+def job_stage(job_id: str, stage: str):
+    """Time a pipeline stage. Repeated stages (e.g. two downloads) accumulate."""
+    t0 = time.time()
+    with JOB_RECORDS_LOCK:
+        st = _record_locked(job_id)["stages"].setdefault(stage, {"duration": 0.0, "count": 0})
+        st.update(started=t0, ended=None)
+    ok = False
+    try:
+        yield
+        ok = True
+    finally:
+        t1 = time.time()
+        with JOB_RECORDS_LOCK:
+            st = _record_locked(job_id)["stages"][stage]
+            st["ended"] = t1
+            st["duration"] = round(st["duration"] + (t1 - t0), 3)
+            st["count"] += 1
+            if not ok:
+                st["failed"] = True
+
+
+def _parse_progress_value(key: str, value: str):
+    if key == "speed":
+        value = value.rstrip("x").strip()
+    if key in ("frame", "total_size", "out_time_us", "out_time_ms", "dup_frames", "drop_frames"):
+        try:
+            return int(value)
+        except ValueError:
+            return None
+    if key in ("fps", "speed"):
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return value
+
+
+def run_ffmpeg(cmd: List[str], job_id: str, label: str, duration: Optional[float] = None) -> Tuple[int, str]:
+    """
+    Run an ffmpeg command (cmd[0] == "ffmpeg"), streaming progress into the job record
+    under `label`. Returns (returncode, stderr tail). Blocking.
+    """
+    cmd = [cmd[0], "-nostats", "-progress", "pipe:1"] + list(cmd[1:])
+    p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    register_process(job_id, p)
+
+    tail = collections.deque(maxlen=STDERR_TAIL_LINES)
+
+    def drain_stderr():
+        for line in p.stderr:
+            tail.append(line.decode(errors="ignore").rstrip())
+
+    t = threading.Thread(target=drain_stderr, daemon=True)
+    t.start()
+
+    started = time.time()
+    with JOB_RECORDS_LOCK:
+        _record_locked(job_id)["progress"][label] = {"state": "running", "started": started}
+    with profiling.span("subprocess:ffmpeg"):
+        _consume_progress(p, job_id, label, started, duration)
+        p.wait()
+    t.join(timeout=5)
+    with JOB_RECORDS_LOCK:
+        info = _record_locked(job_id)["progress"].setdefault(label, {"started": started})
+        info["state"] = "done" if p.returncode == 0 else "failed"
+        info["elapsed"] = round(time.time() - started, 3)
+    return p.returncode, "\n".join(tail)
+
+
+def _consume_progress(p: subprocess.Popen, job_id: str, label: str, started: float, duration: Optional[float]):
+    block = {}
+    for raw in p.stdout:
+        line = raw.decode(errors="ignore").strip()
+        if "=" not in line:
+            continue
+        key, value = line.split("=", 1)
+        block[key] = _parse_progress_value(key, value)
+        if key != "progress":
+            continue
+        # one progress block is complete
+        out_us = block.get("out_time_us") or block.get("out_time_ms")
+        info = {
+            "state": "running" if value == "continue" else "finishing",
+            "started": started,
+            "frame": block.get("frame"),
+            "fps": block.get("fps"),
+            "speed": block.get("speed"),
+            "total_size": block.get("total_size"),
+            "time_processed": round(out_us / 1e6, 3) if isinstance(out_us, int) and out_us >= 0 else None,
+        }
+        if duration and info["time_processed"] is not None:
+            info["percent"] = round(min(100.0, 100.0 * info["time_processed"] / duration), 1)
+        with JOB_RECORDS_LOCK:
+            _record_locked(job_id)["progress"][label] = info
+        block = {}
@@ -0,0 +1,356 @@
+# backend/app/ranged_fetch.py
+"""
+Multi-connection downloader for direct (progressive) media URLs.
+
+Platforms throttle per connection, so instead of one yt-dlp stream we split the
+file into parts and fetch them with concurrent `Range` requests, each worker
+writing at its own offset into a preallocated `.part` file. Progress per part
+is checkpointed to a `.ranges.json` next to it. With a `resume_key` (the page
+URL and format id) both live in RESUME_DIR rather than in the request's temp
+dir, so a later download of the same format -- after a cancel, a crash or a
+dropped connection -- picks up where it stopped as long as the server still
+reports the same size/ETag. Parts that drop mid-way, or whose body ends short,
+are retried from the last written byte. `request_headers(fmt)` carries the
+extraction's cookies along with its http_headers.
+
+Servers without range support (or small files) get a single plain GET.
+HLS/DASH formats are not handled here; the yt-dlp CLI gets
+`--concurrent-fragments FRAGMENT_CONCURRENCY` for those.
+"""
+import errno
+import hashlib
+import json
+import logging
+import math
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from . import metrics
+from .progress import update_progress
+from .registry import register_process
+
+LOG = logging.getLogger("media_studio")
+
+# ---------- CONFIG ----------
+RANGED_CONNECTIONS = int(os.environ.get("FETCH_HELPER_RANGED_CONNECTIONS", "4"))
+FRAGMENT_CONCURRENCY = int(os.environ.get("FETCH_HELPER_FRAGMENT_CONCURRENCY", "4"))
+RANGED_MIN_SIZE = 8 * 1024 * 1024  # below this one connection is as fast
+PART_MIN_SIZE = 2 * 1024 * 1024
+READ_CHUNK = 256 * 1024
+CHECKPOINT_BYTES = 8 * 1024 * 1024
+PART_RETRIES = 3
+TIMEOUT = (10, 30)
+STATE_SUFFIX = ".ranges.json"
+RESUME_DIR = Path(tempfile.gettempdir()) / "fetch_helper_cache" / "partial"
+RESUME_TTL = 6 * 3600.0  # partial downloads untouched for longer are swept
+DIRECT_PROTOCOLS = ("http", "https")
+
+DOWNLOAD_THROUGHPUT = metrics.Histogram(
+    "media_download_throughput_bytes_per_second", "Media download speed by platform and fetch method.",
+    ("platform", "method"),
+    buckets=(64e3, 256e3, 1e6, 2.5e6, 5e6, 10e6, 25e6, 50e6, 100e6))
+
+
+class RangedFetchError(RuntimeError):
+    """The ranged fetch could not complete; callers fall back to yt-dlp."""
+
+
+class FetchCancelled(RuntimeError):
+    """Stopped through the job registry (DELETE /download/{id}); no fallback."""
+
+
+def is_direct(fmt: Dict[str, Any]) -> bool:
+    return (fmt.get("protocol") or "") in DIRECT_PROTOCOLS and bool(fmt.get("url")) and not fmt.get("fragments")
+
+
+class CancelHandle:
+    """Registered like a subprocess so DELETE /download/{id} (kill_processes) stops the workers."""
+    pid = None
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.finished = False
+
+    def poll(self):
+        return 0 if self.finished else None
+
+    def terminate(self):
+        self.event.set()
+
+    kill = terminate
+
+    def wait(self, timeout=None):
+        return 0
+
+
+def request_headers(fmt: Dict[str, Any]) -> Dict[str, str]:
+    """HTTP headers for fetching `fmt` directly: its http_headers plus the cookies yt-dlp resolved for it."""
+    headers = dict(fmt.get("http_headers") or {})
+    if fmt.get("cookies") and not any(k.lower() == "cookie" for k in headers):
+        headers["Cookie"] = fmt["cookies"]
+    return headers
+
+
+_RESUMING = set()  # resume keys with a fetch in progress
+_RESUME_LOCK = threading.Lock()
+
+
+def _move(src: str, dest: str):
+    try:
+        os.replace(src, dest)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        shutil.move(src, dest)
+
+
+def _resume_base(resume_key: str) -> str:
+    return str(RESUME_DIR / hashlib.sha256(resume_key.encode()).hexdigest()[:32])
+
+
+def _sweep_resume_dir():
+    cutoff = time.time() - RESUME_TTL
+    try:
+        paths = list(RESUME_DIR.iterdir())
+    except OSError:
+        return
+    for p in paths:
+        try:
+            if p.stat().st_mtime < cutoff:
+                p.unlink()
+        except OSError:
+            pass
+
+
+def discard_partial(resume_key: str):
+    """Drop the partial download kept under `resume_key` (after a fallback fetched the file another way)."""
+    base = _resume_base(resume_key)
+    for path in (base + ".part", base + STATE_SUFFIX, base + STATE_SUFFIX + ".tmp"):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+def _probe(url: str, headers: Dict[str, str]):
+    """(size, validator, supports_ranges) via a 1-byte range request."""
+    import requests
+    r = requests.get(url, headers={**headers, "Range": "bytes=0-0"}, stream=True, timeout=TIMEOUT)
+    try:
+        if r.status_code == 206:
+            total = (r.headers.get("Content-Range") or "").rsplit("/", 1)[-1]
+            size = int(total) if total.isdigit() else None
+            ranged = size is not None
+        elif r.status_code == 200:
+            size = int(r.headers["Content-Length"]) if r.headers.get("Content-Length", "").isdigit() else None
+            ranged = False
+        else:
+            raise RangedFetchError(f"HTTP {r.status_code} probing {url[:80]}")
+        validator = r.headers.get("ETag") or r.headers.get("Last-Modified") or ""
+        return size, validator, ranged
+    finally:
+        r.close()
+
+
+def _plan_parts(size: int, connections: int) -> List[List[int]]:
+    n = max(1, min(connections, math.ceil(size / PART_MIN_SIZE)))
+    step = math.ceil(size / n)
+    return [[start, min(size, start + step) - 1, 0] for start in range(0, size, step)]
+
+
+def _load_state(state_path: str, size: int, validator: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(state_path) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if state.get("size") != size or state.get("validator") != validator:
+        return None
+    return state
+
+
+def _save_state(state_path: str, state: Dict[str, Any]):
+    tmp = state_path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, state_path)
+
+
+def _preallocate(path: str, size: int):
+    with open(path, "r+b" if os.path.exists(path) else "w+b") as f:
+        if os.fstat(f.fileno()).st_size == size:
+            return
+        f.truncate(size)
+        if hasattr(os, "posix_fallocate"):
+            try:
+                os.posix_fallocate(f.fileno(), 0, size)
+            except OSError:
+                pass  # sparse file is fine (e.g. filesystems without fallocate)
+
+
+def _single_stream(url: str, headers: Dict[str, str], part_path: str, cancel: threading.Event,
+                   on_bytes) -> int:
+    import requests
+    written = 0
+    with requests.get(url, headers=headers, stream=True, timeout=TIMEOUT) as r:
+        if r.status_code != 200:
+            raise RangedFetchError(f"HTTP {r.status_code}")
+        with open(part_path, "wb") as f:
+            for chunk in r.iter_content(READ_CHUNK):
+                if cancel.is_set():
+                    raise FetchCancelled("cancelled")
+                f.write(chunk)
+                written += len(chunk)
+                on_bytes(len(chunk))
+    return written
+
+
+def fetch(url: str, dest: str, headers: Optional[Dict[str, str]] = None, connections: Optional[int] = None,
+          job_id: Optional[str] = None, label: str = "download", resume_key: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Download `url` to `dest`. Blocking. Returns stats
+    {"bytes", "seconds", "connections", "resumed_bytes"}; raises RangedFetchError
+    (caller may fall back to yt-dlp) or FetchCancelled. With `resume_key` the
+    partial download is kept in RESUME_DIR until it completes (unless another
+    fetch of the same key is running, then it goes next to `dest`).
+    """
+    import requests
+    headers = dict(headers or {})
+    connections = connections or RANGED_CONNECTIONS
+    base = dest
+    if resume_key:
+        with _RESUME_LOCK:
+            if resume_key not in _RESUMING:
+                _RESUMING.add(resume_key)
+                base = _resume_base(resume_key)
+        if base != dest:
+            RESUME_DIR.mkdir(parents=True, exist_ok=True)
+            _sweep_resume_dir()
+    part_path = base + ".part"
+    state_path = base + STATE_SUFFIX
+    cancel = CancelHandle()
+    if job_id:
+        register_process(job_id, cancel)
+
+    t0 = time.perf_counter()
+    lock = threading.Lock()
+    counters = {"bytes": 0, "last_report": 0.0}
+
+    def on_bytes(n: int, total: Optional[int] = None, done_before: int = 0):
+        with lock:
+            counters["bytes"] += n
+            now = time.perf_counter()
+            if job_id and now - counters["last_report"] > 0.5:
+                counters["last_report"] = now
+                got = done_before + counters["bytes"]
+                elapsed = now - t0
+                info = {"state": "running", "method": "ranged", "bytes": got,
+                        "speed": round(counters["bytes"] / elapsed, 1) if elapsed > 0 else None}
+                if total:
+                    info["total"] = total
+                    info["percent"] = round(100.0 * got / total, 1)
+                update_progress(job_id, label, info)
+
+    try:
+        try:
+            size, validator, ranged = _probe(url, headers)
+        except requests.RequestException as e:
+            raise RangedFetchError(f"probe failed: {e}") from e
+
+        if not ranged or not size or size < RANGED_MIN_SIZE or connections <= 1:
+            try:
+                written = _single_stream(url, headers, part_path, cancel.event, on_bytes)
+            except requests.RequestException as e:
+                raise RangedFetchError(str(e)) from e
+            _move(part_path, dest)
+            return {"bytes": written, "seconds": time.perf_counter() - t0, "connections": 1, "resumed_bytes": 0}
+
+        state = _load_state(state_path, size, validator) if os.path.exists(part_path) else None
+        if state is None:
+            state = {"size": size, "validator": validator, "parts": _plan_parts(size, connections)}
+        resumed = sum(p[2] for p in state["parts"])
+        _preallocate(part_path, size)
+        _save_state(state_path, state)
+
+        def report(n: int):
+            on_bytes(n, size, resumed)
+
+        def run_part(part: List[int]):
+            start, end = part[0], part[1]
+            attempts = 0
+            since_checkpoint = 0
+            with open(part_path, "r+b") as f:
+                while start + part[2] <= end:
+                    if cancel.event.is_set():
+                        raise FetchCancelled("cancelled")
+                    offset = start + part[2]
+                    error = None
+                    try:
+                        with requests.get(url, headers={**headers, "Range": f"bytes={offset}-{end}"},
+                                          stream=True, timeout=TIMEOUT) as r:
+                            if r.status_code != 206:
+                                raise RangedFetchError(f"HTTP {r.status_code} for range {offset}-{end}")
+                            f.seek(offset)
+                            for chunk in r.iter_content(READ_CHUNK):
+                                if cancel.event.is_set():
+                                    raise FetchCancelled("cancelled")
+                                chunk = chunk[: end - (start + part[2]) + 1]
+                                if not chunk:
+                                    break
+                                f.write(chunk)
+                                with lock:
+                                    part[2] += len(chunk)
+                                report(len(chunk))
+                                since_checkpoint += len(chunk)
+                                if since_checkpoint >= CHECKPOINT_BYTES:
+                                    since_checkpoint = 0
+                                    f.flush()
+                                    with lock:
+                                        _save_state(state_path, state)
+                    except requests.RequestException as e:
+                        error = e
+                    else:
+                        if start + part[2] <= end:  # body ended before the range did
+                            error = f"short body ({start + part[2] - offset} of {end - offset + 1} bytes)"
+                    if error is not None:
+                        attempts += 1
+                        if attempts > PART_RETRIES:
+                            raise RangedFetchError(f"range {offset}-{end} failed: {error}")
+                        LOG.info("ranged fetch: retrying %s-%s (%s)", start + part[2], end, error)
+                        time.sleep(0.5 * attempts)
+
+        todo = [p for p in state["parts"] if p[0] + p[2] <= p[1]]
+        try:
+            with ThreadPoolExecutor(max_workers=len(todo) or 1, thread_name_prefix="ranged") as pool:
+                futures = [pool.submit(run_part, p) for p in todo]
+                try:
+                    for fut in futures:
+                        fut.result()
+                except BaseException:
+                    cancel.event.set()  # stop the other parts before the pool joins them
+                    raise
+        except BaseException:
+            with lock:
+                _save_state(state_path, state)  # keep progress for a resume
+            raise
+
+        if os.path.getsize(part_path) != size or any(p[0] + p[2] <= p[1] for p in state["parts"]):
+            raise RangedFetchError("incomplete download")
+        _move(part_path, dest)
+        try:
+            os.unlink(state_path)
+        except OSError:
+            pass
+        return {"bytes": size - resumed, "seconds": time.perf_counter() - t0, "connections": len(todo),
+                "resumed_bytes": resumed}
+    finally:
+        cancel.finished = True
+        if base != dest:
+            with _RESUME_LOCK:
+                _RESUMING.discard(resume_key)
@@ -0,0 +1,84 @@
+# backend/app/registry.py
+"""
+Per-job registry of child processes and temp files, shared by the media apps and
+the helper modules (chunked enhancer, progress runner, ...) so one DELETE /
+cleanup reaches everything a job spawned.
+"""
+import os
+import shutil
+import subprocess
+import threading
+from typing import Any, Dict, List
+
+PROCESS_REGISTRY: Dict[str, Dict[str, Any]] = {}
+PROCESS_REGISTRY_LOCK = threading.Lock()
+
+
+def register_process(download_id: str, proc: subprocess.Popen):
+    with PROCESS_REGISTRY_LOCK:
+        entry = PROCESS_REGISTRY.setdefault(download_id, {"processes": [], "tmpfiles": [], "lock": threading.Lock()})
+        entry["processes"].append(proc)
+
+
+def register_tmpfile(download_id: str, path: str):
+    with PROCESS_REGISTRY_LOCK:
+        entry = PROCESS_REGISTRY.setdefault(download_id, {"processes": [], "tmpfiles": [], "lock": threading.Lock()})
+        entry["tmpfiles"].append(path)
+
+
+def job_processes(download_id: str) -> List[subprocess.Popen]:
+    """Snapshot of the processes registered for the given id (finished ones included)."""
+    with PROCESS_REGISTRY_LOCK:
+        entry = PROCESS_REGISTRY.get(download_id)
+        return list(entry["processes"]) if entry else []
+
+
+def cleanup_registry(download_id: str):
+    """Kill any running procs and remove tmp files/dirs registered for the given id."""
+    with PROCESS_REGISTRY_LOCK:
+        entry = PROCESS_REGISTRY.pop(download_id, None)
+    if not entry:
+        return
+    for p in entry.get("processes", []):
+        try:
+            if p.poll() is None:
+                p.kill()
+        except Exception:
+            pass
+    for f in entry.get("tmpfiles", []):
+        try:
+            if os.path.exists(f):
+                try:
+                    if os.path.isdir(f):
+                        shutil.rmtree(f, ignore_errors=True)
+                    else:
+                        os.remove(f)
+                except Exception:
+                    pass
+        except Exception:
+            pass
+
+
+def kill_processes(download_id: str):
+    killed = []
+    with PROCESS_REGISTRY_LOCK:
+        entry = PROCESS_REGISTRY.get(download_id)
+        if not entry:
+            return killed
+        procs = list(entry.get("processes", []))
+    for p in procs:
+        try:
+            if p.poll() is None:
+                p.terminate()
+                try:
+                    p.wait(timeout=2)
+                except Exception:
+                    pass
+                if p.poll() is None:
+                    p.kill()
+                if p.poll() is not None and getattr(p, "pid", None) is not None:
+                    killed.append(p.pid)
+        except Exception:
+            pass
+    cleanup_registry(download_id)
+    return killed
@@ -0,0 +1,126 @@
+# backend/app/result_cache.py
+"""
+Content-addressed cache for processed outputs (/enhance-video, /generate-music).
+
+Keys are sha256(input content hash + recipe), where the recipe is the exact
+filter chain / encoder settings from presets.py. Entries are plain files in
+RESULT_CACHE_DIR; hits are hard-linked into the job's temp dir so the normal
+registry cleanup never touches the cached copy.
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+from pathlib import Path
+from typing import BinaryIO, Optional
+
+LOG = logging.getLogger("media_studio")
+
+# ---------- CONFIG ----------
+RESULT_CACHE_DIR = Path(tempfile.gettempdir()) / "fetch_helper_cache" / "results"
+RESULT_CACHE_MAX_BYTES = 10 * 1024 ** 3  # evict least-recently-used entries above this
+HASH_CHUNK = 1024 * 1024
+
+_PRUNE_LOCK = threading.Lock()
+
+
+def copy_and_hash(src: BinaryIO, dest_path: str) -> str:
+    """Stream `src` into `dest_path` and return the sha256 of the content (single pass)."""
+    h = hashlib.sha256()
+    with open(dest_path, "wb") as out:
+        while True:
+            chunk = src.read(HASH_CHUNK)
+            if not chunk:
+                break
+            h.update(chunk)
+            out.write(chunk)
+    return h.hexdigest()
+
+
+def file_digest(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(HASH_CHUNK)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def recipe_key(input_digest: str, recipe: dict) -> str:
+    blob = json.dumps({"input": input_digest, "recipe": recipe}, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+
+def _entry_path(key: str, ext: str) -> Path:
+    return RESULT_CACHE_DIR / key[:2] / f"{key}.{ext.lstrip('.')}"
+
+
+def lookup(key: str, ext: str) -> Optional[Path]:
+    path = _entry_path(key, ext)
+    try:
+        os.utime(path)  # LRU bookkeeping
+    except OSError:
+        return None
+    return path
+
+
+def materialize(cached: Path, dest: str):
+    """Expose a cached entry at `dest` without copying when the filesystem allows it."""
+    try:
+        if os.path.exists(dest):
+            os.remove(dest)
+        os.link(cached, dest)
+    except OSError:
+        shutil.copyfile(cached, dest)
+
+
+def store(key: str, ext: str, src_path: str) -> Optional[Path]:
+    """Add `src_path` to the cache (the source stays in place). Never raises."""
+    path = _entry_path(key, ext)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{uuid.uuid4().hex}.tmp")
+        try:
+            os.link(src_path, tmp)
+        except OSError:
+            shutil.copyfile(src_path, tmp)
+        os.replace(tmp, path)
+    except Exception:
+        LOG.warning("Result cache store failed for %s", key, exc_info=True)
+        return None
+    prune()
+    return path
+
+
+def prune(max_bytes: int = RESULT_CACHE_MAX_BYTES, root: Path = RESULT_CACHE_DIR):
+    """Evict least-recently-used entries of `root` (laid out like this cache) above `max_bytes`."""
+    if not _PRUNE_LOCK.acquire(blocking=False):
+        return
+    try:
+        entries = []
+        total = 0
+        for p in root.glob("*/*"):
+            try:
+                st = p.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, p))
+            total += st.st_size
+        if total <= max_bytes:
+            return
+        for _mtime, size, p in sorted(entries, key=lambda e: e[0]):
+            try:
+                p.unlink()
+                total -= size
+            except OSError:
+                pass
+            if total <= max_bytes:
+                break
+    finally:
+        _PRUNE_LOCK.release()
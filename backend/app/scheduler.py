@@ -0,0 +1,213 @@
+# backend/app/scheduler.py
+"""
+Per-platform admission for outgoing extraction/download work.
+
+Each platform (YouTube, Instagram, ...; see PLATFORM_LIMITS) gets a lane with
+a token bucket (`rate` starts per second, `burst` tokens) and a concurrency
+cap. Callers wait in FIFO order per lane, so a burst against one platform
+neither starves the other callers of that platform nor delays other
+platforms:
+
+    async with scheduler.slot(scheduler.platform_for_url(url), "extract"):
+        info = await profiling.run_in_threadpool(...)
+
+When work fails with a rate-limit signature (HTTP 429, "not a bot" checks) the
+lane backs off exponentially (BACKOFF_BASE .. BACKOFF_MAX) and drains its
+tokens; a later success resets the backoff. Queue waits are exported per
+platform as media_scheduler_queue_wait_seconds.
+
+Lanes are driven from the event loop (asyncio futures and call_later), so
+the waiting requests do not hold worker threads.
+"""
+import asyncio
+import collections
+import logging
+import time
+from typing import Deque, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+from fastapi import APIRouter, Depends
+
+from . import metrics, profiling
+
+LOG = logging.getLogger("media_studio")
+
+# ---------- CONFIG ----------
+# rate: sustained starts/second, burst: bucket size, concurrency: simultaneous jobs
+PLATFORM_LIMITS: Dict[str, Dict[str, float]] = {
+    "YouTube": {"rate": 2.0, "burst": 6, "concurrency": 6},
+    "Instagram": {"rate": 0.5, "burst": 3, "concurrency": 2},
+    "TikTok": {"rate": 1.0, "burst": 4, "concurrency": 3},
+    "X (Twitter)": {"rate": 1.0, "burst": 4, "concurrency": 3},
+    "Facebook": {"rate": 1.0, "burst": 4, "concurrency": 3},
+    "Imgur": {"rate": 2.0, "burst": 6, "concurrency": 4},
+    "Other": {"rate": 20.0, "burst": 40, "concurrency": 16},
+}
+PLATFORM_HOSTS: Dict[str, Tuple[str, ...]] = {
+    "YouTube": ("youtube.com", "youtu.be", "youtube-nocookie.com"),
+    "Instagram": ("instagram.com",),
+    "TikTok": ("tiktok.com",),
+    "X (Twitter)": ("twitter.com", "x.com"),
+    "Facebook": ("facebook.com", "fb.watch"),
+    "Imgur": ("imgur.com",),
+}
+BACKOFF_BASE = 5.0
+BACKOFF_MAX = 300.0
+THROTTLE_MARKERS = ("429", "too many requests", "rate-limit", "rate limit", "not a bot", "throttl")
+
+QUEUE_WAIT_SECONDS = metrics.Histogram(
+    "media_scheduler_queue_wait_seconds", "Time spent waiting for a platform slot.", ("platform", "kind"))
+BACKOFFS = metrics.Counter(
+    "media_scheduler_backoffs_total", "Rate-limit responses that put a platform lane into backoff.", ("platform",))
+
+
+def platform_for_url(url: str) -> str:
+    """Platform name as used by _detect_content_type, from the URL alone ("Other" if unknown)."""
+    host = (urlsplit(url).hostname or "").lower()
+    for platform, domains in PLATFORM_HOSTS.items():
+        for d in domains:
+            if host == d or host.endswith("." + d):
+                return platform
+    return "Other"
+
+
+def is_throttled(exc: BaseException) -> bool:
+    msg = str(getattr(exc, "detail", None) or exc).lower()
+    return any(m in msg for m in THROTTLE_MARKERS)
+
+
+class Lane:
+    def __init__(self, name: str, rate: float, burst: float, concurrency: int):
+        self.name = name
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.concurrency = int(concurrency)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.active = 0
+        self.waiters: Deque[asyncio.Future] = collections.deque()
+        self.backoff_until = 0.0
+        self.backoff_level = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _wake_later(self, delay: float):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = asyncio.get_running_loop().call_later(max(delay, 0.001), self._on_timer)
+
+    def _on_timer(self):
+        self._timer = None
+        self._pump()
+
+    def _pump(self):
+        while self.waiters and self.active < self.concurrency:
+            if self.waiters[0].done():  # cancelled while queued
+                self.waiters.popleft()
+                continue
+            now = time.monotonic()
+            if now < self.backoff_until:
+                self._wake_later(self.backoff_until - now)
+                return
+            self._refill(now)
+            if self.tokens < 1.0:
+                self._wake_later((1.0 - self.tokens) / self.rate)
+                return
+            self.tokens -= 1.0
+            self.active += 1
+            self.waiters.popleft().set_result(None)
+
+    async def acquire(self):
+        fut = asyncio.get_running_loop().create_future()
+        self.waiters.append(fut)
+        self._pump()
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self.release()  # granted just as we were cancelled
+            raise
+
+    def release(self):
+        self.active -= 1
+        self._pump()
+
+    def report(self, throttled: bool):
+        if not throttled:
+            self.backoff_level = 0
+            return
+        self.backoff_level += 1
+        delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (self.backoff_level - 1))
+        self.backoff_until = max(self.backoff_until, time.monotonic() + delay)
+        self.tokens = 0.0
+        BACKOFFS.inc(platform=self.name)
+        LOG.warning("%s is rate limiting us; pausing new jobs for %.0fs", self.name, delay)
+
+    def snapshot(self) -> Dict[str, float]:
+        now = time.monotonic()
+        return {
+            "active": self.active,
+            "queued": sum(1 for w in self.waiters if not w.done()),
+            "tokens": round(min(self.burst, self.tokens + (now - self.updated) * self.rate), 2),
+            "backoff_remaining": round(max(0.0, self.backoff_until - now), 1),
+            "backoff_level": self.backoff_level,
+            "limits": {"rate": self.rate, "burst": self.burst, "concurrency": self.concurrency},
+        }
+
+
+LANES: Dict[str, Lane] = {}
+
+
+def lane(platform: str) -> Lane:
+    name = platform if platform in PLATFORM_LIMITS else "Other"
+    ln = LANES.get(name)
+    if ln is None:
+        ln = LANES[name] = Lane(name, **PLATFORM_LIMITS[name])
+    return ln
+
+
+class slot:
+    """`async with slot(platform, kind):` -- wait for the platform's turn, then run."""
+
+    def __init__(self, platform: str, kind: str = "extract"):
+        self.lane = lane(platform)
+        self.kind = kind
+
+    async def __aenter__(self):
+        t0 = time.perf_counter()
+        with profiling.span(f"queue:{self.lane.name}"):
+            await self.lane.acquire()
+        QUEUE_WAIT_SECONDS.observe(time.perf_counter() - t0, platform=self.lane.name, kind=self.kind)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc is None:
+            self.lane.report(False)
+        elif is_throttled(exc):
+            self.lane.report(True)
+        self.lane.release()
+        return False
+
+
+def _collect_lanes() -> Dict[Tuple[str, ...], float]:
+    out = {}
+    for name, ln in list(LANES.items()):
+        snap = ln.snapshot()
+        out[(name, "active")] = snap["active"]
+        out[(name, "queued")] = snap["queued"]
+    return out
+
+
+metrics.Gauge("media_scheduler_jobs", "Jobs running/queued per platform lane.", ("platform", "state"), _collect_lanes)
+
+
+# ---------- ADMIN ROUTES ----------
+router = APIRouter(prefix="/admin", dependencies=[Depends(profiling.require_admin)])
+
+
+@router.get("/scheduler")
+def scheduler_status():
+    return {name: ln.snapshot() for name, ln in sorted(LANES.items())}
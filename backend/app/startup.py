@@ -0,0 +1,104 @@
+# backend/app/startup.py
+"""
+Cold-start support for the app factories (`create_app()` in main.py and
+media_studio.py).
+
+Importing yt_dlp (hundreds of extractor modules) and requests used to happen
+when the app module was imported, before the worker could answer anything.
+They are now imported by the first code path that needs them (function-local
+imports), so a new worker is serving as soon as FastAPI is up.
+
+The optional warm-up (`create_app(warm_up=True)` or FETCH_HELPER_WARMUP=1)
+pays those costs in a background thread right after startup instead of on a
+user's first /info: it imports the heavy modules, builds url_precheck's
+extractor index, loads the cookie jar and starts the extraction workers.
+Step timings are exported as media_warmup_seconds.
+benchmarks/bench_startup.py tracks import time and cold start to the first
+response.
+"""
+import logging
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, Optional, Tuple
+
+from . import metrics
+
+LOG = logging.getLogger("media_studio")
+
+# ---------- CONFIG ----------
+WARMUP_ENABLED = os.environ.get("FETCH_HELPER_WARMUP", "0") == "1"
+
+WARMUP_SECONDS: Dict[str, float] = {}
+
+
+def _import_yt_dlp():
+    import yt_dlp  # noqa: F401
+
+
+def _import_requests():
+    import requests  # noqa: F401
+
+
+def _extractor_index():
+    from . import url_precheck
+    url_precheck._extractors()
+
+
+def _cookie_jar():
+    from . import cookies
+    cookies.COOKIES.jar()
+
+
+def _extract_workers():
+    from . import extract_pool
+    if extract_pool.EXTRACT_WORKERS > 0:
+        extract_pool.POOL.start()  # workers warm their own YoutubeDL/cookies
+
+
+WARMUP_STEPS: Tuple[Tuple[str, Callable[[], None]], ...] = (
+    ("requests", _import_requests),
+    ("yt_dlp", _import_yt_dlp),
+    ("extractor_index", _extractor_index),
+    ("cookies", _cookie_jar),
+    ("extract_workers", _extract_workers),
+)
+
+
+def warm_up():
+    """Run every warm-up step (blocking); a failing step is logged and skipped."""
+    for name, step in WARMUP_STEPS:
+        t0 = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            LOG.warning("warm-up step %s failed: %s", name, e)
+            continue
+        WARMUP_SECONDS[name] = time.perf_counter() - t0
+    LOG.info("warm-up done: %s", ", ".join(f"{k} {v * 1000:.0f} ms" for k, v in WARMUP_SECONDS.items()))
+
+
+def lifespan(warm: Optional[bool] = None):
+    """
+    FastAPI lifespan that starts the warm-up in the background (never delays
+    startup) and stops the extraction workers on shutdown.
+    """
+    warm = WARMUP_ENABLED if warm is None else warm
+
+    @asynccontextmanager
+    async def _lifespan(app):
+        if warm:
+            threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+        yield
+        from . import extract_pool
+        extract_pool.POOL.close()
+
+    return _lifespan
+
+
+def _collect_warmup() -> Dict[Tuple[str, ...], float]:
+    return {(name,): seconds for name, seconds in list(WARMUP_SECONDS.items())}
+
+
+metrics.Gauge("media_warmup_seconds", "Duration of each startup warm-up step.", ("step",), _collect_warmup)
@@ -0,0 +1,199 @@
+# backend/app/thumbnails.py
+"""
+Resized thumbnail variants for /proxy-image.
+
+Platform thumbnails are often 1280x720 JPEGs of 100+ KB that the frontend
+shows at card size. `/proxy-image?url=...&width=320&format=webp` returns a
+re-encoded variant instead:
+
+  * the width is rounded up to one of THUMB_WIDTHS (so a handful of variants
+    per image cover every layout / device pixel ratio) and never upscales;
+  * `format` is webp or jpeg; with only `width` given it is webp when the
+    client's Accept header allows it, and the response says `Vary: Accept`;
+  * decoding (JPEG draft mode: decoded at 1/2-1/8 scale straight away),
+    resizing and encoding run in THUMB_WORKERS threads of their own -- Pillow
+    releases the GIL there -- never on the event loop or the shared pool;
+  * variants are cached on disk per (url, width, format) in THUMB_CACHE_DIR
+    and evicted LRU above THUMB_CACHE_MAX_BYTES.
+
+Without `width`/`format` the image passes through as before, but labelled
+with its real content type (sniffed from the bytes) instead of always
+image/jpeg. Pillow is a requirement; if it is missing anyway (logged once),
+or for bytes it cannot decode, every request passes through.
+"""
+import asyncio
+import concurrent.futures
+import hashlib
+import io
+import itertools
+import json
+import logging
+import os
+import tempfile
+import threading
+import uuid
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from fastapi import Response
+from fastapi.responses import FileResponse
+
+from . import metrics, profiling, result_cache
+
+LOG = logging.getLogger("media_studio")
+
+# ---------- CONFIG ----------
+THUMB_WIDTHS = (64, 128, 192, 256, 320, 480, 640, 960, 1280)
+THUMB_FORMATS = {"webp": ("WEBP", "image/webp"), "jpeg": ("JPEG", "image/jpeg")}
+THUMB_QUALITY = {"webp": 75, "jpeg": 80}
+THUMB_WORKERS = int(os.environ.get("FETCH_HELPER_THUMB_WORKERS", str(os.cpu_count() or 1)))
+THUMB_CACHE_DIR = Path(tempfile.gettempdir()) / "fetch_helper_cache" / "thumbs"
+THUMB_CACHE_MAX_BYTES = 512 * 1024 ** 2
+THUMB_PRUNE_EVERY = 100  # stores between LRU scans of the cache directory
+THUMB_FETCH_TIMEOUT = 10
+THUMB_CACHE_CONTROL = "public, max-age=86400"
+
+REQUESTS = metrics.Counter(
+    "media_thumbnail_requests_total", "/proxy-image requests by result.", ("result",))
+
+_SIGNATURES = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+
+_PIL = []  # [module or None] once probed
+_POOL: Optional[concurrent.futures.ThreadPoolExecutor] = None
+_POOL_LOCK = threading.Lock()
+_STORES = itertools.count(1)
+
+
+def _pil():
+    if not _PIL:
+        try:
+            from PIL import Image
+        except ImportError:
+            LOG.warning("Pillow is not installed; /proxy-image passes every image through")
+            Image = None
+        _PIL.append(Image)
+    return _PIL[0]
+
+
+def _pool() -> concurrent.futures.ThreadPoolExecutor:
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = concurrent.futures.ThreadPoolExecutor(max_workers=THUMB_WORKERS, thread_name_prefix="thumb")
+        return _POOL
+
+
+def sniff_content_type(data: bytes, declared: Optional[str] = None) -> str:
+    """The image type of `data` by its magic bytes; else the upstream type if it is an image."""
+    for magic, ctype in _SIGNATURES:
+        if data.startswith(magic):
+            return ctype
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    if data[4:8] == b"ftyp" and data[8:12] in (b"avif", b"avis"):
+        return "image/avif"
+    declared = (declared or "").split(";")[0].strip().lower()
+    return declared if declared.startswith("image/") else "application/octet-stream"
+
+
+def variant_width(width: int) -> int:
+    return next((w for w in THUMB_WIDTHS if w >= width), THUMB_WIDTHS[-1])
+
+
+def _cache_path(url: str, width: Optional[int], fmt: str) -> Path:
+    blob = json.dumps({"url": url, "width": width, "format": fmt}, sort_keys=True, separators=(",", ":"))
+    key = hashlib.sha256(blob.encode()).hexdigest()
+    return THUMB_CACHE_DIR / key[:2] / f"{key}.{fmt}"
+
+
+def _cached(path: Path) -> bool:
+    try:
+        os.utime(path)  # LRU bookkeeping, as in result_cache
+    except OSError:
+        return False
+    return True
+
+
+def _store(path: Path, data: bytes):
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{uuid.uuid4().hex}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+    except OSError:
+        LOG.warning("Thumbnail cache store failed for %s", path.name, exc_info=True)
+        return
+    if next(_STORES) % THUMB_PRUNE_EVERY == 0:
+        result_cache.prune(THUMB_CACHE_MAX_BYTES, THUMB_CACHE_DIR)
+
+
+def _fetch(url: str, headers: Dict[str, str]) -> Optional[Tuple[bytes, Optional[str]]]:
+    import requests
+    try:
+        resp = requests.get(url, headers=headers, timeout=THUMB_FETCH_TIMEOUT)
+    except Exception:
+        return None
+    if resp.status_code != 200:
+        return None
+    return resp.content, resp.headers.get("Content-Type")
+
+
+def render_variant(data: bytes, width: Optional[int], fmt: str) -> bytes:
+    """Blocking: decode `data`, shrink it to `width` (if narrower than the image) and encode as `fmt`."""
+    Image = _pil()
+    pil_format, _ctype = THUMB_FORMATS[fmt]
+    with Image.open(io.BytesIO(data)) as im:
+        if width and width < im.width:
+            im.thumbnail((width, im.height), Image.LANCZOS)  # draft-decodes JPEGs near the target size
+        alpha = "A" in im.getbands() or "transparency" in im.info
+        if fmt == "jpeg" or im.mode not in ("RGB", "RGBA"):
+            im = im.convert("RGBA" if fmt == "webp" and alpha else "RGB")
+        out = io.BytesIO()
+        if fmt == "webp":
+            im.save(out, pil_format, quality=THUMB_QUALITY[fmt], method=4)
+        else:
+            im.save(out, pil_format, quality=THUMB_QUALITY[fmt], optimize=True, progressive=True)
+    return out.getvalue()
+
+
+# ---------- ENTRY POINT ----------
+async def proxy_image(url: str, width: Optional[int], fmt: Optional[str], accept: str,
+                      headers: Dict[str, str]) -> Response:
+    """The /proxy-image response for `url`: a cached/rendered variant, or the original bytes."""
+    headers_out = {}
+    if width and not fmt:
+        fmt = "webp" if "image/webp" in accept else "jpeg"
+        headers_out["Vary"] = "Accept"  # shared caches must not hand the webp to a jpeg-only client
+    variant = fmt is not None and _pil() is not None
+    if variant:
+        width = variant_width(width) if width else None
+        path = _cache_path(url, width, fmt)
+        media_type = THUMB_FORMATS[fmt][1]
+        if await profiling.run_in_threadpool(_cached, path):
+            REQUESTS.inc(result="hit")
+            return FileResponse(path, media_type=media_type,
+                                headers={"Cache-Control": THUMB_CACHE_CONTROL, **headers_out})
+
+    fetched = await profiling.run_in_threadpool(_fetch, url, headers)
+    if fetched is None:
+        REQUESTS.inc(result="upstream_error")
+        return Response(status_code=404, headers=headers_out)
+    data, declared = fetched
+    if variant:
+        try:
+            with profiling.span("thumbnail"):
+                out = await asyncio.get_running_loop().run_in_executor(_pool(), render_variant, data, width, fmt)
+        except Exception as e:  # not an image Pillow can read: hand it through untouched
+            LOG.info("Thumbnail of %s failed (%s); passing the original through", url, e)
+        else:
+            await profiling.run_in_threadpool(_store, path, out)
+            REQUESTS.inc(result="rendered")
+            return Response(content=out, media_type=media_type,
+                            headers={"Cache-Control": THUMB_CACHE_CONTROL, **headers_out})
+    REQUESTS.inc(result="passthrough")
+    return Response(content=data, media_type=sniff_content_type(data, declared), headers=headers_out)
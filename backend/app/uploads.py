@@ -0,0 +1,324 @@
+# backend/app/uploads.py
+"""
+Resumable, parallel chunked uploads for large inputs (/enhance-video).
+
+    POST   /uploads                       {"filename", "size", "chunk_size"?} -> upload_id, chunk_size, chunks
+    PUT    /uploads/{id}/chunks/{index}   raw bytes + X-Chunk-SHA256: <hex>, in any order / in parallel
+    GET    /uploads/{id}                  which chunks arrived, to resume after a dropped connection
+    POST   /uploads/{id}/complete         checks that every chunk arrived; returns the file's sha256
+    DELETE /uploads/{id}
+
+The file is preallocated when the session is created and each chunk is
+pwrite()n in place at index * chunk_size, so chunks can arrive over several
+connections in any order and nothing is assembled afterwards. A chunk only
+counts once its full length arrived and matched its checksum; a dropped or
+corrupt chunk is PUT again. The whole-file sha256 (the result_cache input
+digest) advances as the leading chunks complete, so /complete is instant.
+
+/enhance-video takes `upload_id` instead of `file`: `claim()` renames the
+finished file into the job, so processing starts without another copy. If
+that processing fails (a full queue, a remote error, ...), `restore()` moves
+the file back and the same upload_id can be submitted again.
+
+Sessions live in memory and expire UPLOAD_TTL after their last chunk. Their
+declared sizes are reserved against UPLOAD_BUDGET_BYTES (507 once it is
+spoken for), and each client may hold UPLOAD_MAX_SESSIONS_PER_CLIENT open
+sessions (429 beyond that).
+"""
+import errno
+import hashlib
+import logging
+import math
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from fastapi import APIRouter, Header, HTTPException, Request
+from pydantic import BaseModel
+
+from . import metrics, profiling
+from .result_cache import HASH_CHUNK
+
+LOG = logging.getLogger("media_studio")
+
+# ---------- CONFIG ----------
+UPLOAD_DIR = Path(tempfile.gettempdir()) / "fetch_helper_ai" / "uploads"
+UPLOAD_MAX_BYTES = int(os.environ.get("FETCH_HELPER_UPLOAD_MAX_BYTES", str(8 * 1024 ** 3)))
+UPLOAD_BUDGET_BYTES = int(os.environ.get("FETCH_HELPER_UPLOAD_BUDGET_BYTES", str(32 * 1024 ** 3)))
+UPLOAD_MAX_SESSIONS_PER_CLIENT = int(os.environ.get("FETCH_HELPER_UPLOAD_SESSIONS_PER_CLIENT", "4"))
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+UPLOAD_MIN_CHUNK = 256 * 1024
+UPLOAD_MAX_CHUNK = 64 * 1024 * 1024
+UPLOAD_WRITE_BUFFER = 1024 * 1024  # request body bytes gathered per pwrite
+UPLOAD_TTL = 24 * 3600.0
+
+CHUNKS = metrics.Counter(
+    "media_upload_chunks_total", "Chunk PUTs of resumable uploads by outcome.", ("outcome",))
+UPLOADED_BYTES = metrics.Counter(
+    "media_upload_bytes_total", "Verified bytes received through resumable uploads.")
+
+
+class _Upload:
+    def __init__(self, upload_id: str, filename: str, size: int, chunk_size: int, client: str):
+        self.upload_id = upload_id
+        self.client = client
+        self.filename = filename
+        self.size = size
+        self.chunk_size = chunk_size
+        self.chunks = math.ceil(size / chunk_size)
+        self.path = UPLOAD_DIR / f"{upload_id}.part"
+        self.sums: Dict[int, str] = {}  # index -> sha256 of every verified chunk
+        self.writing = set()  # indexes with a PUT in flight
+        self.touched = time.monotonic()
+        self.hasher = hashlib.sha256()
+        self.hashed = 0  # leading chunks folded into `hasher`
+        self.hash_lock = threading.Lock()
+        self.digest: Optional[str] = None  # set once complete
+
+    def chunk_length(self, index: int) -> int:
+        return min(self.chunk_size, self.size - index * self.chunk_size)
+
+    def missing(self):
+        return [i for i in range(self.chunks) if i not in self.sums]
+
+    def status(self) -> dict:
+        received = sum(self.chunk_length(i) for i in self.sums)
+        return {
+            "upload_id": self.upload_id, "filename": self.filename, "size": self.size,
+            "chunk_size": self.chunk_size, "chunks": self.chunks, "bytes_received": received,
+            "missing": self.missing(), "complete": self.digest is not None, "sha256": self.digest,
+        }
+
+
+_UPLOADS: Dict[str, _Upload] = {}
+_CLAIMED: Dict[str, Tuple[_Upload, Path]] = {}  # claimed uploads that restore() can still put back
+
+
+def _preallocate(path: Path, size: int):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    try:
+        try:
+            os.posix_fallocate(fd, 0, size)  # a full disk fails here, not at 90%
+        except AttributeError:
+            os.ftruncate(fd, size)
+        except OSError as e:
+            if e.errno not in (errno.EOPNOTSUPP, errno.EINVAL):
+                raise
+            os.ftruncate(fd, size)
+    finally:
+        os.close(fd)
+
+
+def _pwrite_all(fd: int, data: bytearray, offset: int):
+    view = memoryview(data)
+    while view:
+        n = os.pwrite(fd, view, offset)
+        view, offset = view[n:], offset + n
+
+
+def _advance_digest(up: _Upload):
+    """Blocking: fold the verified chunks that now follow the hashed prefix into the file digest."""
+    with up.hash_lock, open(up.path, "rb") as f:
+        while up.hashed in up.sums:
+            offset, remaining = up.hashed * up.chunk_size, up.chunk_length(up.hashed)
+            f.seek(offset)
+            while remaining:
+                data = f.read(min(HASH_CHUNK, remaining))
+                if not data:
+                    raise RuntimeError("upload file is shorter than its chunks")
+                up.hasher.update(data)
+                remaining -= len(data)
+            up.hashed += 1
+
+
+def _remove(up: _Upload):
+    _UPLOADS.pop(up.upload_id, None)
+    try:
+        up.path.unlink()
+    except OSError:
+        pass
+
+
+def _prune(now: float):
+    for up in [u for u in _UPLOADS.values() if now - u.touched > UPLOAD_TTL and not u.writing]:
+        LOG.info("Upload %s expired", up.upload_id)
+        _remove(up)
+    for upload_id in [k for k, (u, _dest) in _CLAIMED.items() if now - u.touched > UPLOAD_TTL]:
+        del _CLAIMED[upload_id]  # the file belongs to its job by now
+
+
+def _move(src: Path, dest: Path):
+    try:
+        os.replace(src, dest)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        shutil.move(str(src), str(dest))
+
+
+def _get(upload_id: str) -> _Upload:
+    up = _UPLOADS.get(upload_id)
+    if up is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired upload")
+    return up
+
+
+async def complete(upload_id: str) -> _Upload:
+    up = _get(upload_id)
+    if up.digest is None:
+        missing = up.missing()
+        if missing or up.writing:
+            raise HTTPException(status_code=409, detail={"message": "Upload incomplete", "missing": missing})
+        await profiling.run_in_threadpool(_advance_digest, up)
+        up.digest = up.hasher.hexdigest()
+    return up
+
+
+async def claim(upload_id: str, dest: Path) -> Tuple[str, str]:
+    """
+    Move a (completed, or completable) upload to `dest` and end its session.
+    A rename, not a copy. Returns (sha256, client filename). Call restore()
+    if the processing it was claimed for fails.
+    """
+    up = await complete(upload_id)
+    if _UPLOADS.pop(upload_id, None) is None:  # claimed by a concurrent request meanwhile
+        raise HTTPException(status_code=404, detail="Unknown or expired upload")
+    try:
+        await profiling.run_in_threadpool(_move, up.path, dest)
+    except OSError:
+        _UPLOADS[upload_id] = up
+        raise
+    up.touched = time.monotonic()
+    _CLAIMED[upload_id] = (up, dest)
+    return up.digest, up.filename
+
+
+async def restore(upload_id: Optional[str]):
+    """Undo claim() of `upload_id` (None: nothing was claimed) so the upload can be submitted again."""
+    claimed = _CLAIMED.pop(upload_id, None) if upload_id else None
+    if claimed is None:
+        return
+    up, dest = claimed
+    try:
+        await profiling.run_in_threadpool(_move, dest, up.path)
+    except OSError as e:
+        LOG.warning("Upload %s could not be restored: %s", upload_id, e)
+        return
+    up.touched = time.monotonic()
+    _UPLOADS[upload_id] = up
+
+
+# ---------- ROUTES ----------
+router = APIRouter(prefix="/uploads")
+
+
+class CreateUploadRequest(BaseModel):
+    filename: str = "upload.mp4"
+    size: int
+    chunk_size: Optional[int] = None
+
+
+@router.post("")
+async def create_upload(req: CreateUploadRequest, request: Request):
+    chunk_size = req.chunk_size or UPLOAD_CHUNK_SIZE
+    if not 0 < req.size <= UPLOAD_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"size must be between 1 and {UPLOAD_MAX_BYTES} bytes")
+    if not UPLOAD_MIN_CHUNK <= chunk_size <= UPLOAD_MAX_CHUNK:
+        raise HTTPException(status_code=400,
+                            detail=f"chunk_size must be between {UPLOAD_MIN_CHUNK} and {UPLOAD_MAX_CHUNK} bytes")
+    _prune(time.monotonic())
+    client = request.client.host if request.client else ""
+    if sum(u.client == client for u in _UPLOADS.values()) >= UPLOAD_MAX_SESSIONS_PER_CLIENT:
+        raise HTTPException(status_code=429, detail="Too many open uploads; complete or delete one first")
+    if sum(u.size for u in _UPLOADS.values()) + req.size > UPLOAD_BUDGET_BYTES:
+        raise HTTPException(status_code=507, detail="Upload space is exhausted; retry later")
+    up = _Upload(uuid.uuid4().hex, os.path.basename(req.filename) or "upload.mp4", req.size, chunk_size, client)
+    _UPLOADS[up.upload_id] = up  # reserves the space while the file is preallocated
+    try:
+        await profiling.run_in_threadpool(_preallocate, up.path, up.size)
+    except OSError as e:
+        LOG.warning("Preallocating upload %s failed: %s", up.upload_id, e)
+        _remove(up)
+        if e.errno == errno.ENOSPC:
+            raise HTTPException(status_code=507, detail="Not enough disk space for this upload")
+        raise HTTPException(status_code=500, detail=f"Failed to create upload: {e}")
+    return up.status()
+
+
+@router.get("/{upload_id}")
+async def upload_status(upload_id: str):
+    return _get(upload_id).status()
+
+
+@router.put("/{upload_id}/chunks/{index}")
+async def put_chunk(upload_id: str, index: int, request: Request, x_chunk_sha256: str = Header(...)):
+    up = _get(upload_id)
+    expected_sum = x_chunk_sha256.strip().lower()
+    if not 0 <= index < up.chunks:
+        raise HTTPException(status_code=400, detail=f"chunk index must be between 0 and {up.chunks - 1}")
+    if index in up.sums:  # a retry after a lost response: fine if it is the same data
+        if up.sums[index] != expected_sum:
+            CHUNKS.inc(outcome="conflict")
+            raise HTTPException(status_code=409, detail="Chunk already received with a different checksum")
+        CHUNKS.inc(outcome="duplicate")
+        return {"index": index, "received": True}
+    if index in up.writing:
+        CHUNKS.inc(outcome="conflict")
+        raise HTTPException(status_code=409, detail="Chunk is already being uploaded")
+
+    length = up.chunk_length(index)
+    offset = index * up.chunk_size
+    h = hashlib.sha256()
+    written = 0
+    buf = bytearray()
+    up.writing.add(index)
+    try:
+        fd = await profiling.run_in_threadpool(os.open, up.path, os.O_WRONLY)
+        try:
+            async for data in request.stream():
+                if written + len(buf) + len(data) > length:
+                    CHUNKS.inc(outcome="too_long")
+                    raise HTTPException(status_code=413, detail=f"Chunk {index} must be {length} bytes")
+                h.update(data)
+                buf += data
+                if len(buf) >= UPLOAD_WRITE_BUFFER:
+                    out, buf = buf, bytearray()
+                    await profiling.run_in_threadpool(_pwrite_all, fd, out, offset + written)
+                    written += len(out)
+            if buf:
+                await profiling.run_in_threadpool(_pwrite_all, fd, buf, offset + written)
+                written += len(buf)
+        finally:
+            os.close(fd)
+        if written != length:
+            CHUNKS.inc(outcome="short")
+            raise HTTPException(status_code=400, detail=f"Chunk {index} has {written} of {length} bytes")
+        if h.hexdigest() != expected_sum:
+            CHUNKS.inc(outcome="checksum_mismatch")
+            raise HTTPException(status_code=422, detail=f"Checksum mismatch for chunk {index}")
+        up.sums[index] = expected_sum
+    finally:
+        up.writing.discard(index)
+    up.touched = time.monotonic()
+    CHUNKS.inc(outcome="accepted")
+    UPLOADED_BYTES.inc(length)
+    if index == up.hashed:
+        await profiling.run_in_threadpool(_advance_digest, up)
+    return {"index": index, "received": True}
+
+
+@router.post("/{upload_id}/complete")
+async def complete_upload(upload_id: str):
+    return (await complete(upload_id)).status()
+
+
+@router.delete("/{upload_id}")
+async def delete_upload(upload_id: str):
+    _remove(_get(upload_id))
+    return {"upload_id": upload_id, "deleted": True}
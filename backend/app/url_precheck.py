@@ -0,0 +1,215 @@
+# backend/app/url_precheck.py
+"""
+Cheap admission checks that run before yt-dlp touches the network.
+
+* `precheck(url)` matches the URL against yt-dlp's extractor URL patterns
+  (`suitable()`, no I/O). A URL no site extractor claims is "unknown", not
+  unsupported: it goes on to yt-dlp's generic extractor as before (setting
+  FETCH_HELPER_ALLOW_GENERIC=0 restricts that to direct media links).
+* A short-TTL negative cache remembers URLs whose extraction recently failed
+  for a reason that will not go away on retry (yt-dlp's UnsupportedError /
+  GeoRestrictedError, or an exact "video unavailable", "private video", HTTP
+  404/410 ... message), so repeated bad requests are answered from a dict
+  lookup. 5xx, rate limits and format errors are never cached.
+
+Matching all ~1800 extractors costs 10-20 ms per URL, so extractors are first
+narrowed to those whose pattern mentions the URL's site name; the full scan is
+only the fallback, and results are memoized per URL.
+"""
+import functools
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from fastapi import HTTPException
+
+from . import metrics
+
+# ---------- CONFIG ----------
+# Admit any http(s) page for the generic extractor, as yt-dlp itself does; "0" = direct media links only.
+ALLOW_GENERIC_EXTRACTOR = os.environ.get("FETCH_HELPER_ALLOW_GENERIC", "1") == "1"
+DIRECT_MEDIA_EXTS = (".mp4", ".m4a", ".m4v", ".mov", ".mkv", ".webm", ".mp3", ".ogg", ".opus", ".wav",
+                     ".flac", ".aac", ".m3u8", ".mpd")
+NEGATIVE_CACHE_TTL = 300.0
+NEGATIVE_CACHE_MAX = 5000
+MATCH_CACHE_SIZE = 4096
+
+UNSUPPORTED_DETAIL = "This website is not currently supported."
+
+# yt-dlp exception classes that retrying will not fix ...
+PERMANENT_ERROR_CLASSES = ("UnsupportedError", "GeoRestrictedError")
+# ... and the exact yt-dlp/site phrases (lowercased) that mean the same ...
+PERMANENT_ERROR_PHRASES = (
+    "unsupported url:", "video unavailable", "this video is unavailable", "this video is private",
+    "private video", "this video has been removed", "this video does not exist", "http error 404",
+    "http error 410", "is not available in your country", "account has been terminated",
+    "blocked it on copyright grounds", "who has blocked it in your country",
+)
+# ... unless the failure looks transient (a server error, throttling, a format choice).
+TRANSIENT_ERROR_MARKERS = (
+    "http error 5", "service unavailable", "429", "too many requests", "timed out", "timeout", "temporarily",
+    "try again", "connection", "requested format", "format is not available", "cookies database",
+)
+
+PRECHECK_RESULTS = metrics.Counter(
+    "media_url_precheck_total", "URL admission decisions made before extraction.", ("result",))
+
+_NEGATIVE: Dict[str, Tuple[float, int, str]] = {}  # url -> (expires, status, detail)
+_NEGATIVE_LOCK = threading.Lock()
+
+_INDEX_LOCK = threading.Lock()
+_EXTRACTORS: Optional[List[Tuple[type, str]]] = None  # (extractor class, lowercased _VALID_URL source)
+_CANDIDATES: Dict[str, List[type]] = {}
+
+
+# ---------- EXTRACTOR MATCHING ----------
+def _extractors() -> List[Tuple[type, str]]:
+    global _EXTRACTORS
+    with _INDEX_LOCK:
+        if _EXTRACTORS is None:
+            from yt_dlp.extractor import gen_extractor_classes
+            out = []
+            for ie in gen_extractor_classes():
+                pattern = getattr(ie, "_VALID_URL", None)
+                if not pattern or ie.ie_key() == "Generic":
+                    continue
+                source = " ".join(pattern) if isinstance(pattern, (list, tuple)) else str(pattern)
+                out.append((ie, source.lower()))
+            _EXTRACTORS = out
+        return _EXTRACTORS
+
+
+def _site_token(host: str) -> str:
+    """'www.youtube.com' -> 'youtube', 'vm.tiktok.com' -> 'tiktok', 'youtu.be' -> 'youtu'."""
+    labels = [l for l in host.lower().split(".") if l]
+    if len(labels) > 1:
+        labels = labels[:-1]  # drop the TLD
+    return max(labels, key=len) if labels else ""
+
+
+def _candidates(token: str) -> List[type]:
+    cands = _CANDIDATES.get(token)
+    if cands is None:
+        cands = [ie for ie, source in _extractors() if token and token in source]
+        _CANDIDATES[token] = cands
+    return cands
+
+
+def _suitable(ie: type, url: str) -> bool:
+    try:
+        return bool(ie.suitable(url))
+    except Exception:
+        return False
+
+
+@functools.lru_cache(maxsize=MATCH_CACHE_SIZE)
+def match_extractor(url: str) -> Optional[str]:
+    """Key of the first site extractor whose URL pattern matches, else None (generic only)."""
+    host = urlsplit(url).hostname or ""
+    for ie in _candidates(_site_token(host)):
+        if _suitable(ie, url):
+            return ie.ie_key()
+    # pattern without the site name in it (alternations, IP hosts, ...)
+    for ie, _source in _extractors():
+        if _suitable(ie, url):
+            return ie.ie_key()
+    return None
+
+
+def _is_direct_media(url: str) -> bool:
+    return urlsplit(url).path.lower().endswith(DIRECT_MEDIA_EXTS)
+
+
+# ---------- NEGATIVE CACHE ----------
+def _negative_lookup(url: str) -> Optional[Tuple[int, str]]:
+    now = time.monotonic()
+    with _NEGATIVE_LOCK:
+        hit = _NEGATIVE.get(url)
+        if hit is None:
+            return None
+        if hit[0] < now:
+            _NEGATIVE.pop(url, None)
+            return None
+        return hit[1], hit[2]
+
+
+def _negative_store(url: str, status: int, detail: str):
+    now = time.monotonic()
+    with _NEGATIVE_LOCK:
+        if len(_NEGATIVE) >= NEGATIVE_CACHE_MAX:
+            for k in [k for k, v in _NEGATIVE.items() if v[0] < now]:
+                del _NEGATIVE[k]
+            if len(_NEGATIVE) >= NEGATIVE_CACHE_MAX:
+                _NEGATIVE.pop(min(_NEGATIVE, key=lambda k: _NEGATIVE[k][0]))
+        _NEGATIVE[url] = (now + NEGATIVE_CACHE_TTL, status, detail)
+
+
+def error_classes(exc: BaseException) -> List[str]:
+    """
+    Class names of `exc` and of what it wraps (DownloadError.exc_info, __cause__), plus the chain an
+    extraction worker recorded on extract_pool.ExtractionFailed.classes.
+    """
+    names = []
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        names += [c.__name__ for c in type(exc).__mro__]
+        names += getattr(exc, "classes", None) or ()
+        wrapped = getattr(exc, "exc_info", None)
+        exc = (wrapped[1] if isinstance(wrapped, tuple) and len(wrapped) > 1 else None) or exc.__cause__
+    return names
+
+
+def is_permanent_failure(message: str, exc: Optional[BaseException] = None) -> bool:
+    msg = message.lower()
+    if any(m in msg for m in TRANSIENT_ERROR_MARKERS):
+        return False
+    if exc is not None and any(c in PERMANENT_ERROR_CLASSES for c in error_classes(exc)):
+        return True
+    return any(p in msg for p in PERMANENT_ERROR_PHRASES)
+
+
+def remember_failure(url: str, exc: BaseException):
+    """Record a failed extraction if retrying it within NEGATIVE_CACHE_TTL would fail the same way."""
+    if isinstance(exc, HTTPException):
+        if exc.status_code in (400, 403, 404, 410):
+            _negative_store(url, exc.status_code, str(exc.detail))
+        return
+    message = str(exc)
+    if is_permanent_failure(message, exc):
+        _negative_store(url, 400, message[:500])
+
+
+def forget(url: str):
+    with _NEGATIVE_LOCK:
+        _NEGATIVE.pop(url, None)
+
+
+# ---------- ENTRY POINT ----------
+def precheck(url: str) -> Optional[str]:
+    """
+    Raise HTTPException for URLs that cannot succeed; otherwise return the
+    matching extractor key (None when the generic extractor will be used).
+    """
+    hit = _negative_lookup(url)
+    if hit is not None:
+        PRECHECK_RESULTS.inc(result="negative_hit")
+        raise HTTPException(status_code=hit[0], detail=hit[1])
+
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        PRECHECK_RESULTS.inc(result="invalid")
+        raise HTTPException(status_code=400, detail="Invalid URL")
+
+    key = match_extractor(url)
+    if key is not None:
+        PRECHECK_RESULTS.inc(result="supported")
+        return key
+    if ALLOW_GENERIC_EXTRACTOR or _is_direct_media(url):
+        PRECHECK_RESULTS.inc(result="generic")
+        return None
+    PRECHECK_RESULTS.inc(result="unsupported")
+    _negative_store(url, 400, UNSUPPORTED_DETAIL)
+    raise HTTPException(status_code=400, detail=UNSUPPORTED_DETAIL)
@@ -1,5 +1,7 @@
 # backend/app/utils.py
 
+import math
+import re
 from typing import Tuple
 
 
@@ -65,3 +67,39 @@ def run_ffmpeg_extract_audio(infile: str, outfile: str):
         "-f", "mp3",
         outfile
     ], check=True)
+
+
+_TIMESTAMP_PART = re.compile(r"^\d+$")
+_TIMESTAMP_LAST = re.compile(r"^\d+(\.\d+)?$")
+
+
+def parse_timestamp(value):
+    """
+    Parse a clip boundary: seconds (90, "90.5") or "[HH:]MM:SS[.ms]".
+
+    Returns:
+        float seconds, or None for an empty value. Raises ValueError if malformed, negative or
+        not finite (nan, inf, 1e309), for bools, and for minute/second fields of 60 or more.
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, bool):
+        raise ValueError(f"Invalid timestamp: {value}")
+    if isinstance(value, (int, float)):
+        seconds = float(value)
+    else:
+        parts = str(value).strip().split(":")
+        if len(parts) > 3 or not all(_TIMESTAMP_PART.match(p) for p in parts[:-1]) \
+                or not _TIMESTAMP_LAST.match(parts[-1]):
+            raise ValueError(f"Invalid timestamp: {value}")
+        seconds = 0.0
+        for i, part in enumerate(parts):
+            field = float(part)
+            if i > 0 and field >= 60:  # minutes after hours, seconds after minutes
+                raise ValueError(f"Invalid timestamp: {value}")
+            seconds = seconds * 60 + field
+    if not math.isfinite(seconds):
+        raise ValueError(f"Invalid timestamp: {value}")
+    if seconds < 0:
+        raise ValueError(f"Negative timestamp: {value}")
+    return seconds
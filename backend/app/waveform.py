@@ -0,0 +1,212 @@
+# backend/app/waveform.py
+"""
+Precomputed waveform peaks for audio artifacts.
+
+The studio UI used to fetch and decode whole MP3s just to draw waveforms.
+`compute()` decodes an artifact once (ffmpeg -> mono s16le PCM at
+PEAKS_SAMPLE_RATE), takes min/max per PEAKS_BASE_SPP samples and builds a
+pyramid by halving the resolution down to PEAKS_MIN_BUCKETS buckets. The
+pyramid is cached next to the audio (`<audio>.peaks`) and `read_level()`
+returns the coarsest level that still has the requested width, so a
+1000-px waveform costs ~2 KB.
+
+Each level is in the audiowaveform binary format (version 1, 8-bit), which
+peaks.js and wavesurfer read directly:
+
+    int32 version=1, uint32 flags=1 (8-bit), int32 sample_rate,
+    int32 samples_per_pixel, uint32 length, then `length` (min, max) int8 pairs
+
+NumPy is a requirement; if it is missing anyway, the same buckets are computed
+with `array` -- a much slower degraded mode, logged once.
+"""
+import array
+import logging
+import os
+import struct
+import subprocess
+import sys
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from .registry import register_process, register_tmpfile
+
+LOG = logging.getLogger("media_studio")
+
+# ---------- CONFIG ----------
+PEAKS_SAMPLE_RATE = 22050
+PEAKS_BASE_SPP = 256  # samples per bucket at the finest level (~86 buckets/s)
+PEAKS_MIN_BUCKETS = 256  # stop halving below this
+PEAKS_READ_BYTES = PEAKS_BASE_SPP * 2 * 1024  # whole buckets of s16 per read
+PEAKS_SUFFIX = ".peaks"
+
+_HEADER = struct.Struct("<iIiiI")
+_FLAG_8BIT = 1
+
+_LOCKS: Dict[str, threading.Lock] = {}
+_LOCKS_LOCK = threading.Lock()
+_NUMPY = []  # [module or None] once probed
+
+
+def _numpy():
+    if not _NUMPY:
+        try:
+            import numpy
+        except ImportError:
+            LOG.warning("NumPy is not installed; waveform peaks fall back to pure Python")
+            numpy = None
+        _NUMPY.append(numpy)
+    return _NUMPY[0]
+
+
+def sidecar(audio_path: str) -> str:
+    return audio_path + PEAKS_SUFFIX
+
+
+def cached(audio_path: str) -> bool:
+    try:
+        return os.path.getmtime(sidecar(audio_path)) >= os.path.getmtime(audio_path)
+    except OSError:
+        return False
+
+
+# ---------- PEAKS ----------
+def _pcm_chunks(audio_path: str, job_id: Optional[str]):
+    cmd = ["ffmpeg", "-v", "error", "-i", audio_path, "-ac", "1", "-ar", str(PEAKS_SAMPLE_RATE),
+           "-f", "s16le", "-"]
+    p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if job_id:
+        register_process(job_id, p)
+    try:
+        while True:
+            chunk = p.stdout.read(PEAKS_READ_BYTES)
+            if not chunk:
+                break
+            yield chunk
+        stderr = p.stderr.read()
+        if p.wait() != 0:
+            raise RuntimeError(f"ffmpeg decode failed: {stderr.decode(errors='ignore')[-500:]}")
+    finally:
+        if p.poll() is None:
+            p.kill()
+            p.wait()
+
+
+def _buckets_numpy(np, chunks) -> Tuple[list, list]:
+    mins, maxs = [], []
+    rest = b""
+    for chunk in chunks:
+        buf = rest + chunk
+        whole = len(buf) // (2 * PEAKS_BASE_SPP) * (2 * PEAKS_BASE_SPP)
+        rest = buf[whole:]
+        if whole:
+            pcm = np.frombuffer(buf[:whole], dtype="<i2").reshape(-1, PEAKS_BASE_SPP)
+            mins.append(pcm.min(axis=1))
+            maxs.append(pcm.max(axis=1))
+    if len(rest) >= 2:
+        pcm = np.frombuffer(rest[:len(rest) // 2 * 2], dtype="<i2")
+        mins.append(pcm.min(keepdims=True))
+        maxs.append(pcm.max(keepdims=True))
+    if not mins:
+        return [], []
+    return np.concatenate(mins) >> 8, np.concatenate(maxs) >> 8
+
+
+def _buckets_python(chunks) -> Tuple[List[int], List[int]]:
+    mins: List[int] = []
+    maxs: List[int] = []
+    rest = b""
+    for chunk in chunks:
+        buf = rest + chunk
+        whole = len(buf) // (2 * PEAKS_BASE_SPP) * (2 * PEAKS_BASE_SPP)
+        rest = buf[whole:]
+        pcm = array.array("h", buf[:whole])
+        if sys.byteorder == "big":
+            pcm.byteswap()
+        for i in range(0, len(pcm), PEAKS_BASE_SPP):
+            bucket = pcm[i:i + PEAKS_BASE_SPP]
+            mins.append(min(bucket) >> 8)
+            maxs.append(max(bucket) >> 8)
+    if len(rest) >= 2:
+        pcm = array.array("h", rest[:len(rest) // 2 * 2])
+        if sys.byteorder == "big":
+            pcm.byteswap()
+        mins.append(min(pcm) >> 8)
+        maxs.append(max(pcm) >> 8)
+    return mins, maxs
+
+
+def _halve(np, mins, maxs):
+    """Merge neighbouring buckets (an odd last bucket stays on its own)."""
+    if np is not None:
+        n = len(mins)
+        odd = n % 2
+        lo = np.minimum(mins[:n - odd:2], mins[1:n - odd:2])
+        hi = np.maximum(maxs[:n - odd:2], maxs[1:n - odd:2])
+        if odd:
+            lo, hi = np.append(lo, mins[-1]), np.append(hi, maxs[-1])
+        return lo, hi
+    lo = [min(mins[i:i + 2]) for i in range(0, len(mins), 2)]
+    hi = [max(maxs[i:i + 2]) for i in range(0, len(maxs), 2)]
+    return lo, hi
+
+
+def _level_blob(np, mins, maxs, spp: int) -> bytes:
+    n = len(mins)
+    if np is not None:
+        pairs = np.empty(2 * n, dtype=np.int8)
+        pairs[0::2], pairs[1::2] = mins, maxs
+        data = pairs.tobytes()
+    else:
+        pairs = array.array("b", bytes(2 * n))
+        pairs[0::2], pairs[1::2] = array.array("b", mins), array.array("b", maxs)
+        data = pairs.tobytes()
+    return _HEADER.pack(1, _FLAG_8BIT, PEAKS_SAMPLE_RATE, spp, n) + data
+
+
+def compute(audio_path: str, job_id: Optional[str] = None) -> str:
+    """Blocking: build (or reuse) the peaks sidecar of `audio_path` and return its path."""
+    with _LOCKS_LOCK:
+        lock = _LOCKS.setdefault(audio_path, threading.Lock())
+    try:
+        with lock:
+            out = sidecar(audio_path)
+            if cached(audio_path):
+                return out
+            np = _numpy()
+            chunks = _pcm_chunks(audio_path, job_id)
+            mins, maxs = _buckets_numpy(np, chunks) if np is not None else _buckets_python(chunks)
+            spp = PEAKS_BASE_SPP
+            blobs = [_level_blob(np, mins, maxs, spp)]
+            while len(mins) > 2 * PEAKS_MIN_BUCKETS:
+                mins, maxs = _halve(np, mins, maxs)
+                spp *= 2
+                blobs.append(_level_blob(np, mins, maxs, spp))
+            tmp = f"{out}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                for blob in blobs:
+                    f.write(blob)
+            os.replace(tmp, out)
+            if job_id:
+                register_tmpfile(job_id, out)
+            return out
+    finally:
+        with _LOCKS_LOCK:
+            if _LOCKS.get(audio_path) is lock and not lock.locked():
+                del _LOCKS[audio_path]
+
+
+def read_level(audio_path: str, width: int) -> bytes:
+    """The coarsest cached level with at least `width` buckets (the finest one if none has)."""
+    with open(sidecar(audio_path), "rb") as f:
+        data = f.read()
+    levels = []
+    off = 0
+    while off + _HEADER.size <= len(data):
+        n = _HEADER.unpack_from(data, off)[4]
+        end = off + _HEADER.size + 2 * n
+        levels.append((n, data[off:end]))
+        off = end
+    if not levels:
+        raise RuntimeError("empty peaks file")
+    fitting = [blob for n, blob in levels if n >= width]
+    return fitting[-1] if fitting else levels[0][1]
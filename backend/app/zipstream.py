@@ -0,0 +1,74 @@
+# backend/app/zipstream.py
+"""
+ZIP archives written straight into an HTTP response.
+
+zipfile can write to an unseekable stream: each member is followed by a data
+descriptor with its CRC and sizes, and the central directory goes at the end.
+ZipStream collects what zipfile writes so the caller can hand it on chunk by
+chunk; nothing is staged on disk and at most one read chunk is buffered.
+Members are STORED (media is already compressed) and always zip64, so items
+over 4 GB are fine.
+"""
+import io
+import time
+import zipfile
+from typing import AsyncIterator
+
+from starlette.concurrency import run_in_threadpool
+
+READ_CHUNK = 1024 * 1024
+
+
+class ZipStream(io.RawIOBase):
+    """Write-only, unseekable sink for zipfile.ZipFile."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def open_archive(stream: ZipStream) -> zipfile.ZipFile:
+    return zipfile.ZipFile(stream, mode="w", compression=zipfile.ZIP_STORED, allowZip64=True)
+
+
+async def add_file(zf: zipfile.ZipFile, stream: ZipStream, arcname: str, path: str) -> AsyncIterator[bytes]:
+    """Append `path` as `arcname`, yielding archive bytes as they are produced (file reads run in a thread)."""
+    info = zipfile.ZipInfo(arcname, date_time=time.localtime()[:6])
+    info.compress_type = zipfile.ZIP_STORED
+    with open(path, "rb") as src, zf.open(info, mode="w", force_zip64=True) as dst:
+        while True:
+            chunk = await run_in_threadpool(src.read, READ_CHUNK)
+            if not chunk:
+                break
+            dst.write(chunk)
+            data = stream.drain()
+            if data:
+                yield data
+    data = stream.drain()  # data descriptor
+    if data:
+        yield data
+
+
+def add_bytes(zf: zipfile.ZipFile, stream: ZipStream, arcname: str, payload: bytes) -> bytes:
+    info = zipfile.ZipInfo(arcname, date_time=time.localtime()[:6])
+    info.compress_type = zipfile.ZIP_DEFLATED
+    zf.writestr(info, payload)
+    return stream.drain()
+
+
+def close_archive(zf: zipfile.ZipFile, stream: ZipStream) -> bytes:
+    """Write the central directory; returns the final bytes."""
+    zf.close()
+    return stream.drain()
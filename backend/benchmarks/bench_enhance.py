@@ -0,0 +1,78 @@
+# backend/benchmarks/bench_enhance.py
+"""
+Single-process vs segment-parallel local enhancement.
+
+    cd backend && python -m benchmarks.bench_enhance --duration 180 --height 720
+
+Generates a synthetic test clip with ffmpeg (testsrc2 + sine), enhances it with
+`_local_upscale` and with `enhance_chunked`, checks both outputs have the
+source's frame count and prints one JSON object with the timings.
+"""
+import argparse
+import json
+import os
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+from app.media_studio import _local_upscale
+from app.parallel_enhance import count_video_frames, default_workers, enhance_chunked
+from app.registry import cleanup_registry
+
+
+def make_clip(path: str, duration: int, height: int, gop: int):
+    width = height * 16 // 9
+    subprocess.run([
+        "ffmpeg", "-y", "-v", "error",
+        "-f", "lavfi", "-i", f"testsrc2=size={width}x{height}:rate=30:duration={duration}",
+        "-f", "lavfi", "-i", f"sine=frequency=440:duration={duration}",
+        "-c:v", "libx264", "-preset", "veryfast", "-g", str(gop),
+        "-c:a", "aac", "-shortest", path,
+    ], check=True)
+
+
+def timed(fn, *args, **kwargs) -> float:
+    t0 = time.perf_counter()
+    fn(*args, **kwargs)
+    return time.perf_counter() - t0
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--duration", type=int, default=120, help="clip length in seconds")
+    ap.add_argument("--height", type=int, default=720)
+    ap.add_argument("--gop", type=int, default=60, help="keyframe interval of the source, in frames")
+    ap.add_argument("--workers", type=int, default=default_workers())
+    ap.add_argument("--input", help="use an existing file instead of a generated clip")
+    args = ap.parse_args()
+
+    work = Path(tempfile.mkdtemp(prefix="bench_enhance_"))
+    src = args.input or str(work / "source.mp4")
+    if not args.input:
+        make_clip(src, args.duration, args.height, args.gop)
+
+    job_id = "bench_enhance"
+    try:
+        src_frames = count_video_frames(src, job_id)
+        single_out = str(work / "single.mp4")
+        chunked_out = str(work / "chunked.mp4")
+        single_s = timed(_local_upscale, src, single_out, job_id)
+        chunked_s = timed(enhance_chunked, src, chunked_out, job_id, workers=args.workers)
+        result = {
+            "input": src,
+            "input_bytes": os.path.getsize(src),
+            "cpu_count": os.cpu_count(),
+            "workers": args.workers,
+            "source_frames": src_frames,
+            "single": {"seconds": round(single_s, 3), "frames": count_video_frames(single_out, job_id)},
+            "chunked": {"seconds": round(chunked_s, 3), "frames": count_video_frames(chunked_out, job_id)},
+            "speedup": round(single_s / chunked_s, 2) if chunked_s else None,
+        }
+        print(json.dumps(result, indent=2))
+    finally:
+        cleanup_registry(job_id)
+
+
+if __name__ == "__main__":
+    main()
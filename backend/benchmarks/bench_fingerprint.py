@@ -0,0 +1,182 @@
+# backend/benchmarks/bench_fingerprint.py
+"""
+Hit rate and false-positive rate of the acoustic fingerprint index.
+
+    cd backend && python -m benchmarks.bench_fingerprint --tracks 40 --variants 4
+    cd backend && python -m benchmarks.bench_fingerprint --corpus ~/fp-corpus
+
+Synthetic corpus (default): `--tracks` random songs (notes with harmonics,
+envelopes and percussion) are indexed; each is queried again as `--variants`
+degraded copies (gain, noise at 10-30 dB SNR, a trimmed start, low-pass,
+8-bit quantisation). `--impostors` further songs that are not indexed are
+queried too; any match of those, or a variant matching the wrong song, is a
+false positive.
+
+Real corpus (`--corpus DIR`, decoded with ffmpeg): files named
+`<track>__<anything>.<ext>`; in each group with several files the first is
+indexed and the rest are positive queries, single-file groups are impostors.
+
+Prints JSON: hit rate, false-positive rate, BER of true matches vs. the
+closest impostors, and lookup latency.
+"""
+import argparse
+import collections
+import json
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from app import fingerprint
+from app.fingerprint import FP_SAMPLE_RATE, FingerprintIndex
+
+from .run_bench import _git_rev
+
+
+def synth_track(rng: np.random.Generator, seconds: float) -> np.ndarray:
+    sr = FP_SAMPLE_RATE
+    out = np.zeros(int(seconds * sr), dtype=np.float32)
+    beat = rng.uniform(0.25, 0.6)
+    t = 0.0
+    while t < seconds:
+        length = beat * rng.choice([0.5, 1, 1, 2])
+        n = int(length * sr)
+        start = int(t * sr)
+        tt = np.arange(n) / sr
+        env = np.exp(-tt * rng.uniform(1, 6))
+        for _voice in range(rng.integers(1, 4)):
+            f0 = 440.0 * 2 ** ((rng.integers(40, 84) - 69) / 12)
+            tone = sum(np.sin(2 * np.pi * f0 * k * tt) / k for k in range(1, 5))
+            out[start:start + n] += (rng.uniform(0.2, 0.6) * env * tone)[:len(out) - start]
+        if rng.random() < 0.5:  # percussion
+            hit = min(n, int(0.05 * sr), len(out) - start)
+            out[start:start + hit] += rng.normal(0, 0.3, hit) * np.exp(-np.arange(hit) / (0.01 * sr))
+        t += length
+    return out / max(1e-6, np.abs(out).max())
+
+
+def degrade(rng: np.random.Generator, pcm: np.ndarray) -> Tuple[np.ndarray, str]:
+    kind = rng.choice(["gain", "noise", "trim", "lowpass", "quantize", "mixed"])
+    x = pcm.copy()
+    if kind in ("gain", "mixed"):
+        x *= rng.uniform(0.3, 1.5)
+    if kind in ("noise", "mixed"):
+        snr = rng.uniform(10, 30)
+        x += rng.normal(0, np.sqrt(np.mean(x ** 2) / 10 ** (snr / 10)), len(x)).astype(np.float32)
+    if kind in ("trim", "mixed"):
+        x = x[int(rng.uniform(0.1, 3.0) * FP_SAMPLE_RATE):]
+    if kind in ("lowpass", "mixed"):
+        x = np.convolve(x, np.ones(3, dtype=np.float32) / 3, mode="same")
+    if kind == "quantize":
+        x = np.round(x * 127) / 127
+    return x.astype(np.float32), str(kind)
+
+
+def _fp(pcm: np.ndarray) -> Tuple[np.ndarray, float]:
+    return fingerprint.fingerprint_pcm(pcm), len(pcm) / FP_SAMPLE_RATE
+
+
+def _fp_file(path: Path) -> Tuple[np.ndarray, float]:
+    return fingerprint.fingerprint_file(str(path)), fingerprint.probe_duration(str(path))
+
+
+Fingerprint = Tuple[np.ndarray, float]  # (sub-fingerprints, duration in seconds)
+
+
+def synthetic_corpus(args) -> Tuple[Dict[str, Fingerprint], List[Tuple[str, str, Fingerprint]], List[Fingerprint]]:
+    rng = np.random.default_rng(args.seed)
+    originals = {f"t{i}": synth_track(rng, args.seconds) for i in range(args.tracks)}
+    queries = []
+    for name, pcm in originals.items():
+        for _ in range(args.variants):
+            x, kind = degrade(rng, pcm)
+            queries.append((name, kind, x))
+    impostors = [synth_track(rng, args.seconds) for _ in range(args.impostors)]
+    return ({k: _fp(v) for k, v in originals.items()},
+            [(name, kind, _fp(x)) for name, kind, x in queries],
+            [_fp(x) for x in impostors])
+
+
+def real_corpus(directory: str):
+    groups = collections.defaultdict(list)
+    for p in sorted(Path(directory).iterdir()):
+        if p.is_file():
+            groups[p.name.split("__", 1)[0]].append(p)
+    originals, queries, impostors = {}, [], []
+    for name, files in groups.items():
+        fps = [_fp_file(f) for f in files]
+        if len(fps) == 1:
+            impostors.append(fps[0])
+            continue
+        originals[name] = fps[0]
+        queries += [(name, f.suffix.lstrip(".") or "file", fp) for f, fp in zip(files[1:], fps[1:])]
+    return originals, queries, impostors
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--tracks", type=int, default=40, help="indexed synthetic songs")
+    ap.add_argument("--variants", type=int, default=4, help="degraded queries per indexed song")
+    ap.add_argument("--impostors", type=int, default=40, help="synthetic songs that are not indexed")
+    ap.add_argument("--seconds", type=float, default=60.0)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--corpus", help="directory of real audio files (<track>__<variant>.<ext>)")
+    ap.add_argument("--out", help="write JSON here as well as stdout")
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    originals, queries, impostors = real_corpus(args.corpus) if args.corpus else synthetic_corpus(args)
+    fingerprint_s = time.perf_counter() - t0
+
+    index = FingerprintIndex(Path(tempfile.mkdtemp(prefix="bench_fp_")) / "index.sqlite3")
+    for name, (fp, duration) in originals.items():
+        index.add(name, fp, duration)
+
+    hits, wrong, lookup_ms, true_ber = 0, 0, [], []
+    misses_by_kind: Dict[str, int] = collections.Counter()
+    for name, kind, (fp, duration) in queries:
+        t = time.perf_counter()
+        hit = index.match(fp, duration)
+        lookup_ms.append((time.perf_counter() - t) * 1000)
+        if hit and hit[0] == name:
+            hits += 1
+            true_ber.append(hit[1])
+        else:
+            wrong += bool(hit)
+            misses_by_kind[kind] += 1
+    false_hits = 0
+    for fp, duration in impostors:
+        t = time.perf_counter()
+        false_hits += index.match(fp, duration) is not None
+        lookup_ms.append((time.perf_counter() - t) * 1000)
+    # how close do unrelated recordings get? best BER of each impostor against every indexed song
+    closest = [min(min(fingerprint.bit_error_rate(ref, fp, off)[0] for off in range(-40, 41, 4))
+                   for ref, _duration in originals.values()) for fp, _duration in impostors[:10]]
+
+    negatives = len(impostors) + len(queries)
+    results = {
+        "python": sys.version.split()[0], "git": _git_rev(),
+        "corpus": args.corpus or "synthetic", "indexed": len(originals), "queries": len(queries),
+        "impostors": len(impostors), "max_ber": fingerprint.FP_MAX_BER,
+        "hit_rate": round(hits / max(1, len(queries)), 4),
+        "false_positive_rate": round((false_hits + wrong) / max(1, negatives), 4),
+        "false_positives": {"impostor_matched": false_hits, "wrong_track": wrong},
+        "misses_by_degradation": dict(misses_by_kind),
+        "ber_true_median": round(statistics.median(true_ber), 3) if true_ber else None,
+        "ber_true_max": round(max(true_ber), 3) if true_ber else None,
+        "ber_closest_impostor_min": round(min(closest), 3) if closest else None,
+        "lookup_ms_median": round(statistics.median(lookup_ms), 2) if lookup_ms else None,
+        "fingerprint_s_total": round(fingerprint_s, 2),
+    }
+    text = json.dumps(results, indent=2)
+    print(text)
+    if args.out:
+        Path(args.out).write_text(text)
+
+
+if __name__ == "__main__":
+    main()
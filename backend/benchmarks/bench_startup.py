@@ -0,0 +1,165 @@
+# backend/benchmarks/bench_startup.py
+"""
+Cold-start benchmark for the app modules.
+
+For `app.main` and `app.media_studio` it measures, in fresh interpreters:
+
+  import      wall time of `import app.<module>` plus the heaviest imports
+              from `python -X importtime`
+  cold start  from spawning uvicorn to the first 200 from /proxy-image
+              (served from a local stub image server), with and without
+              the warm-up hook (FETCH_HELPER_WARMUP=1)
+
+and prints JSON. `--check` exits non-zero when the median cold start is over
+`--target-ms` (default 300), e.g. in CI on the autoscaler's instance type.
+
+    cd backend && python -m benchmarks.bench_startup --runs 5 --out startup.json
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List
+
+import requests
+
+from .run_bench import BACKEND_DIR, _free_port, _git_rev
+
+MODULES = ("main", "media_studio")
+TARGET_MS = 300.0
+TOP_IMPORTS = 10
+
+# smallest valid JPEG (1x1)
+_JPEG = bytes.fromhex(
+    "ffd8ffe000104a46494600010100000100010000ffdb004300080606070605080707070909080a0c140d0c0b0b0c1912130f141d1a1f"
+    "1e1d1a1c1c20242e2720222c231c1c2837292c30313434341f27393d38323c2e333432ffc0000b080001000101011100ffc4001f0000"
+    "010501010101010100000000000000000102030405060708090a0bffc400b5100002010303020403050504040000017d010203000411"
+    "05122131410613516107227114328191a1082342b1c11552d1f02433627282090a161718191a25262728292a3435363738393a434445"
+    "464748494a535455565758595a636465666768696a737475767778797a838485868788898a92939495969798999aa2a3a4a5a6a7a8a9"
+    "aab2b3b4b5b6b7b8b9bac2c3c4c5c6c7c8c9cad2d3d4d5d6d7d8d9dae1e2e3e4e5e6e7e8e9eaf1f2f3f4f5f6f7f8f9faffda0008010100"
+    "003f00fbd3ffd9")
+
+
+def _env(extra: Dict[str, str] = None) -> Dict[str, str]:
+    return {**os.environ, "PYTHONPATH": str(BACKEND_DIR), **(extra or {})}
+
+
+def _image_server() -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "image/jpeg")
+            self.send_header("Content-Length", str(len(_JPEG)))
+            self.end_headers()
+            self.wfile.write(_JPEG)
+
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv
+
+
+def import_time(module: str, runs: int) -> dict:
+    code = f"import time; t = time.perf_counter(); import app.{module}; print(time.perf_counter() - t)"
+    walls = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", code], cwd=str(BACKEND_DIR), env=_env(),
+                             capture_output=True, text=True, check=True)
+        walls.append(float(out.stdout.strip().splitlines()[-1]))
+
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import app.{module}"], cwd=str(BACKEND_DIR),
+                         env=_env(), capture_output=True, text=True, check=True)
+    top = []
+    for line in out.stderr.splitlines():
+        m = re.match(r"import time:\s+\d+ \|\s+(\d+) \| (\s*)(\S+)", line)
+        if m and len(m.group(2)) <= 4:  # app.<module> itself and what it imports directly or one level down
+            top.append((int(m.group(1)), m.group(3)))
+    top.sort(reverse=True)
+    return {
+        "median_ms": round(statistics.median(walls) * 1000, 1),
+        "min_ms": round(min(walls) * 1000, 1),
+        "heaviest": [{"module": name, "ms": round(us / 1000, 1)} for us, name in top[:TOP_IMPORTS]],
+    }
+
+
+def cold_start(module: str, image_url: str, runs: int, warm: bool) -> dict:
+    times: List[float] = []
+    for _ in range(runs):
+        port = _free_port()
+        base = f"http://127.0.0.1:{port}"
+        t0 = time.perf_counter()
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", f"app.{module}:app", "--port", str(port), "--log-level", "warning"],
+            cwd=str(BACKEND_DIR), env=_env({"FETCH_HELPER_WARMUP": "1" if warm else "0"}),
+        )
+        try:
+            while True:
+                if proc.poll() is not None:
+                    raise RuntimeError(f"server exited with {proc.returncode}")
+                if time.perf_counter() - t0 > 60:
+                    raise RuntimeError("server did not answer within 60s")
+                try:
+                    r = requests.get(base + "/proxy-image", params={"url": image_url}, timeout=5)
+                    if r.status_code == 200:
+                        break
+                except requests.RequestException:
+                    pass
+                time.sleep(0.005)
+            times.append(time.perf_counter() - t0)
+        finally:
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+    return {"median_ms": round(statistics.median(times) * 1000, 1), "min_ms": round(min(times) * 1000, 1),
+            "max_ms": round(max(times) * 1000, 1)}
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--modules", default=",".join(MODULES))
+    ap.add_argument("--target-ms", type=float, default=TARGET_MS, help="cold start budget to first /proxy-image")
+    ap.add_argument("--check", action="store_true", help="exit 1 if a median cold start is over the target")
+    ap.add_argument("--out", help="write JSON here as well as stdout")
+    args = ap.parse_args()
+
+    srv = _image_server()
+    image_url = f"http://127.0.0.1:{srv.server_port}/thumb.jpg"
+    results = {"python": sys.version.split()[0], "git": _git_rev(), "runs": args.runs,
+               "target_ms": args.target_ms, "modules": {}}
+    over = []
+    try:
+        for module in args.modules.split(","):
+            res = {
+                "import": import_time(module, args.runs),
+                "cold_start": cold_start(module, image_url, args.runs, warm=False),
+                "cold_start_warmup": cold_start(module, image_url, args.runs, warm=True),
+            }
+            if res["cold_start"]["median_ms"] > args.target_ms:
+                over.append(module)
+            results["modules"][module] = res
+    finally:
+        srv.shutdown()
+
+    text = json.dumps(results, indent=2)
+    print(text)
+    if args.out:
+        Path(args.out).write_text(text)
+    if args.check and over:
+        print(f"cold start over {args.target_ms:.0f} ms: {', '.join(over)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
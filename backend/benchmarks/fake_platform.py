@@ -0,0 +1,222 @@
+# backend/benchmarks/fake_platform.py
+"""
+Local stand-ins for the outside world, so the backend can be benchmarked offline.
+
+* A media server that serves ffmpeg-generated test media over HTTP with Range
+  support. yt-dlp's generic extractor handles the URLs directly:
+    /media/clip.mp4            progressive H.264/AAC (combined format)
+    /media/audio.m4a           audio only
+    /media/dash/manifest.mpd   separate video/audio representations (merge path)
+    /media/thumb.jpg           thumbnail for /proxy-image
+* A stub GPU server with the Colab notebook's routes
+  (/enhance-video-ai, /generate-music-ai) that answers after a fixed delay.
+
+    cd backend && python -m benchmarks.fake_platform --port 8765
+"""
+import argparse
+import io
+import os
+import re
+import shutil
+import subprocess
+import threading
+import time
+import wave
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+CONTENT_TYPES = {
+    ".mp4": "video/mp4",
+    ".m4a": "audio/mp4",
+    ".m4s": "video/iso.segment",
+    ".mpd": "application/dash+xml",
+    ".jpg": "image/jpeg",
+    ".webm": "video/webm",
+}
+
+
+def generate_media(root: Path, duration: int = 30, height: int = 720) -> Path:
+    """Create the test media once (skips files that already exist). Needs ffmpeg."""
+    media = root / "media"
+    (media / "dash").mkdir(parents=True, exist_ok=True)
+    width = height * 16 // 9
+    clip = media / "clip.mp4"
+    if not clip.exists():
+        subprocess.run([
+            "ffmpeg", "-y", "-v", "error",
+            "-f", "lavfi", "-i", f"testsrc2=size={width}x{height}:rate=30:duration={duration}",
+            "-f", "lavfi", "-i", f"sine=frequency=330:duration={duration}",
+            "-c:v", "libx264", "-preset", "veryfast", "-g", "60",
+            "-c:a", "aac", "-b:a", "128k", "-shortest", "-movflags", "+faststart", str(clip),
+        ], check=True)
+    if not (media / "audio.m4a").exists():
+        subprocess.run(["ffmpeg", "-y", "-v", "error", "-i", str(clip), "-vn", "-c:a", "copy",
+                        str(media / "audio.m4a")], check=True)
+    if not (media / "thumb.jpg").exists():
+        subprocess.run(["ffmpeg", "-y", "-v", "error", "-i", str(clip), "-frames:v", "1",
+                        str(media / "thumb.jpg")], check=True)
+    if not (media / "dash" / "manifest.mpd").exists():
+        subprocess.run([
+            "ffmpeg", "-y", "-v", "error", "-i", str(clip),
+            "-map", "0:v", "-map", "0:a", "-c", "copy",
+            "-f", "dash", "-use_template", "1", "-use_timeline", "1",
+            "-adaptation_sets", "id=0,streams=v id=1,streams=a",
+            str(media / "dash" / "manifest.mpd"),
+        ], check=True)
+    return media
+
+
+def _silence_wav(seconds: float = 5.0, rate: int = 32000) -> bytes:
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(b"\x00\x00" * int(seconds * rate))
+    return buf.getvalue()
+
+
+def make_handler(media_root: Path, gpu_delay: float):
+    wav_bytes = _silence_wav()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        # ---- media ----
+        def _media_path(self):
+            rel = self.path.split("?", 1)[0]
+            if not rel.startswith("/media/"):
+                return None
+            p = (media_root / rel[len("/media/"):]).resolve()
+            if media_root.resolve() not in p.parents or not p.is_file():
+                return None
+            return p
+
+        def _serve(self, head: bool):
+            p = self._media_path()
+            if p is None:
+                self.send_error(404)
+                return
+            size = p.stat().st_size
+            start, end = 0, size - 1
+            status = 200
+            m = re.match(r"bytes=(\d*)-(\d*)", self.headers.get("Range", ""))
+            if m and (m.group(1) or m.group(2)):
+                if m.group(1):
+                    start = int(m.group(1))
+                    end = min(int(m.group(2)), size - 1) if m.group(2) else size - 1
+                else:
+                    start = max(0, size - int(m.group(2)))
+                if start > end:
+                    self.send_response(416)
+                    self.send_header("Content-Range", f"bytes */{size}")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                status = 206
+            self.send_response(status)
+            self.send_header("Content-Type", CONTENT_TYPES.get(p.suffix, "application/octet-stream"))
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("Content-Length", str(end - start + 1))
+            if status == 206:
+                self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+            self.end_headers()
+            if head:
+                return
+            with open(p, "rb") as f:
+                f.seek(start)
+                remaining = end - start + 1
+                while remaining > 0:
+                    chunk = f.read(min(256 * 1024, remaining))
+                    if not chunk:
+                        break
+                    try:
+                        self.wfile.write(chunk)
+                    except (BrokenPipeError, ConnectionResetError):
+                        return
+                    remaining -= len(chunk)
+
+        def do_HEAD(self):
+            self._serve(head=True)
+
+        def do_GET(self):
+            self._serve(head=False)
+
+        # ---- stub GPU ----
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            remaining = length
+            while remaining > 0:
+                chunk = self.rfile.read(min(1024 * 1024, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+            time.sleep(gpu_delay)
+            if self.path.startswith("/enhance-video-ai"):
+                body = (media_root / "clip.mp4").read_bytes()
+                ctype = "video/mp4"
+            elif self.path.startswith("/generate-music-ai"):
+                body, ctype = wav_bytes, "audio/wav"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return Handler
+
+
+class FakePlatform:
+    """Runs the media + stub GPU server in a background thread."""
+
+    def __init__(self, workdir: Path, port: int = 0, gpu_delay: float = 0.5, duration: int = 30):
+        self.media_root = generate_media(workdir, duration=duration)
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(self.media_root, gpu_delay))
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def url(self, name: str) -> str:
+        return f"{self.base_url}/media/{name}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--workdir", default=os.path.join(os.getcwd(), ".bench_media"))
+    ap.add_argument("--gpu-delay", type=float, default=0.5)
+    ap.add_argument("--duration", type=int, default=30)
+    ap.add_argument("--regenerate", action="store_true")
+    args = ap.parse_args()
+    workdir = Path(args.workdir)
+    if args.regenerate and workdir.exists():
+        shutil.rmtree(workdir)
+    with FakePlatform(workdir, args.port, args.gpu_delay, args.duration) as fp:
+        print(f"serving {fp.media_root} at {fp.base_url} (Ctrl+C to stop)")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,348 @@
+# backend/benchmarks/run_bench.py
+"""
+Offline end-to-end benchmark of the media backend.
+
+Starts the fake platform (test media + stub GPU), launches `app.main` and
+`app.media_studio` under uvicorn pointed at it, then drives each scenario at
+the given concurrency and prints comparable JSON:
+
+    cd backend && python -m benchmarks.run_bench --concurrency 4 --requests 20 --out bench.json
+    python -m benchmarks.run_bench --compare before.json after.json
+
+Per scenario: p50/p95/p99/max latency, throughput (req/s and response MB/s),
+error count, peak RSS of the server process tree and disk I/O (server process
+counters from /proc/<pid>/io plus system-wide /proc/diskstats). Linux only for
+the RSS/I/O figures; they are reported as null elsewhere.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import requests
+
+from .fake_platform import FakePlatform
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+# ---------- process sampling ----------
+def _children(pid: int) -> List[int]:
+    out = []
+    try:
+        for task in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{task}/children") as f:
+                out.extend(int(c) for c in f.read().split())
+    except OSError:
+        pass
+    return out
+
+
+def _tree(pid: int) -> List[int]:
+    pids, stack = [], [pid]
+    while stack:
+        p = stack.pop()
+        pids.append(p)
+        stack.extend(_children(p))
+    return pids
+
+
+def _rss_bytes(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def _proc_io(pid: int) -> Optional[Dict[str, int]]:
+    try:
+        with open(f"/proc/{pid}/io") as f:
+            return {k: int(v) for k, v in (line.strip().split(": ") for line in f)}
+    except OSError:
+        return None
+
+
+def _disk_sectors() -> Optional[Dict[str, int]]:
+    try:
+        read = written = 0
+        with open("/proc/diskstats") as f:
+            for line in f:
+                parts = line.split()
+                name = parts[2]
+                # whole devices only, to avoid double counting partitions
+                if name.startswith(("loop", "ram")) or (name[-1].isdigit() and not name.startswith(("nvme", "mmcblk"))):
+                    continue
+                if name.startswith(("nvme", "mmcblk")) and "p" in name[4:]:
+                    continue
+                read += int(parts[5])
+                written += int(parts[9])
+        return {"read_bytes": read * 512, "write_bytes": written * 512}
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+class Sampler:
+    """Tracks peak RSS of a process tree while a scenario runs."""
+
+    def __init__(self, pid: int, interval: float = 0.1):
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, sum(_rss_bytes(p) for p in _tree(self.pid)))
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+# ---------- servers ----------
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class AppServer:
+    def __init__(self, module: str, env: Dict[str, str]):
+        self.port = _free_port()
+        self.proc = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", f"app.{module}:app", "--port", str(self.port), "--log-level", "warning"],
+            cwd=str(BACKEND_DIR), env={**os.environ, **env, "PYTHONPATH": str(BACKEND_DIR)},
+        )
+        self.base = f"http://127.0.0.1:{self.port}"
+        self.startup_seconds = self._wait_ready()
+
+    def _wait_ready(self, timeout: float = 60.0) -> float:
+        t0 = time.perf_counter()
+        while time.perf_counter() - t0 < timeout:
+            if self.proc.poll() is not None:
+                raise RuntimeError(f"server exited with {self.proc.returncode}")
+            try:
+                requests.get(self.base + "/metrics", timeout=1)
+                return time.perf_counter() - t0
+            except requests.RequestException:
+                time.sleep(0.05)
+        raise RuntimeError("server did not start")
+
+    def close(self):
+        self.proc.terminate()
+        try:
+            self.proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+
+
+# ---------- scenarios ----------
+def build_scenarios(fp: FakePlatform, main: AppServer, studio: AppServer) -> Dict[str, Callable[[requests.Session], requests.Response]]:
+    clip, audio, mpd = fp.url("clip.mp4"), fp.url("audio.m4a"), fp.url("dash/manifest.mpd")
+    clip_path = fp.media_root / "clip.mp4"
+
+    def upload(s, url, data=None):
+        with open(clip_path, "rb") as f:
+            return s.post(url, files={"file": ("clip.mp4", f, "video/mp4")}, data=data or {}, timeout=1800)
+
+    def generate_music(s):
+        r = s.post(main.base + "/generate-music", data={"url": audio}, timeout=1800)
+        if r.status_code >= 400:
+            return r
+        # a seek into the first variation: waits for its render unless the background already finished it
+        return s.get(main.base + r.json()["results"][0]["stream_url"], headers={"Range": "bytes=1024-"},
+                     timeout=1800)
+
+    return {
+        "info": lambda s: s.post(studio.base + "/info", json={"url": clip}, timeout=300),
+        "proxy-image": lambda s: s.get(main.base + "/proxy-image", params={"url": fp.url("thumb.jpg")}, timeout=60),
+        "download-combined": lambda s: s.post(main.base + "/download", json={"url": clip, "mode": "video"}, timeout=1800),
+        "download-merge": lambda s: s.post(main.base + "/download", json={"url": mpd, "mode": "video"}, timeout=1800),
+        "download-audio": lambda s: s.post(main.base + "/download", json={"url": audio, "mode": "audio"}, timeout=1800),
+        "generate-music": generate_music,
+        "enhance-video-remote": lambda s: upload(s, main.base + "/enhance-video"),
+        "enhance-video-local": lambda s: upload(s, studio.base + "/enhance-video"),
+    }
+
+
+def _percentile(sorted_vals: List[float], pct: float) -> Optional[float]:
+    if not sorted_vals:
+        return None
+    k = max(0, min(len(sorted_vals) - 1, math.ceil(pct / 100.0 * len(sorted_vals)) - 1))
+    return round(sorted_vals[k], 4)
+
+
+def run_scenario(fn, n: int, concurrency: int, server_pids: List[int]) -> dict:
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    body_bytes = [0]
+    lock = threading.Lock()
+    local = threading.local()
+
+    def one(_):
+        s = getattr(local, "session", None)
+        if s is None:
+            s = local.session = requests.Session()
+        t0 = time.perf_counter()
+        try:
+            r = fn(s)
+            size = len(r.content)
+            ok = r.status_code < 400
+            key = None if ok else str(r.status_code)
+        except requests.RequestException as e:
+            size, ok, key = 0, False, type(e).__name__
+        dt = time.perf_counter() - t0
+        with lock:
+            if ok:
+                latencies.append(dt)
+                body_bytes[0] += size
+            else:
+                errors[key] = errors.get(key, 0) + 1
+
+    io_before = [_proc_io(p) for p in server_pids]
+    disk_before = _disk_sectors()
+    samplers = [Sampler(p) for p in server_pids]
+    for smp in samplers:
+        smp.__enter__()
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(n)))
+    wall = time.perf_counter() - t0
+    for smp in samplers:
+        smp.__exit__(None, None, None)
+    io_after = [_proc_io(p) for p in server_pids]
+    disk_after = _disk_sectors()
+
+    proc_io = None
+    if all(io_before) and all(io_after):
+        proc_io = {k: sum(a[k] - b[k] for a, b in zip(io_after, io_before)) for k in ("read_bytes", "write_bytes")}
+    disk_io = None
+    if disk_before and disk_after:
+        disk_io = {k: disk_after[k] - disk_before[k] for k in disk_before}
+
+    lat = sorted(latencies)
+    return {
+        "requests": n,
+        "concurrency": concurrency,
+        "ok": len(lat),
+        "errors": errors,
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(len(lat) / wall, 3) if wall else None,
+        "throughput_mb_s": round(body_bytes[0] / wall / 1e6, 3) if wall else None,
+        "latency": {
+            "p50": _percentile(lat, 50), "p95": _percentile(lat, 95), "p99": _percentile(lat, 99),
+            "max": round(lat[-1], 4) if lat else None,
+            "mean": round(sum(lat) / len(lat), 4) if lat else None,
+        },
+        "peak_rss_bytes": sum(smp.peak for smp in samplers) or None,
+        "server_io": proc_io,
+        "system_disk_io": disk_io,
+    }
+
+
+# ---------- compare ----------
+def compare(before_path: str, after_path: str):
+    before = json.loads(Path(before_path).read_text())["scenarios"]
+    after = json.loads(Path(after_path).read_text())["scenarios"]
+    rows = {}
+    for name in sorted(set(before) & set(after)):
+        b, a = before[name], after[name]
+
+        def ratio(x, y):
+            return round(y / x, 3) if x and y is not None else None
+
+        rows[name] = {
+            "p50_ratio": ratio(b["latency"]["p50"], a["latency"]["p50"]),
+            "p95_ratio": ratio(b["latency"]["p95"], a["latency"]["p95"]),
+            "p99_ratio": ratio(b["latency"]["p99"], a["latency"]["p99"]),
+            "throughput_ratio": ratio(b["throughput_rps"], a["throughput_rps"]),
+            "peak_rss_ratio": ratio(b["peak_rss_bytes"], a["peak_rss_bytes"]),
+        }
+    print(json.dumps(rows, indent=2))
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--concurrency", type=int, default=4)
+    ap.add_argument("--requests", type=int, default=20, help="requests per scenario")
+    ap.add_argument("--scenarios", default="all", help="comma separated subset, or 'all'")
+    ap.add_argument("--gpu-delay", type=float, default=0.5, help="stub GPU processing time (s)")
+    ap.add_argument("--media-duration", type=int, default=30, help="length of the generated clip (s)")
+    ap.add_argument("--workdir", default=None, help="where generated media is kept between runs")
+    ap.add_argument("--out", help="write JSON here as well as stdout")
+    ap.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="compare two result files and exit")
+    args = ap.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    workdir = Path(args.workdir or Path(tempfile.gettempdir()) / "fetch_helper_bench")
+    with FakePlatform(workdir, gpu_delay=args.gpu_delay, duration=args.media_duration) as fp:
+        main_srv = AppServer("main", {"COLAB_GPU_URL": fp.base_url})
+        # media_studio without a GPU URL exercises the local FFmpeg enhancer
+        studio_srv = AppServer("media_studio", {"COLAB_GPU_URL": ""})
+        try:
+            scenarios = build_scenarios(fp, main_srv, studio_srv)
+            names = list(scenarios) if args.scenarios == "all" else [n.strip() for n in args.scenarios.split(",")]
+            pids = [main_srv.proc.pid, studio_srv.proc.pid]
+            results = {}
+            for name in names:
+                print(f"running {name} ...", file=sys.stderr)
+                results[name] = run_scenario(scenarios[name], args.requests, args.concurrency, pids)
+            report = {
+                "meta": {
+                    "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                    "cpu_count": os.cpu_count(),
+                    "git_rev": _git_rev(),
+                    "concurrency": args.concurrency,
+                    "requests_per_scenario": args.requests,
+                    "gpu_delay": args.gpu_delay,
+                    "media_duration": args.media_duration,
+                    "startup_seconds": {"main": round(main_srv.startup_seconds, 3),
+                                        "media_studio": round(studio_srv.startup_seconds, 3)},
+                },
+                "scenarios": results,
+            }
+        finally:
+            main_srv.close()
+            studio_srv.close()
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.out:
+        Path(args.out).write_text(text)
+
+
+def _git_rev() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=str(BACKEND_DIR),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app import admission
+
+
+def _gate(**kw):
+    limits = {"slots": 1, "queue": 1, "max_wait": 5.0, "service": 10.0}
+    limits.update(kw)
+    return admission.Gate("test", **limits)
+
+
+def test_full_queue_is_rejected_with_retry_after():
+    async def run():
+        gate = _gate(queue=1)
+        await gate.acquire()
+        waiter = asyncio.create_task(gate.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(HTTPException) as e:
+            await gate.acquire()
+        assert e.value.status_code == 503
+        # one queued ahead of the caller: two 10 s holds on one slot
+        assert e.value.headers["Retry-After"] == "20"
+        gate.release()
+        await waiter
+        assert gate.active == 1 and gate.queued() == 0
+    asyncio.run(run())
+
+
+def test_retry_after_is_clamped():
+    gate = _gate(service=0.01)
+    assert gate.retry_after() == admission.RETRY_AFTER_MIN
+    gate = _gate(service=10_000.0)
+    assert gate.retry_after() == admission.RETRY_AFTER_MAX
+
+
+def test_waiter_past_the_deadline_gets_503():
+    async def run():
+        gate = _gate(max_wait=0.05)
+        await gate.acquire()
+        with pytest.raises(HTTPException) as e:
+            await gate.acquire()
+        assert e.value.status_code == 503 and "Retry-After" in e.value.headers
+        assert gate.queued() == 0
+        gate.release()
+        assert gate.active == 0
+    asyncio.run(run())
+
+
+def test_cancelled_waiter_gives_up_its_place():
+    async def run():
+        gate = _gate(queue=2)
+        await gate.acquire()
+        gone = asyncio.create_task(gate.acquire())
+        await asyncio.sleep(0)
+        nxt = asyncio.create_task(gate.acquire())
+        await asyncio.sleep(0)
+        gone.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await gone
+        assert gate.queued() == 1
+        gate.release()
+        await nxt  # the slot skips the cancelled waiter
+        assert gate.active == 1 and gate.queued() == 0
+    asyncio.run(run())
+
+
+def test_check_matches_acquire():
+    async def run():
+        gate = _gate(queue=0)
+        gate.check()
+        await gate.acquire()
+        with pytest.raises(HTTPException):
+            gate.check()
+    asyncio.run(run())
+
+
+def test_batch_items_hold_a_download_slot(monkeypatch, tmp_path):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    from app import main
+
+    gate = admission.GATES["download"]
+    seen = []
+
+    def extract(opts, url):
+        seen.append(gate.active)
+        return {"title": "t", "extractor_key": "Generic"}
+
+    def download(url, mode, info, preferred, tmpdir, job_id, **kw):
+        path = tmp_path / f"{job_id}.mp4"
+        path.write_bytes(b"x")
+        return str(path), path.name, "video/mp4"
+
+    monkeypatch.setattr(main, "_extract_info_with_cookies", extract)
+    monkeypatch.setattr(main, "_download_selected", download)
+    app = FastAPI()
+    app.include_router(main.router)
+    client = TestClient(app)
+    r = client.post("/batch", json={"urls": ["https://example.com/a.mp4"], "mode": "video"})
+    assert r.status_code == 200 and seen == [1] and gate.active == 0
+
+    monkeypatch.setattr(gate, "slots", 1)
+    monkeypatch.setattr(gate, "queue", 0)
+    monkeypatch.setattr(gate, "active", 1)
+    r = client.post("/batch", json={"urls": ["https://example.com/a.mp4"], "mode": "video"})
+    assert r.status_code == 503 and "Retry-After" in r.headers
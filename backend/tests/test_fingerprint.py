@@ -0,0 +1,62 @@
+import time
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from app import fingerprint  # noqa: E402
+from app.fingerprint import FP_SAMPLE_RATE, FingerprintIndex  # noqa: E402
+
+
+def _noise_song(seed, seconds):
+    rng = np.random.default_rng(seed)
+    # band-limited random energy envelope: enough structure for stable sub-fingerprints
+    steps = rng.normal(0, 1, int(seconds * 20))
+    env = np.repeat(steps, FP_SAMPLE_RATE // 20)
+    t = np.arange(len(env)) / FP_SAMPLE_RATE
+    tones = sum(np.sin(2 * np.pi * f * t) * rng.uniform(0.2, 1) for f in rng.uniform(300, 2000, 12))
+    return (tones * env).astype(np.float32)
+
+
+@pytest.fixture
+def index(tmp_path):
+    return FingerprintIndex(tmp_path / "fp.sqlite3")
+
+
+def test_same_recording_matches(index):
+    song = _noise_song(1, 60)
+    index.add("orig", fingerprint.fingerprint_pcm(song), 60.0)
+    hit = index.match(fingerprint.fingerprint_pcm(song * 0.5), 60.0)
+    assert hit and hit[0] == "orig"
+
+
+def test_excerpt_and_partial_overlap_keep_their_own_digest(index):
+    song = _noise_song(1, 60)
+    index.add("orig", fingerprint.fingerprint_pcm(song), 60.0)
+    excerpt = song[: 30 * FP_SAMPLE_RATE]
+    assert index.match(fingerprint.fingerprint_pcm(excerpt), 30.0) is None
+    # same length, but only the first third is the indexed song
+    medley = np.concatenate([song[: 20 * FP_SAMPLE_RATE], _noise_song(2, 40)])
+    assert index.match(fingerprint.fingerprint_pcm(medley), 60.0) is None
+    # unknown duration never reuses another track
+    assert index.match(fingerprint.fingerprint_pcm(song), None) is None
+
+
+def test_durations_agree():
+    assert fingerprint.durations_agree(200.0, 203.5)
+    assert not fingerprint.durations_agree(200.0, 190.0)
+    assert not fingerprint.durations_agree(None, 200.0)
+
+
+def test_url_alias_needs_duration_and_freshness(index, monkeypatch):
+    monkeypatch.setattr(fingerprint, "INDEX", index)
+    monkeypatch.setattr(fingerprint, "FP_ENABLED", True)
+    fp = fingerprint.fingerprint_pcm(_noise_song(1, 20))
+    index.add("old", fp)  # indexed without a duration
+    index.alias("http://a", "old")
+    assert fingerprint.lookup_url("http://a") is None
+    index.add("new", fingerprint.fingerprint_pcm(_noise_song(3, 20)), 20.0)
+    index.alias("http://b", "new")
+    assert fingerprint.lookup_url("http://b") == "new"
+    monkeypatch.setattr(fingerprint.time, "time", lambda: time.monotonic() + 1e12)
+    assert fingerprint.lookup_url("http://b") is None
@@ -0,0 +1,41 @@
+from app import format_policy
+
+# a typical YouTube list: progressive 360p, avc1/vp9 video-only ladders, m4a/opus audio (tbr in kbps)
+FORMATS = [
+    {"format_id": "18", "ext": "mp4", "vcodec": "avc1.42001E", "acodec": "mp4a.40.2", "height": 360, "tbr": 500},
+    {"format_id": "134", "ext": "mp4", "vcodec": "avc1.4d401e", "acodec": "none", "height": 360, "tbr": 300},
+    {"format_id": "136", "ext": "mp4", "vcodec": "avc1.4d401f", "acodec": "none", "height": 720, "tbr": 1200},
+    {"format_id": "137", "ext": "mp4", "vcodec": "avc1.640028", "acodec": "none", "height": 1080, "tbr": 2500},
+    {"format_id": "248", "ext": "webm", "vcodec": "vp9", "acodec": "none", "height": 1080, "tbr": 1800},
+    {"format_id": "140", "ext": "m4a", "vcodec": "none", "acodec": "mp4a.40.2", "abr": 129, "tbr": 129},
+    {"format_id": "251", "ext": "webm", "vcodec": "none", "acodec": "opus", "abr": 140, "tbr": 140},
+]
+
+
+def _ids(plan):
+    return plan["video"]["format_id"], plan["audio"] and plan["audio"]["format_id"]
+
+
+def test_preferred_height_kept_at_any_duration_without_budget():
+    for duration in (60, 300, 1800, 3600, 7200, 10800, 36000):
+        plan = format_policy.choose(FORMATS, preferred_resolution=1080, duration=duration)
+        assert _ids(plan) == ("137", "140"), (duration, plan["explain"])
+        assert "bytes" not in plan["cost"]
+
+
+def test_preferred_height_without_duration():
+    assert _ids(format_policy.choose(FORMATS, preferred_resolution=720)) == ("136", "140")
+
+
+def test_budget_trades_quality_for_bytes():
+    duration = 3600
+    plan = format_policy.choose(FORMATS, preferred_resolution=1080, duration=duration, max_bytes=800_000_000)
+    assert plan["estimated_bytes"] <= 800_000_000
+    assert plan["video"]["height"] < 1080
+    assert "bytes" in plan["cost"]
+
+
+def test_over_budget_only_when_nothing_fits():
+    plan = format_policy.choose(FORMATS, preferred_resolution=1080, duration=3600, max_bytes=1_000)
+    assert plan is not None
+    assert "over budget" in plan["explain"][0]
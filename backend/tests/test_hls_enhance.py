@@ -0,0 +1,80 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import hls_enhance, media_studio
+
+
+@pytest.fixture
+def enc(tmp_path):
+    e = hls_enhance._Encode("enhance_hlstest", tmp_path / "in.mp4", tmp_path / "out.mp4", "in.mp4")
+    e.workdir.mkdir()
+    hls_enhance._register(e)
+    yield e
+    with hls_enhance._LOCK:
+        hls_enhance._ENCODES.pop(e.job_id, None)
+
+
+def _write_playlist(enc, segments, final=True):
+    lines = ["#EXTM3U", "#EXT-X-VERSION:7", f'#EXT-X-MAP:URI="{hls_enhance.HLS_INIT}"']
+    for name in segments:
+        lines += ["#EXTINF:4.000000,", name]
+    if final:
+        lines.append("#EXT-X-ENDLIST")
+    (enc.workdir / hls_enhance.HLS_PLAYLIST).write_text("\n".join(lines) + "\n")
+
+
+def test_segment_path_only_serves_known_names(enc):
+    for name in ("index.m3u8", "init.mp4", "seg_00003.m4s"):
+        assert hls_enhance.segment_path(enc, name) == enc.workdir / name
+    for name in ("../in.mp4", "..%2Fin.mp4", "seg_3.m4s", "seg_00003.m4s/../../x", "/etc/passwd",
+                 "video.mp4", "index.m3u8.bak", ""):
+        assert hls_enhance.segment_path(enc, name) is None, name
+
+
+def test_assemble_needs_a_finalized_playlist(enc):
+    (enc.workdir / hls_enhance.HLS_INIT).write_bytes(b"I")
+    (enc.workdir / "seg_00000.m4s").write_bytes(b"0")
+    _write_playlist(enc, ["seg_00000.m4s"], final=False)
+    with pytest.raises(RuntimeError, match="not finalized"):
+        hls_enhance._assemble(enc)
+    assert not enc.output_path.exists()
+
+
+def test_assemble_concatenates_in_playlist_order(enc):
+    (enc.workdir / hls_enhance.HLS_INIT).write_bytes(b"INIT|")
+    for i in range(3):
+        (enc.workdir / f"seg_{i:05d}.m4s").write_bytes(f"s{i}|".encode())
+    _write_playlist(enc, ["seg_00002.m4s", "seg_00000.m4s", "seg_00001.m4s"])
+    hls_enhance._assemble(enc)
+    assert enc.output_path.read_bytes() == b"INIT|s2|s0|s1|"
+    assert not list(enc.output_path.parent.glob(".*.part"))
+
+
+def _client():
+    app = FastAPI()
+    app.include_router(media_studio.router)
+    return TestClient(app)
+
+
+def test_mp4_route_follows_the_encode_state(enc):
+    client = _client()
+    r = client.get(f"/enhanced/{enc.job_id}/video.mp4")
+    assert r.status_code == 409 and r.headers["Retry-After"] == "10"
+
+    enc.finish("failed", "FFmpeg failed: boom")
+    r = client.get(f"/enhanced/{enc.job_id}/video.mp4")
+    assert r.status_code == 500 and "boom" in r.json()["detail"]
+
+    enc.output_path.write_bytes(b"mp4")
+    enc.finish("done")
+    r = client.get(f"/enhanced/{enc.job_id}/video.mp4")
+    assert r.status_code == 200 and r.content == b"mp4"
+
+
+def test_route_rejects_other_files(enc):
+    (enc.workdir.parent / "secret.txt").write_text("x")
+    client = _client()
+    assert client.get(f"/enhanced/{enc.job_id}/..%2Fsecret.txt").status_code == 404
+    assert client.get(f"/enhanced/{enc.job_id}/seg_00009.m4s").status_code == 404
+    assert client.get("/enhanced/enhance_unknown/index.m3u8").status_code == 404
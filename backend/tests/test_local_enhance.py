@@ -0,0 +1,22 @@
+from app import media_studio
+from app.parallel_enhance import ChunkingUnavailable
+
+
+def _run(monkeypatch, chunked_error):
+    calls = []
+
+    def fake_chunked(input_p, output_p, job_id):
+        calls.append("chunked")
+        if chunked_error:
+            raise chunked_error
+
+    monkeypatch.setattr(media_studio, "enhance_chunked", fake_chunked)
+    monkeypatch.setattr(media_studio, "_local_upscale", lambda i, o, j: calls.append("single"))
+    used_chunks = media_studio._local_enhance("in.mp4", "out.mp4", "enhance_test", chunked=True)
+    return used_chunks, calls
+
+
+def test_chunked_failure_falls_back_to_one_process(monkeypatch):
+    assert _run(monkeypatch, RuntimeError("ffmpeg segment 3 failed")) == (False, ["chunked", "single"])
+    assert _run(monkeypatch, ChunkingUnavailable("too short")) == (False, ["chunked", "single"])
+    assert _run(monkeypatch, None) == (True, ["chunked"])
@@ -0,0 +1,77 @@
+import asyncio
+import threading
+
+from app import admission, music_render
+
+
+def test_background_renders_take_only_idle_transcode_slots(monkeypatch, tmp_path):
+    gate = admission.Gate("transcode", slots=1, queue=2, max_wait=5.0, service=1.0)
+    monkeypatch.setitem(admission.GATES, "transcode", gate)
+    monkeypatch.setattr(music_render, "MUSIC_PRERENDER", True)
+    monkeypatch.setattr(music_render, "MUSIC_SLOT_POLL", 0.01)
+    monkeypatch.setattr(music_render, "_ingest", lambda job_id, input_path, url: "digest")
+    rendered = []
+    done = threading.Event()
+
+    def fake_render(render, trigger):
+        rendered.append((render.variation["id"], gate.active))
+        with music_render._LOCK:
+            render.state = "done"
+            render.done.set()
+        if len(rendered) == len(music_render.MUSIC_VARIATIONS):
+            done.set()
+
+    monkeypatch.setattr(music_render, "_render", fake_render)
+
+    async def scenario():
+        request = await admission.admit("transcode").acquire()  # a request holds the only slot
+        await music_render.start("gen_test", tmp_path / "in.mp3", tmp_path)
+        await asyncio.sleep(0.2)
+        assert rendered == []  # nothing renders past the request
+        request.release()
+        while not done.is_set():
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.05)
+        return gate.active
+
+    assert asyncio.run(scenario()) == 0
+    assert all(active == 1 for _vid, active in rendered)
+    music_render.forget("gen_test")
+
+
+def test_waiting_for_a_render_keeps_the_loop_free(monkeypatch, tmp_path):
+    monkeypatch.setattr(music_render, "MUSIC_PRERENDER", False)
+    monkeypatch.setattr(music_render, "RENDER_POLL", 0.01)
+    monkeypatch.setattr(music_render, "_ingest", lambda job_id, input_path, url: "digest")
+    var_ids = [v["id"] for v in music_render.MUSIC_VARIATIONS[:2]]
+
+    async def scenario():
+        await music_render.start("gen_wait", tmp_path / "in.mp3", tmp_path)
+        ok, bad = (music_render._lookup("gen_wait", v) for v in var_ids)
+        for render in (ok, bad):
+            assert music_render._claim(render)  # someone else's render is running
+
+        def finish():
+            for render, state in ((ok, "done"), (bad, "failed")):
+                with music_render._LOCK:
+                    render.state, render.error = state, "boom" if state == "failed" else None
+                    render.done.set()
+
+        waiters = [asyncio.ensure_future(music_render.wait_rendered("gen_wait", v)) for v in var_ids]
+        for _ in range(5):  # the loop keeps running other work meanwhile
+            await asyncio.sleep(0.01)
+        assert not any(w.done() for w in waiters)
+        threading.Timer(0.05, finish).start()
+        assert await waiters[0] == ok.path
+        try:
+            await waiters[1]
+        except RuntimeError as e:
+            assert "boom" in str(e)
+        else:
+            raise AssertionError("a failed render must raise")
+        assert await music_render.wait_rendered("gen_wait", "nope") is None
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        music_render.forget("gen_wait")
@@ -0,0 +1,39 @@
+import subprocess
+import time
+
+import pytest
+
+from app import parallel_enhance
+from app.registry import cleanup_registry, register_process
+
+
+def test_first_segment_failure_stops_the_others(monkeypatch):
+    job_id = "enhance_segfail"
+    sleepers = []
+
+    def fake_ffmpeg(cmd, job, label, duration=None):
+        if label == "split":
+            out = cmd[-1]
+            for i in range(6):
+                open(out % i, "wb").close()
+        elif label.endswith("src_0001"):
+            time.sleep(0.2)
+            raise RuntimeError("ffmpeg enhance src_0001 failed: boom")
+        else:
+            p = subprocess.Popen(["sleep", "30"])
+            register_process(job, p)
+            sleepers.append(p)
+            p.wait()
+
+    monkeypatch.setattr(parallel_enhance, "probe_duration", lambda path, job: 600.0)
+    monkeypatch.setattr(parallel_enhance, "keyframe_times", lambda path, job: [float(t) for t in range(0, 600, 2)])
+    monkeypatch.setattr(parallel_enhance, "_ffmpeg", fake_ffmpeg)
+    t0 = time.monotonic()
+    try:
+        with pytest.raises(RuntimeError, match="boom"):
+            parallel_enhance.enhance_chunked("in.mp4", "out.mp4", job_id, workers=3)
+        assert time.monotonic() - t0 < 10
+        assert len(sleepers) <= 3  # of 5; the freed worker may pick up one more before the queue is cancelled
+        assert all(p.poll() is not None for p in sleepers)
+    finally:
+        cleanup_registry(job_id)
@@ -0,0 +1,56 @@
+import threading
+import time
+
+import pytest
+
+from app import prefetch, ranged_fetch
+from app.progress import update_progress
+from app.registry import kill_processes
+
+URL = "https://example.com/watch?v=abc"
+FMT = {"format_id": "18", "ext": "mp4"}
+
+
+@pytest.fixture
+def entry(monkeypatch, tmp_path):
+    monkeypatch.setattr(prefetch, "PREFETCH_DIR", tmp_path)
+    key = prefetch._key(URL, FMT["format_id"])
+    e = prefetch._ENTRIES[key] = prefetch._Entry(key, URL, FMT, 1000)
+    e.started = True
+    yield e
+    prefetch._ENTRIES.pop(key, None)
+
+
+def _progress(e, got, total, speed):
+    update_progress(e.job_id, "prefetch", {"state": "running", "bytes": got, "total": total, "speed": speed})
+
+
+def test_slow_prefetch_is_cancelled_not_waited_for(entry, tmp_path):
+    _progress(entry, 1_000_000, 100_000_000, 100_000.0)  # ~990 s to go
+    t0 = time.monotonic()
+    assert prefetch.claim(URL, FMT, str(tmp_path / "out.mp4")) is None
+    assert time.monotonic() - t0 < 2
+    assert entry.dropped
+
+
+def test_nearly_done_prefetch_is_adopted(entry, tmp_path):
+    _progress(entry, 99_000_000, 100_000_000, 10_000_000.0)
+
+    def finish():
+        time.sleep(0.3)
+        entry.path.write_bytes(b"media")
+        entry.ok = True
+        entry.done.set()
+
+    threading.Thread(target=finish).start()
+    dest = tmp_path / "out.mp4"
+    assert prefetch.claim(URL, FMT, str(dest)) == str(dest)
+    assert dest.read_bytes() == b"media"
+
+
+def test_wait_honours_download_cancel(entry, tmp_path):
+    _progress(entry, 99_000_000, 100_000_000, 10_000_000.0)
+    threading.Timer(0.3, kill_processes, ("dl_test",)).start()
+    with pytest.raises(ranged_fetch.FetchCancelled):
+        prefetch.claim(URL, FMT, str(tmp_path / "out.mp4"), "dl_test")
+    assert entry.dropped
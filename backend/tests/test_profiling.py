@@ -0,0 +1,81 @@
+import asyncio
+import json
+import pstats
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import profiling
+
+
+def _client(host):
+    app = FastAPI()
+    app.include_router(profiling.router)
+    return TestClient(app, client=(host, 50000))
+
+
+def test_admin_without_token_is_loopback_only(monkeypatch):
+    monkeypatch.setattr(profiling, "ADMIN_TOKEN", None)
+    assert _client("127.0.0.1").get("/admin/profiling").status_code == 200
+    assert _client("203.0.113.7").get("/admin/profiling").status_code == 403
+
+
+def test_admin_with_token_requires_it(monkeypatch):
+    monkeypatch.setattr(profiling, "ADMIN_TOKEN", "s3cret")
+    client = _client("127.0.0.1")
+    assert client.get("/admin/profiling").status_code == 403
+    assert client.get("/admin/profiling", headers={"X-Admin-Token": "wrong"}).status_code == 403
+    assert client.get("/admin/profiling", headers={"X-Admin-Token": "s3cret"}).status_code == 200
+
+
+def test_profile_header_ignored_for_remote_clients(monkeypatch):
+    monkeypatch.setattr(profiling, "ADMIN_TOKEN", None)
+    assert not profiling._admin_ok({"client": ("203.0.113.7", 1)}, None)
+    assert profiling._admin_ok({"client": ("::1", 1)}, None)
+    assert not profiling._admin_ok({}, None)
+
+
+def _busy_marker():
+    return sum(range(1000))
+
+
+def test_overlapping_profiled_requests_share_one_loop_profile(monkeypatch, tmp_path):
+    monkeypatch.setattr(profiling, "ADMIN_TOKEN", None)
+    monkeypatch.setattr(profiling, "PROFILE_DIR", tmp_path)
+    first_in, second_done = asyncio.Event(), asyncio.Event()
+    ids = {}
+
+    async def app(scope, receive, send):
+        if scope["path"] == "/first":
+            first_in.set()
+            await second_done.wait()
+            _busy_marker()  # after the second request's profiler has stopped
+        else:
+            await first_in.wait()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def request(mw, path):
+        async def receive():
+            return {"type": "http.request", "body": b""}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                ids[path] = dict(message["headers"])[b"x-profile-id"].decode()
+        scope = {"type": "http", "method": "GET", "path": path, "client": ("127.0.0.1", 1),
+                 "headers": [(b"x-profile", b"1")]}
+        await mw(scope, receive, send)
+        if path == "/second":
+            second_done.set()
+
+    async def both():
+        mw = profiling.ProfilingMiddleware(app)
+        await asyncio.gather(request(mw, "/first"), request(mw, "/second"))
+
+    asyncio.run(both())
+    first = json.loads((tmp_path / f"{ids['/first']}.json").read_text())
+    second = json.loads((tmp_path / f"{ids['/second']}.json").read_text())
+    assert first["has_cpu_profile"] and not second["has_cpu_profile"]
+    stats = pstats.Stats(str(tmp_path / f"{ids['/first']}.prof")).stats
+    assert any(fn[2] == "_busy_marker" for fn in stats)  # still profiling after the second request ended
+    assert not profiling._LOOP_PROFILE.locked()
@@ -0,0 +1,15 @@
+from app import progress
+
+
+def test_job_ids_are_generated_and_client_ids_are_labels():
+    a = progress.new_job_id("dl", "my-download")
+    b = progress.new_job_id("dl", "my-download")
+    assert a != b and a.startswith("dl_") and "my-download" not in a
+    assert progress.get_job(a)["client_label"] == "my-download"
+    assert set(progress.find_jobs("my-download")) == {a, b}
+
+
+def test_malformed_label_is_dropped():
+    job_id = progress.new_job_id("gen", "../../etc/passwd")
+    assert progress.get_job(job_id) is None
+    assert progress.find_jobs("../../etc/passwd") == []
@@ -0,0 +1,84 @@
+import pytest
+import requests
+
+from app import ranged_fetch
+
+SIZE = 12 * 1024 * 1024
+BODY = bytes(range(256)) * (SIZE // 256)
+
+
+class FakeResponse:
+    def __init__(self, status, data, headers=None):
+        self.status_code = status
+        self.data = data
+        self.headers = headers or {}
+
+    def iter_content(self, size):
+        for i in range(0, len(self.data), size):
+            yield self.data[i:i + size]
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def fake_server(short=False, fail_after=None):
+    calls = {"ranges": 0}
+
+    def get(url, headers=None, stream=False, timeout=None):
+        start, end = headers["Range"][len("bytes="):].split("-")
+        start, end = int(start), int(end)
+        if (start, end) == (0, 0):
+            return FakeResponse(206, BODY[:1], {"Content-Range": f"bytes 0-0/{SIZE}", "ETag": '"v1"'})
+        calls["ranges"] += 1
+        if fail_after is not None and calls["ranges"] > fail_after:
+            raise requests.ConnectionError("connection dropped")
+        data = BODY[start:end + 1]
+        return FakeResponse(206, data[: len(data) // 2] if short else data)
+
+    return get, calls
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch, tmp_path):
+    monkeypatch.setattr(ranged_fetch.time, "sleep", lambda s: None)
+    monkeypatch.setattr(ranged_fetch, "RESUME_DIR", tmp_path / "partial")
+
+
+def test_short_body_is_retried_then_fails(monkeypatch, tmp_path):
+    get, calls = fake_server(short=True)
+    monkeypatch.setattr(requests, "get", get)
+    with pytest.raises(ranged_fetch.RangedFetchError, match="short body"):
+        ranged_fetch.fetch("http://x/v.mp4", str(tmp_path / "v.mp4"), connections=2)
+    assert calls["ranges"] <= 2 * (ranged_fetch.PART_RETRIES + 1)
+
+
+def test_partial_download_resumes_under_resume_key(monkeypatch, tmp_path):
+    monkeypatch.setattr(ranged_fetch, "PART_RETRIES", 0)
+    first = tmp_path / "a" / "v.mp4"
+    first.parent.mkdir()
+    # the first part completes, the next request drops and the fetch gives up
+    get, _calls = fake_server(fail_after=1)
+    monkeypatch.setattr(requests, "get", get)
+    with pytest.raises(ranged_fetch.RangedFetchError):
+        ranged_fetch.fetch("http://x/v.mp4", str(first), connections=4, resume_key="page\n18")
+
+    get, _calls = fake_server()
+    monkeypatch.setattr(requests, "get", get)
+    second = tmp_path / "b" / "v.mp4"
+    second.parent.mkdir()
+    stats = ranged_fetch.fetch("http://x/v.mp4", str(second), connections=4, resume_key="page\n18")
+    assert stats["resumed_bytes"] > 0
+    assert second.read_bytes() == BODY
+    assert not list((tmp_path / "partial").iterdir())
+
+
+def test_request_headers_forward_cookies():
+    fmt = {"http_headers": {"User-Agent": "ua"}, "cookies": "SID=abc"}
+    assert ranged_fetch.request_headers(fmt) == {"User-Agent": "ua", "Cookie": "SID=abc"}
+    assert ranged_fetch.request_headers({}) == {}
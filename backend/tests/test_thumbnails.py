@@ -0,0 +1,36 @@
+import asyncio
+import io
+
+import pytest
+
+PIL = pytest.importorskip("PIL.Image")
+
+from app import thumbnails  # noqa: E402
+
+
+@pytest.fixture
+def jpeg(monkeypatch, tmp_path):
+    buf = io.BytesIO()
+    PIL.new("RGB", (640, 360), (200, 30, 30)).save(buf, "JPEG")
+    data = buf.getvalue()
+    monkeypatch.setattr(thumbnails, "THUMB_CACHE_DIR", tmp_path)
+    monkeypatch.setattr(thumbnails, "_fetch", lambda url, headers: (data, "image/jpeg"))
+    return data
+
+
+def _get(**kw):
+    return asyncio.run(thumbnails.proxy_image("http://x/a.jpg", headers={}, **kw))
+
+
+def test_negotiated_format_varies_on_accept(jpeg):
+    webp = _get(width=320, fmt=None, accept="image/webp,*/*")
+    assert webp.media_type == "image/webp" and webp.headers["vary"] == "Accept"
+    cached = _get(width=320, fmt=None, accept="image/webp,*/*")
+    assert cached.headers["vary"] == "Accept"
+    jpg = _get(width=320, fmt=None, accept="image/*")
+    assert jpg.media_type == "image/jpeg" and jpg.headers["vary"] == "Accept"
+
+
+def test_explicit_format_does_not_vary(jpeg):
+    assert "vary" not in _get(width=320, fmt="jpeg", accept="image/webp").headers
+    assert "vary" not in _get(width=None, fmt=None, accept="image/webp").headers
@@ -0,0 +1,53 @@
+import asyncio
+import hashlib
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import uploads
+
+CHUNK = uploads.UPLOAD_MIN_CHUNK
+
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    monkeypatch.setattr(uploads, "UPLOAD_DIR", tmp_path / "uploads")
+    monkeypatch.setattr(uploads, "_UPLOADS", {})
+    monkeypatch.setattr(uploads, "_CLAIMED", {})
+    app = FastAPI()
+    app.include_router(uploads.router)
+    return TestClient(app)
+
+
+def _create(client, size=CHUNK):
+    return client.post("/uploads", json={"size": size, "chunk_size": CHUNK})
+
+
+def test_budget_and_per_client_limit(client, monkeypatch):
+    monkeypatch.setattr(uploads, "UPLOAD_BUDGET_BYTES", 3 * CHUNK)
+    monkeypatch.setattr(uploads, "UPLOAD_MAX_SESSIONS_PER_CLIENT", 2)
+    assert _create(client, 2 * CHUNK).status_code == 200
+    assert _create(client, 2 * CHUNK).status_code == 507
+    assert _create(client).status_code == 200
+    assert _create(client).status_code == 429
+
+
+def test_restore_after_failed_processing(client, tmp_path):
+    data = bytes(range(256)) * (CHUNK // 256)
+    upload_id = _create(client).json()["upload_id"]
+    r = client.put(f"/uploads/{upload_id}/chunks/0", content=data,
+                   headers={"X-Chunk-SHA256": hashlib.sha256(data).hexdigest()})
+    assert r.status_code == 200
+    dest = tmp_path / "job_input.mp4"
+
+    async def claim_fail_restore():
+        digest, _name = await uploads.claim(upload_id, dest)
+        assert digest == hashlib.sha256(data).hexdigest() and dest.read_bytes() == data
+        await uploads.restore(upload_id)
+
+    asyncio.run(claim_fail_restore())
+    assert not dest.exists()
+    assert client.get(f"/uploads/{upload_id}").json()["complete"]
+    asyncio.run(uploads.claim(upload_id, dest))
+    assert dest.read_bytes() == data
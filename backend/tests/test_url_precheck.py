@@ -0,0 +1,90 @@
+import pytest
+from fastapi import HTTPException
+
+from app import extract_pool, main, url_precheck
+
+
+class GeoRestrictedError(Exception):
+    pass
+
+
+class UnsupportedError(Exception):
+    pass
+
+
+class DownloadError(Exception):
+    def __init__(self, msg, exc_info=None):
+        super().__init__(msg)
+        self.exc_info = exc_info
+
+
+def test_transient_and_format_errors_are_not_permanent():
+    for msg in ("ERROR: [youtube] abc: Requested format is not available",
+                "HTTP Error 503: Service Unavailable",
+                "HTTP Error 429: Too Many Requests",
+                "ERROR: [generic] Unable to parse geometry",
+                "Unable to download webpage: timed out"):
+        assert not url_precheck.is_permanent_failure(msg), msg
+
+
+def test_permanent_phrases_and_classes():
+    for msg in ("ERROR: [youtube] abc: Video unavailable", "HTTP Error 404: Not Found", "HTTP Error 410: Gone",
+                "ERROR: [youtube] abc: Private video. Sign in if you've been granted access"):
+        assert url_precheck.is_permanent_failure(msg), msg
+    wrapped = DownloadError("ERROR: blocked", (GeoRestrictedError, GeoRestrictedError("geo"), None))
+    assert url_precheck.is_permanent_failure(str(wrapped), wrapped)
+
+
+def test_generic_only_pages_are_admitted_by_default(monkeypatch):
+    monkeypatch.setattr(url_precheck, "ALLOW_GENERIC_EXTRACTOR", True)
+    url = "https://example.com/some/page"
+    for _ in range(2):  # the second call is not answered from the negative cache
+        assert url_precheck.precheck(url) is None
+        assert url_precheck._negative_lookup(url) is None
+
+
+def test_strict_mode_rejects_generic_only_pages(monkeypatch):
+    monkeypatch.setattr(url_precheck, "ALLOW_GENERIC_EXTRACTOR", False)  # FETCH_HELPER_ALLOW_GENERIC=0
+    url = "https://example.com/some/page"
+    try:
+        with pytest.raises(HTTPException) as e:
+            url_precheck.precheck(url)
+        assert e.value.status_code == 400 and e.value.detail == url_precheck.UNSUPPORTED_DETAIL
+        assert url_precheck._negative_lookup(url) is not None
+        assert url_precheck.precheck("https://example.com/media/clip.mp4") is None  # direct media still goes
+    finally:
+        url_precheck.forget(url)
+
+
+def test_worker_failures_keep_the_wrapped_error_classes(monkeypatch):
+    url = "https://example.com/geo-blocked"
+    wrapped = DownloadError("ERROR: blocked", (GeoRestrictedError, GeoRestrictedError("geo"), None))
+    failed = extract_pool.ExtractionFailed(*extract_pool._error_payload(wrapped))
+    assert failed.kind == "DownloadError" and "GeoRestrictedError" in failed.classes
+
+    def extract(opts, u, first_entry=False):
+        raise failed
+    monkeypatch.setattr(extract_pool, "extract_info", extract)
+    try:
+        with pytest.raises(extract_pool.ExtractionFailed):
+            main._extract_info_with_cookies({}, url)
+        with pytest.raises(HTTPException) as hit:
+            url_precheck.precheck(url)  # answered from the negative cache
+        assert hit.value.status_code == 400
+    finally:
+        url_precheck.forget(url)
+
+
+def test_unsupported_through_the_pool_is_a_400(monkeypatch):
+    url = "https://example.com/not-a-video"
+    wrapped = DownloadError("ERROR: no video here", (UnsupportedError, UnsupportedError("nope"), None))
+
+    def extract(opts, u, first_entry=False):
+        raise extract_pool.ExtractionFailed(*extract_pool._error_payload(wrapped))
+    monkeypatch.setattr(extract_pool, "extract_info", extract)
+    try:
+        with pytest.raises(HTTPException) as e:
+            main._extract_info_with_cookies({}, url)
+        assert e.value.status_code == 400 and e.value.detail == url_precheck.UNSUPPORTED_DETAIL
+    finally:
+        url_precheck.forget(url)
@@ -0,0 +1,20 @@
+import pytest
+
+from app.utils import parse_timestamp
+
+
+@pytest.mark.parametrize("value, expected", [
+    (None, None), ("", None), (90, 90.0), (90.5, 90.5), ("90.5", 90.5), ("1:30", 90.0),
+    ("01:02:03.250", 3723.25), ("90:00", 5400.0), (" 0:05 ", 5.0),
+])
+def test_valid(value, expected):
+    assert parse_timestamp(value) == expected
+
+
+@pytest.mark.parametrize("value", [
+    "nan", "inf", "-inf", "1e309", float("nan"), float("inf"), 1e309, True, False, -1, "-5", "1:-30",
+    "1:60", "1:61:00", "0:59:60", "1.5:00", "1:2:3:4", "abc", "1e3", "+5", "1:", ":30",
+])
+def test_invalid(value):
+    with pytest.raises(ValueError):
+        parse_timestamp(value)
@@ -0,0 +1,83 @@
+import random
+import struct
+
+import pytest
+
+from app import waveform
+
+SPP = waveform.PEAKS_BASE_SPP
+
+
+def _pcm(samples):
+    return struct.pack(f"<{len(samples)}h", *samples)
+
+
+def _chunked(data, sizes):
+    """Split `data` at uneven, odd offsets, as pipe reads may."""
+    out, i = [], 0
+    for n in sizes:
+        out.append(data[i:i + n])
+        i += n
+    return out + [data[i:]]
+
+
+def _samples(n, seed=7):
+    rnd = random.Random(seed)
+    return [rnd.randint(-32768, 32767) for _ in range(n)]
+
+
+def test_python_buckets_are_min_max_per_bucket():
+    samples = _samples(3 * SPP + 10)  # three whole buckets and a partial one
+    mins, maxs = waveform._buckets_python(_chunked(_pcm(samples), [1, 513, 777, 3]))
+    expected = [samples[i:i + SPP] for i in range(0, len(samples), SPP)]
+    assert mins == [min(b) >> 8 for b in expected]
+    assert maxs == [max(b) >> 8 for b in expected]
+    assert waveform._buckets_python([]) == ([], [])
+
+
+def test_numpy_and_python_buckets_agree():
+    np = pytest.importorskip("numpy")
+    data = _pcm(_samples(20 * SPP + 37))
+    sizes = [511, 1, 2049, 7, 4096]
+    lo, hi = waveform._buckets_numpy(np, _chunked(data, sizes))
+    assert (list(lo), list(hi)) == waveform._buckets_python(_chunked(data, sizes))
+    assert waveform._buckets_numpy(np, []) == ([], [])
+
+
+def test_halve_merges_pairs_and_keeps_an_odd_tail():
+    mins, maxs = [-5, -1, -7, 0, -3], [4, 9, 1, 2, 8]
+    assert waveform._halve(None, mins, maxs) == ([-5, -7, -3], [9, 2, 8])
+    np = pytest.importorskip("numpy")
+    lo, hi = waveform._halve(np, np.array(mins), np.array(maxs))
+    assert (list(lo), list(hi)) == ([-5, -7, -3], [9, 2, 8])
+
+
+def _level_sizes(path):
+    data = open(waveform.sidecar(path), "rb").read()
+    sizes, off = [], 0
+    while off < len(data):
+        version, flags, rate, spp, n = waveform._HEADER.unpack_from(data, off)
+        sizes.append((spp, n))
+        off += waveform._HEADER.size + 2 * n
+    return sizes
+
+
+def test_read_level_picks_the_coarsest_wide_enough_level(monkeypatch, tmp_path):
+    audio = tmp_path / "a.mp3"
+    audio.write_bytes(b"")
+    buckets = 4 * waveform.PEAKS_MIN_BUCKETS + 1
+    data = _pcm(_samples(buckets * SPP))
+    monkeypatch.setattr(waveform, "_NUMPY", [None])  # either bucket path yields the same levels
+    monkeypatch.setattr(waveform, "_pcm_chunks", lambda path, job_id: iter(_chunked(data, [4099, 65536])))
+    waveform.compute(str(audio))
+    assert waveform.cached(str(audio))
+    assert _level_sizes(str(audio)) == [(SPP, buckets), (2 * SPP, 513), (4 * SPP, 257)]
+
+    def level(width):
+        return waveform._HEADER.unpack_from(waveform.read_level(str(audio), width))[3:]
+
+    assert level(100) == (4 * SPP, 257)
+    assert level(257) == (4 * SPP, 257)
+    assert level(258) == (2 * SPP, 513)
+    assert level(1000) == (SPP, buckets)
+    assert level(10 ** 6) == (SPP, buckets)  # wider than any level: the finest one